@@ -2,30 +2,59 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import atexit
+import functools
+import hashlib
 import json
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify
-from flask_moment import Moment
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+import click
+from flask import Blueprint, Flask, current_app, g, has_app_context, render_template, request, Response, redirect, url_for, abort, jsonify, has_request_context
+from flask import session as browser_session, _app_ctx_stack
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.exc import DataError, IntegrityError
+from werkzeug.exceptions import BadRequest
+from werkzeug.local import LocalProxy
+from itsdangerous import BadSignature, URLSafeSerializer
+try:
+  import orjson
+except ImportError:
+  orjson = None
 import logging
 from logging import Formatter, FileHandler
-from flask_wtf import Form
-from forms import *
-from flask_migrate import Migrate
+from cache import make_cache, LRUCache
+from suggest import Suggester
+from importer import Importer, read_records
+from metrics import Metrics
+from slowlog import SlowQueryLog
+from assets import Assets
+from tasks import TaskExecutor
+from thumbnails import Thumbnails
 import sys
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
-
-migrate = Migrate(app, db)
+# The app itself is built by create_app(), at the end of this file. What
+# is defined on the way, routes and hooks included, needs no app to exist.
+# A session per app context, not per thread: a task run inline, from the
+# after_commit hook of the caller's session, pushes a context of its own,
+# and must neither use that session mid-commit nor remove it on teardown.
+db = SQLAlchemy(session_options={'scopefunc': lambda: id(_app_ctx_stack.top)})
 session = db.session
 
+# routes, hooks and commands of the app as a whole; venues, artists and
+# shows have blueprints of their own, in views/
+main = Blueprint('main', __name__, cli_group=None)
+
+def app_service(name):
+  # the current app's service `name`, as made by create_app from its config
+  return LocalProxy(lambda: current_app.extensions['fyyur'][name])
 
 # TODO: connect to a local postgresql database
 
@@ -33,45 +62,79 @@ session = db.session
 # Models.
 #----------------------------------------------------------------------------#
 
+class utc_now(FunctionElement):
+    # the current UTC time as a column default, in each database's words
+    type = db.DateTime()
+
+@compiles(utc_now)
+def compile_utc_now(element, compiler, **kw):
+    return "timezone('utc', now())"
+
+@compiles(utc_now, 'sqlite')
+def compile_sqlite_utc_now(element, compiler, **kw):
+    return 'CURRENT_TIMESTAMP'
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False, unique=True)
     address = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120), nullable=False)
-    genres = db.Column(db.ARRAY(db.String()), nullable=False)
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(150))
     image_link = db.Column(db.String(500))
     website = db.Column(db.String(120))
     facebook_link = db.Column(db.String(120))
     location_id = db.Column(db.Integer, db.ForeignKey('Locations.id'), nullable=False)
-    artists = db.relationship('Shows', back_populates='venue', cascade='all, delete-orphan')
+    # shows from the upcoming_shows watermark on, see "Show counters"
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=utc_now())
+    artists = db.relationship('Shows', back_populates='venue', cascade='all, delete-orphan', passive_deletes=True)
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False, unique=True)
     phone = db.Column(db.String(120), nullable=False)
-    genres = db.Column(db.ARRAY(db.String()), nullable=False)
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(150))
     image_link = db.Column(db.String(500))
     website = db.Column(db.String(120))
     facebook_link = db.Column(db.String(120))
     location_id = db.Column(db.Integer, db.ForeignKey('Locations.id'), nullable=False)
-    shows = db.relationship('Shows', back_populates='artist', cascade='all, delete-orphan')
+    # shows from the upcoming_shows watermark on, see "Show counters"
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=utc_now())
+    shows = db.relationship('Shows', back_populates='artist', cascade='all, delete-orphan', passive_deletes=True)
  
 class Shows(db.Model):
     __tablename__ = "Shows"
+    __table_args__ = (
+        db.Index('ix_Shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Shows_artist_id_start_time', 'artist_id', 'start_time'),
+        # the shows started since the upcoming_shows watermark, see "Show counters"
+        db.Index('ix_Shows_start_time_artist_id_venue_id', 'start_time', 'artist_id', 'venue_id'),
+    )
 
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), primary_key=True)
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), primary_key=True)
+    # deleting a venue or artist deletes its shows in the database, rather
+    # than the ORM loading and deleting them one by one
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True)
     start_time = db.Column(db.DateTime, nullable=False, primary_key=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=utc_now())
     artist = db.relationship("Artist",  back_populates='shows')
     venue = db.relationship("Venue",   back_populates='artists')
 
@@ -81,589 +144,1653 @@ class Locations(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     city = db.Column(db.String(120), nullable=False, unique=True)
     state = db.Column(db.String(120), nullable=False)
-    artist =   db.relationship('Artist', backref="location", lazy=False, cascade='all, delete-orphan')
-    venue =   db.relationship('Venue', backref="location", lazy=False, cascade='all, delete-orphan')
+    artist =   db.relationship('Artist', backref="location", lazy='raise', cascade='all, delete-orphan')
+    venue =   db.relationship('Venue', backref="location", lazy='raise', cascade='all, delete-orphan')
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
+class Genre(db.Model):
+    __tablename__ = "Genre"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+# genres of each venue and artist; the second index answers ?genre= filters
+# and facet counts
+VenueGenres = db.Table('VenueGenres',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_VenueGenres_genre_id_venue_id', 'genre_id', 'venue_id'),
+)
+
+ArtistGenres = db.Table('ArtistGenres',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_ArtistGenres_genre_id_artist_id', 'genre_id', 'artist_id'),
+)
+
+class Watermark(db.Model):
+    __tablename__ = "Watermarks"
+
+    # how far a periodic job has got, by job name
+    name = db.Column(db.String(60), primary_key=True)
+    value = db.Column(db.DateTime, nullable=False)
+
+UPCOMING_SHOWS = 'upcoming_shows'
+# when a venue, artist or show was last deleted, in UTC like updated_at: a
+# page that lost a row has no row left to say it changed
+DELETED = 'deleted'
+
+@db.event.listens_for(Watermark.__table__, 'after_create')
+def start_watermarks(target, connection, **kw):
+  # a new database has no shows, so every count is right from now on
+  connection.execute(target.insert().values(name=UPCOMING_SHOWS, value=datetime.now()))
+  connection.execute(target.insert().values(name=DELETED, value=datetime.utcnow()))
+
+@db.event.listens_for(Engine, 'connect')
+def enforce_sqlite_foreign_keys(dbapi_connection, connection_record):
+  # SQLite ignores foreign keys, and so ON DELETE CASCADE, unless asked;
+  # sqlite3 is only imported once something connects with it
+  sqlite3 = sys.modules.get('sqlite3')
+  if sqlite3 is not None and isinstance(dbapi_connection, sqlite3.Connection):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+def pg_insert(table):
+  # INSERT .. ON CONFLICT; only Postgres runs it, so only it loads the dialect
+  from sqlalchemy.dialects.postgresql import insert
+  return insert(table)
+
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
+# babel and dateutil are imported by the first caller rather than at
+# startup; a worker may serve many requests before it needs either
+
+def parse_datetime(value):
+  import dateutil.parser
+  return dateutil.parser.parse(value)
+
+@functools.lru_cache(maxsize=None)
+def datetime_locale():
+  import babel.dates
+  return babel.Locale.parse(babel.dates.LC_TIME)
+
+@functools.lru_cache(maxsize=64)
+def datetime_pattern(format):
+  import babel.dates
   if format == 'full':
       format="EEEE MMMM, d, y 'at' h:mma"
   elif format == 'medium':
       format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+  return babel.dates.parse_pattern(format)
+
+def apply_datetime_format(value, format):
+  # 'full' and 'medium' are the app's own patterns; 'short' and 'long' are
+  # the locale's, which babel puts together from a date and a time format
+  if format in ('short', 'long'):
+    import babel.dates
+    return babel.dates.format_datetime(value, format, locale=datetime_locale())
+  return datetime_pattern(format).apply(value, datetime_locale())
 
-app.jinja_env.filters['datetime'] = format_datetime
+@main.app_template_filter('datetime')
+def format_datetime(value, format='medium'):
+  # Views pass datetimes; strings are still parsed. A page lists the same
+  # start time many times over, so each (value, format) is formatted once
+  # per request.
+  if isinstance(value, str):
+    value = parse_datetime(value)
+  if not has_app_context():
+    return apply_datetime_format(value, format)
+  formatted = g.setdefault('formatted_datetimes', {})
+  key = (value, format)
+  text = formatted.get(key)
+  if text is None:
+    text = formatted[key] = apply_datetime_format(value, format)
+  return text
 
 #----------------------------------------------------------------------------#
-# Controllers.
+# Assets.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
-def index():
-  return render_template('pages/home.html')
+assets = app_service('assets')
 
+@main.app_template_global()
+def asset_url(name):
+  return url_for('static', filename=assets.url(name))
 
-#  Venues
-#  ----------------------------------------------------------------
+@main.cli.command('assets')
+def build_assets():
+  '''Build the fingerprinted static bundles into static/dist.'''
+  for name, filename in sorted(assets.build().items()):
+    click.echo(f'{name} -> {filename}')
 
-@app.route('/venues')
-def venues():
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  error=False
+#----------------------------------------------------------------------------#
+# Tasks.
+#----------------------------------------------------------------------------#
 
-  try:
-    data = []
-    locations = Locations.query.order_by('id').all()
+# Work a write need not finish before the response, such as cache
+# invalidation and suggest index updates. Handlers queue it with
+# after_commit(), so it only runs once the write has committed.
+tasks = app_service('tasks')
 
-    for location in locations:
-      venues = {}
-      venues["city"] = location.city
-      venues["state"] = location.state
-      venues["venues"] = []  
+# functions run as tasks, by name; create_app registers them with each
+# app's executor
+TASKS = {}
 
-      location_venues =  Venue.query.filter_by(location_id=location.id).order_by('id').all()
+def task(fn):
+  TASKS[fn.__name__] = fn
+  return fn
 
-      for venue in location_venues:
-        location_venue = {}
-        location_venue['id'] = venue.id
-        location_venue['name'] = venue.name
-        location_venue["num_upcoming_shows"] = 0
+def after_commit(name, *args, **kwargs):
+  # runs the task named once the current transaction commits
+  session.info.setdefault('tasks', []).append((name, args, kwargs))
 
-        venues['venues'].append(location_venue)
+@db.event.listens_for(session, 'after_commit')
+def submit_tasks(session):
+  for name, args, kwargs in session.info.pop('tasks', []):
+    tasks.submit(name, *args, **kwargs)
 
-      if bool(location_venues): data.append(venues)
-  except:
-    error=True
-  finally:
-    if error:
-      abort(500)
-  return render_template('pages/venues.html', areas=data)
+@db.event.listens_for(session, 'after_transaction_end')
+def forget_tasks(session, transaction):
+  # a rollback, or a close() without commit
+  if transaction.parent is None:
+    session.info.pop('tasks', None)
 
-@app.route('/venues/search', methods=['POST'])
-def search_venues():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for Hop should return "The Musical Hop".
-  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
+#----------------------------------------------------------------------------#
+# Thumbnails.
+#----------------------------------------------------------------------------#
 
-  search_term = request.form['search_term']
-  results = session.query(Venue.id, Venue.name).filter(Venue.name.ilike(f"%{search_term}%")).all()
+thumbnails = app_service('thumbnails')
+# image links travel signed, so /images only fetches links the app handed out
+thumbnail_signer = app_service('thumbnail_signer')
+
+# a page links a few dozen; signing and url_for cost more than rendering them
+@functools.lru_cache(maxsize=8192)
+def app_thumbnail_url(app, image_link, width):
+  return url_for('main.thumbnail', width=width, token=thumbnail_signer.dumps(image_link))
+
+@main.app_template_global()
+def thumbnail_url(image_link, width):
+  return app_thumbnail_url(current_app._get_current_object(), image_link, width)
+
+@task
+def make_thumbnails(image_link):
+  thumbnails.make(image_link)
+
+@main.cli.command('thumbnails')
+def make_missing_thumbnails():
+  '''Make the thumbnails missing for any venue or artist image.'''
+  links = {link for model in (Venue, Artist)
+           for link, in session.query(model.image_link).filter(model.image_link.isnot(None))}
+  for link in sorted(links):
+    if thumbnails.find(link, thumbnails.widths[0]) is None:
+      try:
+        thumbnails.make(link)
+      except Exception as e:
+        click.echo(f'{link}: {e}', err=True)
 
-  response = {
-    "count": len(results),
-    "data": [{
-      "id": id,
-      "name": name 
-      }
-    for id, name in results]
-  }
-  
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+#----------------------------------------------------------------------------#
+# Pagination.
+#----------------------------------------------------------------------------#
 
-@app.route('/venues/<int:venue_id>')
-def show_venue(venue_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  error=False
-  results=False
+CURSOR_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+# ids are Integer columns; a larger one could not be compared with them
+CURSOR_MAX_ID = 2 ** 31 - 1
 
-  try:
-    results = session.query(Venue, Locations).filter(Venue.id == venue_id).\
-                      join(Locations, Venue.location_id == Locations.id).first()
-
-    venue, location = results
-    
-    venue_details = {
-      "id": venue.id,
-      "name": venue.name,
-      "genres": venue.genres,
-      "address": venue.address,
-      "city": location.city,
-      "state": location.state,
-      "phone": venue.phone,
-      "website": venue.website,
-      "facebook_link": venue.facebook_link,
-      "seeking_talent": venue.seeking_talent,
-      "seeking_description": venue.seeking_description,
-      "image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60"
-      }
+def encode_cursor(start_time, *ids):
+  return '_'.join([start_time.strftime(CURSOR_TIME_FORMAT)] + [str(id) for id in ids])
 
-    past_shows = []
-    upcoming_shows= []
-
-    shows = session.query(Shows.start_time, Artist).filter_by(venue_id = venue.id)\
-            .join(Artist, Artist.id == Shows.artist_id).all()
-    
-    for start_time, artist in shows:
-      show_details = {
-        "artist_id": artist.id,
-        "artist_name": artist.name,
-        "artist_image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-        "start_time": start_time.strftime("%Y-%m-%d %H:%M:%S")
+def decode_cursor(cursor, ids=1):
+  # cursors are '<start_time>_<id>[_<id>...]', as written by encode_cursor
+  # for a key of `ids` ids; anything else is a 400
+  start_time, *parts = cursor.split('_')
+  if len(parts) != ids or not all(part.isascii() and part.isdigit() and int(part) <= CURSOR_MAX_ID
+                                  for part in parts):
+    abort(400)
+  try:
+    start_time = datetime.strptime(start_time, CURSOR_TIME_FORMAT)
+  except ValueError:
+    abort(400)
+  return (start_time,) + tuple(int(part) for part in parts)
+
+class KeysetPage(object):
+  '''Streams one page of a keyset-ordered query.
+
+  Asks for one row more than the page size; when that row shows up,
+  next_cursor is set from the last row served so templates can link to
+  the following page after they have iterated the page.
+  '''
+
+  def __init__(self, query, size, key):
+    self.query = query.limit(size + 1).execution_options(stream_results=True).yield_per(size)
+    self.size = size
+    self.key = key
+    self.next_cursor = None
+
+  def __iter__(self):
+    for n, row in enumerate(self.query):
+      if n == self.size:
+        self.next_cursor = encode_cursor(*self.key(last))
+        break
+      last = row
+      yield row
+
+def search_by_name(model, search_term, page):
+  # Case-insensitive substring match, best matches first. On Postgres the
+  # ILIKE is answered from the pg_trgm GIN index on name and matches are
+  # ranked by trigram similarity to the search term; elsewhere shorter
+  # names rank first.
+  size = current_app.config['SEARCH_PAGE_SIZE']
+  pattern = '%' + search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+  matches = model.name.ilike(pattern, escape='\\')
+
+  if db.engine.dialect.name == 'postgresql':
+    rank = db.func.similarity(model.name, search_term).desc()
+  else:
+    rank = db.func.length(model.name)
+
+  results = session.query(model.id, model.name, db.func.count().over()).\
+                    filter(matches).\
+                    order_by(rank, model.name, model.id).\
+                    limit(size).offset((page - 1) * size).all()
+
+  if results:
+    count = results[0][2]
+  else:
+    count = session.query(db.func.count(model.id)).filter(matches).scalar()
+
+  return {
+    "count": count,
+    "page": page,
+    "prev_page": page - 1 if page > 1 else None,
+    "next_page": page + 1 if page * size < count else None,
+    "data": [{
+      "id": id,
+      "name": name
       }
+    for id, name, _ in results]
+  }
 
-      if start_time < datetime.now():
-        past_shows.append(show_details)
-      else:
-        upcoming_shows.append(show_details)
+def show_section(query, id_column, now, upcoming, after=None):
+  # upcoming shows run oldest first from now, past shows newest first
+  key = db.tuple_(Shows.start_time, id_column)
+  if upcoming:
+    query = query.filter(Shows.start_time >= now).order_by(Shows.start_time, id_column)
+    if after:
+      query = query.filter(key > decode_cursor(after))
+  else:
+    query = query.filter(Shows.start_time < now).order_by(Shows.start_time.desc(), id_column.desc())
+    if after:
+      query = query.filter(key < decode_cursor(after))
+  return KeysetPage(query, current_app.config['SHOWS_PER_SECTION'], key=lambda row: row[:2])
+
+def show_stats(criterion, now):
+  # (past, upcoming, last updated, last started, last deletion) in one pass
+  # over the (venue_id|artist_id, start_time) index
+  return session.query(db.func.count(db.case([(Shows.start_time < now, 1)])),
+                       db.func.count(db.case([(Shows.start_time >= now, 1)])),
+                       db.func.max(Shows.updated_at),
+                       db.func.max(db.case([(Shows.start_time < now, Shows.start_time)])),
+                       last_deleted()).\
+                 filter(criterion).one()
+
+def venue_show_section(venue_id, now, upcoming, after=None):
+  query = session.query(Shows.start_time, Artist.id, Artist.name, Artist.image_link, Artist.updated_at).\
+          join(Artist, Artist.id == Shows.artist_id).\
+          filter(Shows.venue_id == venue_id)
+  page = show_section(query, Shows.artist_id, now, upcoming, after)
+  rows = list(page)
+
+  shows = [{
+      "artist_id": artist_id,
+      "artist_name": artist_name,
+      "artist_image_link": artist_image_link,
+      "start_time": start_time
+    }
+    for start_time, artist_id, artist_name, artist_image_link, _ in rows]
+  return shows, page.next_cursor, latest(updated_at for *_, updated_at in rows)
+
+def artist_show_section(artist_id, now, upcoming, after=None):
+  query = session.query(Shows.start_time, Venue.id, Venue.name, Venue.image_link, Venue.updated_at).\
+          join(Venue, Venue.id == Shows.venue_id).\
+          filter(Shows.artist_id == artist_id)
+  page = show_section(query, Shows.venue_id, now, upcoming, after)
+  rows = list(page)
+
+  shows = [{
+      "venue_id": venue_id,
+      "venue_name": venue_name,
+      "venue_image_link": venue_image_link,
+      "start_time": start_time
+    }
+    for start_time, venue_id, venue_name, venue_image_link, _ in rows]
+  return shows, page.next_cursor, latest(updated_at for *_, updated_at in rows)
 
-    venue_details["past_shows"] = past_shows
-    venue_details["upcoming_shows"] = upcoming_shows
-    venue_details["past_shows_count"] = len(past_shows)
-    venue_details["upcoming_shows_count"] = len(upcoming_shows)
-  except:
-    error=True
-  finally:
-    if error:
-      if results is None: abort(404)
-      else: abort(500)
-    return render_template('pages/show_venue.html', venue=venue_details)
+def stream_template(template_name, **context):
+  current_app.update_template_context(context)
+  stream = current_app.jinja_env.get_template(template_name).stream(context)
+  stream.enable_buffering(current_app.config['TEMPLATE_STREAM_BUFFER'])
+  return stream
 
-#  Create Venue
-#  ----------------------------------------------------------------
+#----------------------------------------------------------------------------#
+# Conditional GET.
+#----------------------------------------------------------------------------#
 
-@app.route('/venues/create', methods=['GET'])
-def create_venue_form():
-  form = VenueForm()
-  return render_template('forms/new_venue.html', form=form)
+def latest(values):
+  return max((value for value in values if value is not None), default=None)
+
+def local_to_utc(value):
+  # start times are naive local time; updated_at columns are naive UTC
+  return datetime.utcfromtimestamp(value.timestamp())
+
+def content_tag(*parts):
+  return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:20]
+
+def with_validators(response, etag, last_modified):
+  # no-cache: browsers may keep the page but must check it is current
+  response.set_etag(etag, weak=True)
+  response.last_modified = last_modified
+  response.cache_control.no_cache = True
+  return response
+
+def last_deleted():
+  # the DELETED watermark, as a column of another query
+  return session.query(Watermark.value).filter(Watermark.name == DELETED).as_scalar()
+
+def listing_validators(model, now, genre):
+  # (ETag, Last-Modified) of the venues or artists page, from one aggregate
+  # rather than its rows, so a 304 costs neither. Edits, genre changes and
+  # new or removed upcoming shows all move updated_at; what is left is
+  # deletions, a show starting, and a new genre for the facets.
+  updated_at, listed, genres, last_started, deleted_at = session.query(
+    db.func.max(model.updated_at), db.func.count(model.id),
+    session.query(db.func.count(Genre.id)).as_scalar(),
+    session.query(db.func.max(Shows.start_time)).filter(Shows.start_time < now).as_scalar(),
+    last_deleted()).one()
+  etag = content_tag(updated_at, listed, genres, last_started, deleted_at, genre)
+  return etag, latest([updated_at, deleted_at, last_started and local_to_utc(last_started)])
+
+# compiled forms of the shows_page_aggregate() statements, per dialect
+shows_page_compiled = {}
+
+@functools.lru_cache(maxsize=None)
+def shows_page_aggregate(after):
+  # One row summing up a page of /shows: the size + 1 rows it streams, in
+  # the same order, after a (start_time, artist_id, venue_id) cursor when
+  # `after` is set. Core, built once and compiled once; compiling an ORM
+  # query like it costs more than running it.
+  key = (Shows.start_time, Shows.artist_id, Shows.venue_id)
+  page = db.select([Shows.start_time, Shows.artist_id, Shows.venue_id,
+                    Shows.updated_at.label('show_updated_at'),
+                    Artist.updated_at.label('artist_updated_at'),
+                    Venue.updated_at.label('venue_updated_at')]).\
+           select_from(Shows.__table__.join(Artist.__table__, Artist.id == Shows.artist_id).
+                                       join(Venue.__table__, Venue.id == Shows.venue_id)).\
+           order_by(*key).limit(db.bindparam('rows'))
+  if after:
+    page = page.where(db.tuple_(*key) > db.tuple_(db.bindparam('start_time'), db.bindparam('artist_id'),
+                                                 db.bindparam('venue_id')))
+  page = page.alias()
+  return db.select([db.func.count(), db.func.min(page.c.start_time), db.func.max(page.c.start_time),
+                    db.func.sum(page.c.artist_id), db.func.sum(page.c.venue_id),
+                    db.func.max(page.c.show_updated_at), db.func.max(page.c.artist_updated_at),
+                    db.func.max(page.c.venue_updated_at),
+                    db.select([Watermark.value]).where(Watermark.name == DELETED).as_scalar()])
+
+def shows_page_validators(size, after):
+  # (ETag, Last-Modified) of a page of /shows from shows_page_aggregate, so
+  # nothing is fetched before a 304 and the page itself still streams. A
+  # row that changes in place moves an updated_at; rows that join or leave
+  # the page move the count, the start times or the id sums; deleted rows
+  # move the watermark. `after` is a decoded cursor or None.
+  params = dict(rows=size + 1)
+  if after:
+    params.update(zip(('start_time', 'artist_id', 'venue_id'), after))
+  connection = session.connection().execution_options(compiled_cache=shows_page_compiled)
+  summary = connection.execute(shows_page_aggregate(bool(after)), params).first()
+  # the size is in the page's link to the next one
+  return content_tag(*summary, size), latest(summary[5:])
+
+def not_modified(etag, last_modified):
+  # A 304 for the page the client already has, or None when it has to be
+  # rendered. A pending flash message is part of the page, so it always
+  # renders.
+  if '_flashes' in browser_session:
+    return None
+  response = with_validators(Response(), etag, last_modified).make_conditional(request)
+  if response.status_code == 304:
+    return response
+  return None
 
-@app.route('/venues/create', methods=['POST'])
-def create_venue_submission():
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
 
-  error=False
+# Venue and Artist upcoming_shows_count hold the shows that start at or
+# after the upcoming_shows watermark. Writes adjust them in the transaction
+# that adds or deletes the shows. `flask counters roll`, run from cron,
+# moves the watermark up to now and takes the shows that have started off
+# the counts. Reads subtract the shows started since the last roll, so a
+# count is right however long ago that was.
+
+def watermark_query():
+  return session.query(Watermark.value).filter(Watermark.name == UPCOMING_SHOWS)
+
+def shared_watermark():
+  # Read FOR SHARE by writers: a roll or rebuild takes it FOR UPDATE, so it
+  # waits until they commit and then sees their shows, and they wait for it.
+  return watermark_query().with_for_update(read=True).scalar()
+
+def add_counts(model, deltas):
+  # {id: change}, one UPDATE per distinct change
+  ids = {}
+  for id, delta in deltas.items():
+    if delta:
+      ids.setdefault(delta, []).append(id)
+  for delta, delta_ids in ids.items():
+    session.query(model).filter(model.id.in_(delta_ids)).\
+            update({model.upcoming_shows_count: model.upcoming_shows_count + delta}, synchronize_session=False)
+
+def count_upcoming(shows, sign=1):
+  # adds (sign 1) or takes off (-1) (venue_id, artist_id, start_time) shows
+  # inserted or deleted in this transaction
+  if not shows:
+    return
+  watermark = shared_watermark()
+  venues, artists = Counter(), Counter()
+  for venue_id, artist_id, start_time in shows:
+    if start_time >= watermark:
+      venues[venue_id] += sign
+      artists[artist_id] += sign
+  add_counts(Venue, venues)
+  add_counts(Artist, artists)
+
+def delete_shows(criterion):
+  # Deletes the shows matching criterion and returns (venue_id, artist_id,
+  # shows, upcoming shows) for each pair that had any. On Postgres the
+  # DELETE .. RETURNING runs inside the aggregate that counts what it
+  # removed, so a show added meanwhile is either deleted and counted or
+  # neither.
+  watermark = shared_watermark()
+  table = Shows.__table__
+  if db.engine.dialect.name == 'postgresql':
+    columns = table.delete().where(criterion).returning(table.c.venue_id, table.c.artist_id, table.c.start_time).\
+                    cte('deleted').c
+  else:
+    columns = table.c
+  query = session.query(columns.venue_id, columns.artist_id, db.func.count(),
+                        db.func.count(db.case([(columns.start_time >= watermark, 1)]))).\
+                  group_by(columns.venue_id, columns.artist_id)
+  if db.engine.dialect.name == 'postgresql':
+    return query.all()
+
+  # SQLite serialises writers, so the shows counted are the ones deleted
+  rows = query.filter(criterion).all()
+  session.execute(table.delete().where(criterion))
+  return rows
+
+def started_shows(model, now):
+  # The shows of each venue or artist that started since the last roll, as
+  # (id, shows): a range of the start_time index rather than every upcoming
+  # show. Outer join it and take upcoming_shows_count(started) for counts
+  # that are right to the moment.
+  shows_of = Shows.venue_id if model is Venue else Shows.artist_id
+  return session.query(shows_of.label('id'), db.func.count().label('shows')).\
+                 filter(Shows.start_time >= watermark_query().as_scalar(), Shows.start_time < now).\
+                 group_by(shows_of).subquery()
+
+def upcoming_shows_count(model, started):
+  return model.upcoming_shows_count - db.func.coalesce(started.c.shows, 0)
+
+def roll_upcoming(now):
+  # Moves the watermark up to now and takes the shows that started in
+  # between off their counts, one UPDATE per table. Returns the number of
+  # shows rolled.
+  watermark = session.query(Watermark).filter(Watermark.name == UPCOMING_SHOWS).with_for_update().one()
+  if now <= watermark.value:
+    return 0
+  started = db.and_(Shows.start_time >= watermark.value, Shows.start_time < now)
+  for model, shows_of in ((Venue, Shows.venue_id), (Artist, Shows.artist_id)):
+    rolled = session.query(db.func.count()).filter(shows_of == model.id, started).correlate(model).as_scalar()
+    session.query(model).filter(model.id.in_(session.query(shows_of).filter(started))).\
+            update({model.upcoming_shows_count: model.upcoming_shows_count - rolled}, synchronize_session=False)
+  rolled = session.query(db.func.count()).filter(started).scalar()
+  watermark.value = now
+  return rolled
+
+def upcoming_counted(model):
+  # the upcoming shows of each venue or artist, counted from Shows
+  shows_of = Shows.venue_id if model is Venue else Shows.artist_id
+  return session.query(db.func.count()).filter(shows_of == model.id,
+                                               Shows.start_time >= watermark_query().as_scalar()).\
+                 correlate(model).as_scalar()
+
+def upcoming_drift(model):
+  # (id, counter, count from Shows) of every venue or artist that is off,
+  # from one grouped pass over the upcoming shows
+  shows_of = Shows.venue_id if model is Venue else Shows.artist_id
+  counted = session.query(shows_of.label('id'), db.func.count().label('shows')).\
+                    filter(Shows.start_time >= watermark_query().as_scalar()).group_by(shows_of).subquery()
+  actual = db.func.coalesce(counted.c.shows, 0)
+  return session.query(model.id, model.upcoming_shows_count, actual).\
+                 outerjoin(counted, counted.c.id == model.id).\
+                 filter(model.upcoming_shows_count != actual).order_by(model.id).all()
+
+def rebuild_upcoming(model):
+  # Sets every counter that is off from Shows in one UPDATE, with the
+  # watermark locked so no write or roll runs meanwhile. Returns the number
+  # of rows fixed.
+  session.query(Watermark).filter(Watermark.name == UPCOMING_SHOWS).with_for_update().one()
+  counted = upcoming_counted(model)
+  return session.query(model).filter(model.upcoming_shows_count != counted).\
+                 update({model.upcoming_shows_count: counted}, synchronize_session=False)
+
+@main.cli.group()
+def counters():
+  """Maintain the venue and artist upcoming show counters."""
+
+@counters.command('roll')
+def roll_counters():
+  """Take the shows that have started off the counts; run it from cron."""
   try:
-    venue = Venue(name=request.form['name'], 
-                address=request.form['address'],
-                phone=request.form['phone'],
-                genres=request.form.getlist('genres'),
-                website=request.form['website'],
-                facebook_link=request.form['facebook_link'],
-                seeking_talent=bool(request.form.get('seeking_talent')),
-                seeking_description=request.form.get('seeking_description')
-                )
-
-    location = Locations(city=request.form['city'], state=request.form['state'])
-
-    city_exists = Locations.query.filter_by(city=location.city).scalar() is not None
-    if city_exists:
-      location = Locations.query.filter_by(city=location.city).first()
-
-    venue.location = location
-
-    session.add(venue)
+    rolled = roll_upcoming(datetime.now())
     session.commit()
   except:
-    error=True
     session.rollback()
+    raise
   finally:
     session.close()
-    if error:
-      flash('An error occurred. Venue ' + venue.name + ' could not be listed.')
-    else:
-      flash('Venue ' + request.form['name'] + ' was successfully listed!')
+  click.echo(f'{rolled} shows rolled from upcoming to past')
 
-  # on successful db insert, flash success
-  # flash('Venue ' + request.form['name'] + ' was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Venue ' + data.name + ' could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
-  return render_template('pages/home.html')
+@counters.command('check')
+@click.option('--fix', is_flag=True, help='Rebuild the counters that are off from Shows.')
+def check_counters(fix):
+  """Compare the counters with counts from Shows.
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
-def delete_venue(venue_id):
-  # TODO: Complete this endpoint for taking a venue_id, and using
-  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
+  Lists every venue and artist whose counter is off and exits with status
+  1 if any is, unless --fix rebuilds them.
+  """
+  drifted = 0
   try:
-    venue = session.query(Venue).filter(Venue.id == venue_id).first()
-    session.delete(venue)
+    for model in (Venue, Artist):
+      for id, stored, actual in upcoming_drift(model):
+        click.echo(f'{model.__name__} {id}: {stored} counted, {actual} in Shows')
+        drifted += 1
+      if fix:
+        rebuild_upcoming(model)
     session.commit()
   except:
     session.rollback()
+    raise
   finally:
     session.close()
-    flash('Venue deleted!')
-    return jsonify({'success': True})
 
-  # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
-  # clicking that button delete it from the db then redirect the user to the homepage
+  click.echo(f"{drifted} counters {'rebuilt' if fix else 'off'}")
+  if drifted and not fix:
+    sys.exit(1)
 
-#  Artists
-#  ----------------------------------------------------------------
-@app.route('/artists')
-def artists():
-  # TODO: replace with real data returned from querying the database
-  error=False
-  try:
-    artists = Artist.query.order_by('id').all()
-    data = [{"id":artist.id, "name":artist.name} for artist in artists]
-  except:
-    error=True
-  finally:
-    if error:
-      abort(500)
-    return render_template('pages/artists.html', artists=data)
+#----------------------------------------------------------------------------#
+# Entity pages.
+#----------------------------------------------------------------------------#
 
-@app.route('/artists/search', methods=['POST'])
-def search_artists():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
-  # search for "band" should return "The Wild Sax Band".
+# venue and artist page view models, keyed by ('venue'|'artist', id)
+entity_cache = app_service('entity_cache')
+
+def build_venue_view(venue_id):
+  # a row per genre
+  results = session.query(Venue, Locations.city, Locations.state, Genre.name).filter(Venue.id == venue_id).\
+                    join(Locations, Venue.location_id == Locations.id).\
+                    outerjoin(VenueGenres, VenueGenres.c.venue_id == Venue.id).\
+                    outerjoin(Genre, Genre.id == VenueGenres.c.genre_id).order_by(Genre.name).all()
+
+  if not results:
+    return None
+
+  venue, city, state, _ = results[0]
+
+  venue_details = {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": [genre for *_, genre in results if genre is not None],
+    "address": venue.address,
+    "city": city,
+    "state": state,
+    "phone": venue.phone,
+    "website": venue.website,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link
+    }
 
-  search_term = request.form['search_term']
-  results = session.query(Artist.id, Artist.name).filter(Artist.name.ilike(f"%{search_term}%")).all()
+  now = datetime.now()
+  venue_details["past_shows"], venue_details["past_shows_cursor"], past_updated_at = venue_show_section(venue.id, now, upcoming=False)
+  venue_details["upcoming_shows"], venue_details["upcoming_shows_cursor"], upcoming_updated_at = venue_show_section(venue.id, now, upcoming=True)
+  venue_details["past_shows_count"], venue_details["upcoming_shows_count"], shows_updated_at, last_started, deleted_at = show_stats(Shows.venue_id == venue.id, now)
 
-  response = {
-    "count": len(results),
-    "data": [{
-      "id": id,
-      "name": name
-      }
-    for id, name in results]
-  }
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/artists/<int:artist_id>')
-def show_artist(artist_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  error=False
-  results=False
-  try:
-    results = session.query(Artist, Locations).filter(Artist.id == artist_id).\
-              join(Locations, Artist.location_id == Locations.id).first()
+  # the page changes when any row on it does, when a show starts, and when
+  # a row is deleted
+  venue_details["updated_at"] = latest([venue.updated_at, past_updated_at, upcoming_updated_at, shows_updated_at, deleted_at,
+                                        last_started and local_to_utc(last_started)])
+  venue_details["etag"] = content_tag(venue_details)
+  return venue_details
+
+def build_artist_view(artist_id):
+  # a row per genre
+  results = session.query(Artist, Locations.city, Locations.state, Genre.name).filter(Artist.id == artist_id).\
+            join(Locations, Artist.location_id == Locations.id).\
+            outerjoin(ArtistGenres, ArtistGenres.c.artist_id == Artist.id).\
+            outerjoin(Genre, Genre.id == ArtistGenres.c.genre_id).order_by(Genre.name).all()
 
-    artist, location = results
+  if not results:
+    return None
 
-    artist_details = {
+  artist, city, state, _ = results[0]
+
+  artist_details = {
     "id": artist.id,
     "name": artist.name,
-    "genres": artist.genres,
-    "city": location.city,
-    "state": location.state,
+    "genres": [genre for *_, genre in results if genre is not None],
+    "city": city,
+    "state": state,
     "phone": artist.phone,
     "website": artist.website,
     "facebook_link": artist.facebook_link,
     "seeking_venue": artist.seeking_venue,
     "seeking_description": artist.seeking_description,
-    "image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80"
+    "image_link": artist.image_link
     }
 
-    past_shows = []
-    upcoming_shows= []
-
-    shows =  session.query(Shows.start_time, Venue).filter_by(artist_id = artist.id).join(Venue, Venue.id == Shows.venue_id).all()
+  now = datetime.now()
+  artist_details["past_shows"], artist_details["past_shows_cursor"], past_updated_at = artist_show_section(artist.id, now, upcoming=False)
+  artist_details["upcoming_shows"], artist_details["upcoming_shows_cursor"], upcoming_updated_at = artist_show_section(artist.id, now, upcoming=True)
+  artist_details["past_shows_count"], artist_details["upcoming_shows_count"], shows_updated_at, last_started, deleted_at = show_stats(Shows.artist_id == artist.id, now)
+
+  # the page changes when any row on it does, when a show starts, and when
+  # a row is deleted
+  artist_details["updated_at"] = latest([artist.updated_at, past_updated_at, upcoming_updated_at, shows_updated_at, deleted_at,
+                                        last_started and local_to_utc(last_started)])
+  artist_details["etag"] = content_tag(artist_details)
+  return artist_details
+
+def venue_view(venue_id):
+  key = ('venue', venue_id)
+  venue_details = entity_cache.get(key)
+  if venue_details is None:
+    # not stored if the venue is invalidated while it is built
+    version = entity_cache.version()
+    venue_details = build_venue_view(venue_id)
+    if venue_details is not None:
+      entity_cache.set(key, venue_details, since=version)
+  return venue_details
+
+def artist_view(artist_id):
+  key = ('artist', artist_id)
+  artist_details = entity_cache.get(key)
+  if artist_details is None:
+    # not stored if the artist is invalidated while it is built
+    version = entity_cache.version()
+    artist_details = build_artist_view(artist_id)
+    if artist_details is not None:
+      entity_cache.set(key, artist_details, since=version)
+  return artist_details
+
+@task
+def invalidate_entities(venue_ids=(), artist_ids=()):
+  entity_cache.delete(*[('venue', id) for id in venue_ids] + [('artist', id) for id in artist_ids])
+
+@task
+def invalidate_related(kind, id):
+  # the pages listing shows of an edited venue or artist
+  if kind == 'venue':
+    invalidate_entities(artist_ids=venue_artist_ids(id))
+  else:
+    invalidate_entities(venue_ids=artist_venue_ids(id))
+
+def venue_artist_ids(venue_id):
+  # artists whose pages list a show at this venue
+  return [id for id, in session.query(Shows.artist_id).filter(Shows.venue_id == venue_id).distinct()]
+
+def artist_venue_ids(artist_id):
+  # venues whose pages list a show by this artist
+  return [id for id, in session.query(Shows.venue_id).filter(Shows.artist_id == artist_id).distinct()]
+
+def delete_records(venue_ids=(), artist_ids=(), shows_before=None):
+  # Set-based deletes in the current transaction. Shows go first, so they
+  # are counted with the rest rather than left to the foreign keys to
+  # cascade. Returns the rows deleted per table, and the venues and
+  # artists whose pages listed anything deleted.
+  criteria = []
+  if venue_ids:
+    criteria.append(Shows.venue_id.in_(venue_ids))
+  if artist_ids:
+    criteria.append(Shows.artist_id.in_(artist_ids))
+  if shows_before is not None:
+    criteria.append(Shows.start_time < shows_before)
+
+  touched_venues, touched_artists = set(venue_ids), set(artist_ids)
+  counts = {"shows": 0, "venues": 0, "artists": 0}
+  if criteria:
+    venues, artists = Counter(), Counter()
+    for venue_id, artist_id, shows, upcoming in delete_shows(db.or_(*criteria)):
+      touched_venues.add(venue_id)
+      touched_artists.add(artist_id)
+      counts["shows"] += shows
+      venues[venue_id] -= upcoming
+      artists[artist_id] -= upcoming
+    # venues and artists about to be deleted need no count
+    add_counts(Venue, {id: delta for id, delta in venues.items() if id not in venue_ids})
+    add_counts(Artist, {id: delta for id, delta in artists.items() if id not in artist_ids})
+  if venue_ids:
+    counts["venues"] = session.query(Venue).filter(Venue.id.in_(venue_ids)).delete(synchronize_session=False)
+  if artist_ids:
+    counts["artists"] = session.query(Artist).filter(Artist.id.in_(artist_ids)).delete(synchronize_session=False)
+  if any(counts.values()):
+    session.query(Watermark).filter(Watermark.name == DELETED).\
+            update({Watermark.value: datetime.utcnow()}, synchronize_session=False)
+  return counts, touched_venues, touched_artists
 
-    for start_time, venue in shows:
-      show_details = {
-        "venue_id": venue.id,
-        "venue_name": venue.name,
-        "venue_image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
-        "start_time": start_time.strftime("%Y-%m-%d %H:%M:%S")
-      }
+#----------------------------------------------------------------------------#
+# Locations.
+#----------------------------------------------------------------------------#
 
-      if start_time < datetime.now():
-        past_shows.append(show_details)
-      else:
-        upcoming_shows.append(show_details)
+# city -> (id, state) of committed Locations rows. Locations are never
+# updated or deleted by the app, so entries only age out to bound the
+# damage of changes made behind its back.
+location_cache = app_service('location_cache')
+
+def resolve_locations(places):
+  # Get-or-create the Locations for (city, state) pairs and return
+  # {city: (id, state)}. Cities are unique, so an existing city keeps its
+  # state. Cache misses cost one INSERT .. ON CONFLICT DO NOTHING RETURNING,
+  # plus a SELECT for the cities that already existed. The conflict clause
+  # waits out a concurrent insert of the same city instead of failing on
+  # the unique constraint, and the SELECT then sees the winner's row.
+  found, missing = {}, {}
+  for city, state in places:
+    cached = location_cache.get(city)
+    if cached is None:
+      missing[city] = state
+    else:
+      found[city] = cached
+  if not missing:
+    return found
+
+  table = Locations.__table__
+  rows = [{"city": city, "state": state} for city, state in missing.items()]
+  if db.engine.dialect.name == 'postgresql':
+    created = session.execute(pg_insert(table).values(rows).on_conflict_do_nothing(index_elements=['city']).
+                              returning(table.c.city, table.c.id, table.c.state))
+  else:
+    # SQLite serialises writers, so ignoring the conflict is just as safe
+    session.execute(table.insert().prefix_with('OR IGNORE'), rows)
+    created = ()
+  resolved = {city: (id, state) for city, id, state in created}
+
+  existing = [city for city in missing if city not in resolved]
+  if existing:
+    resolved.update((city, (id, state)) for city, id, state in
+                    session.query(Locations.city, Locations.id, Locations.state).filter(Locations.city.in_(existing)))
+
+  # the rows may have been created by this transaction, so they are only
+  # cached once it commits
+  session.info.setdefault('locations', {}).update(resolved)
+  found.update(resolved)
+  return found
+
+def resolve_location(city, state):
+  return resolve_locations([(city, state)])[city]
+
+@db.event.listens_for(session, 'after_commit')
+def cache_locations(session):
+  for city, location in session.info.pop('locations', {}).items():
+    location_cache.set(city, location)
+
+@db.event.listens_for(session, 'after_transaction_end')
+def forget_locations(session, transaction):
+  # a rollback, or a close() without commit
+  if transaction.parent is None:
+    session.info.pop('locations', None)
 
-    artist_details["past_shows"] = past_shows
-    artist_details["upcoming_shows"] = upcoming_shows
-    artist_details["past_shows_count"] = len(past_shows)
-    artist_details["upcoming_shows_count"] = len(upcoming_shows)
+#----------------------------------------------------------------------------#
+# Genres.
+#----------------------------------------------------------------------------#
 
-  except:
-    error=True
-  finally:
-    if error:
-      if results is None: abort(404)
-      else: abort(500)
-    return render_template('pages/show_artist.html', artist=artist_details)
+def genre_links(model):
+  # the association table of Venue or Artist, and its column for their id
+  if model is Venue:
+    return VenueGenres, VenueGenres.c.venue_id
+  return ArtistGenres, ArtistGenres.c.artist_id
+
+def resolve_genres(names):
+  # {name: id}, adding genres that are not listed yet. The seed list comes
+  # from the forms; imports may bring others.
+  names = set(names)
+  if not names:
+    return {}
+  genre_ids = dict(session.query(Genre.name, Genre.id).filter(Genre.name.in_(names)))
+  missing = names - set(genre_ids)
+  if missing:
+    table = Genre.__table__
+    rows = [{"name": name} for name in sorted(missing)]
+    if db.engine.dialect.name == 'postgresql':
+      session.execute(pg_insert(table).values(rows).on_conflict_do_nothing(index_elements=['name']))
+    else:
+      session.execute(table.insert().values(rows).prefix_with('OR IGNORE'))
+    genre_ids.update(session.query(Genre.name, Genre.id).filter(Genre.name.in_(missing)))
+  return genre_ids
+
+def set_genres(model, id, names, replace=True):
+  # The genres of one venue or artist. Linking listed genres takes one
+  # INSERT .. SELECT; a genre that is not listed yet is added first, and the
+  # links are then made again.
+  table, owner = genre_links(model)
+  names = set(names)
+  if replace:
+    session.execute(table.delete().where(owner == id))
+  if not names:
+    return
+  link = table.insert().from_select([owner.name, 'genre_id'],
+                                    session.query(db.literal(id), Genre.id).filter(Genre.name.in_(names)))
+  if session.execute(link).rowcount < len(names):
+    resolve_genres(names)
+    session.execute(table.delete().where(owner == id))
+    session.execute(link)
+
+def listing_genres(model, ids):
+  # {id: [genre, ...]} for any number of venues or artists, in one query
+  table, owner = genre_links(model)
+  genres = {id: [] for id in ids}
+  if genres:
+    for id, name in session.query(owner, Genre.name).join(Genre, Genre.id == table.c.genre_id).\
+                            filter(owner.in_(genres)).order_by(owner, Genre.name):
+      genres[id].append(name)
+  return genres
+
+def genre_filter(model, genre):
+  # criterion for the venues or artists listed under a genre
+  table, owner = genre_links(model)
+  return model.id.in_(session.query(owner).join(Genre, Genre.id == table.c.genre_id).filter(Genre.name == genre))
+
+def genre_facets(model):
+  # [(genre, venues or artists listed under it)] for every genre, counted in
+  # one aggregate over the association table
+  table, owner = genre_links(model)
+  return session.query(Genre.name, db.func.count(owner)).\
+                 outerjoin(table, table.c.genre_id == Genre.id).\
+                 group_by(Genre.id, Genre.name).order_by(Genre.name).all()
 
-#  Update
-#  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
-def edit_artist(artist_id):
-  error=False
-  results=False
+#----------------------------------------------------------------------------#
+# Residencies.
+#----------------------------------------------------------------------------#
 
-  try:
-    results = session.query(Artist, Locations).filter(Artist.id == artist_id).join(Locations, Artist.location_id == Locations.id).first()
-
-    artist, location = results
-
-    form = ArtistForm(
-      id=artist.id,
-      name=artist.name,
-      genres=artist.genres,
-      city=location.city,
-      state=location.state,
-      phone=artist.phone,
-      website=artist.website,
-      facebook_link=artist.facebook_link,
-      seeking_venue=artist.seeking_venue,
-      seeking_description=artist.seeking_description
-    )
-  except:
-    error=True
+# weeks between the shows of a residency, as offered by ResidencyForm
+RESIDENCY_WEEKS = (1, 2, 4)
+
+def residency_times(first, until, weeks, limit):
+  # the first show and one every `weeks` weeks after it, up to and
+  # including the day `until`; at most `limit` of them, so a far `until`
+  # costs no more than a near one
+  times, start_time = [], first
+  while start_time.date() <= until and len(times) < limit:
+    times.append(start_time)
+    try:
+      start_time += timedelta(weeks=weeks)
+    except OverflowError:
+      # past the last date there is
+      break
+  return times
+
+def book_shows(artist_id, venue_id, start_times):
+  # Books the artist at the venue at every start time in one INSERT and
+  # returns (artist name, venue name, booked, collisions). A start time
+  # they already have a show at is a collision rather than an error.
+  # Returns None when the artist or venue does not exist.
+  names = session.query(Artist.name, Venue.name).filter(Artist.id == artist_id, Venue.id == venue_id).first()
+  if names is None:
+    return None
+
+  table = Shows.__table__
+  rows = [{"artist_id": artist_id, "venue_id": venue_id, "start_time": start_time} for start_time in start_times]
+  if db.engine.dialect.name == 'postgresql':
+    created = {start_time for start_time, in
+               session.execute(pg_insert(table).values(rows).on_conflict_do_nothing().returning(table.c.start_time))}
+  else:
+    # no RETURNING before the insert; SQLite serialises writers, so the
+    # shows found first are exactly the ones the insert skips
+    existing = {start_time for start_time, in
+                session.query(Shows.start_time).filter(Shows.artist_id == artist_id, Shows.venue_id == venue_id,
+                                                       Shows.start_time.in_(start_times))}
+    session.execute(table.insert().values(rows).prefix_with('OR IGNORE'))
+    created = set(start_times) - existing
+
+  booked = [start_time for start_time in start_times if start_time in created]
+  collisions = [start_time for start_time in start_times if start_time not in created]
+  count_upcoming([(venue_id, artist_id, start_time) for start_time in booked])
+  return names[0], names[1], booked, collisions
 
-  finally:
-    if error:
-      if results is None: abort(404)
-      else: abort(500)
-    return render_template('forms/edit_artist.html', form=form, artist=artist)
+#----------------------------------------------------------------------------#
+# Suggestions.
+#----------------------------------------------------------------------------#
 
-  # TODO: populate form with fields from artist with ID <artist_id>
-  
+def suggest_entries(app):
+  # everything the type-ahead index holds, read in a background thread
+  with app.app_context():
+    genres = session.query(Genre.name).filter(db.or_(Genre.id.in_(session.query(VenueGenres.c.genre_id)),
+                                                     Genre.id.in_(session.query(ArtistGenres.c.genre_id))))
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
-def edit_artist_submission(artist_id):
-  # TODO: take values from the form submitted, and update existing
-  # artist record with ID <artist_id> using the new attributes
-  error=False
+    entries = [('venue', id, name) for id, name in session.query(Venue.id, Venue.name)]
+    entries += [('artist', id, name) for id, name in session.query(Artist.id, Artist.name)]
+    entries += [('city', id, f"{city}, {state}") for id, city, state in session.query(Locations.id, Locations.city, Locations.state)]
+    entries += [('genre', genre, genre) for genre, in genres]
+  return entries
 
-  try:
-    artist_data = dict(name=request.form['name'], 
-                  phone=request.form['phone'],
-                  genres=request.form.getlist('genres'),
-                  website=request.form['website'],
-                  facebook_link=request.form['facebook_link'],
-                  seeking_venue=bool(request.form.get('seeking_venue')),
-                  seeking_description=request.form.get('seeking_description')
-    )
-    
-    location = Locations.query.filter_by(city=request.form['city']).first()
+suggester = app_service('suggester')
 
-    if location is None:
-      location = Locations(city=request.form['city'], state=request.form['state'])
+@main.before_app_first_request
+def build_suggest_index():
+  suggester.rebuild()
 
-    Artist.query.get(artist_id).location = location
-   
-    artist_updated_rows = Artist.query.filter_by(id = artist_id).update(artist_data)
-    session.commit()
-  except:
-    error=True
-    session.rollback()
-  finally:
-    session.close()
-    if error:
-      flash("Nothing changed.")
-    else:
-       flash('Profile updated!')
-    return redirect(url_for('show_artist', artist_id=artist_id))
+def listing_suggestions(kind, id, name, genres, city, location):
+  # built before the write commits, added once it has
+  return [(kind, id, name), ('city', location[0], f"{city}, {location[1]}")] + \
+         [('genre', genre, genre) for genre in genres]
 
+@task
+def add_suggestions(suggestions):
+  for kind, key, label in suggestions:
+    suggester.add(kind, key, label)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
-def edit_venue(venue_id):
-  error=False
-  results=False
+@task
+def remove_suggestions(entries):
+  for kind, key in entries:
+    suggester.remove(kind, key)
 
-  try:
-    results = session.query(Venue, Locations).filter(Venue.id == venue_id).\
-              join(Locations, Venue.location_id == Locations.id).first()
-
-    venue, location = results
-
-    form = VenueForm(
-      id=venue.id,
-      name=venue.name,
-      genres=venue.genres,
-      address=venue.address,
-      city=location.city,
-      state=location.state,
-      phone=venue.phone,
-      website=venue.website,
-      facebook_link=venue.facebook_link,
-      seeking_talent=venue.seeking_talent,
-      seeking_description=venue.seeking_description,
-      image_link=venue.image_link
-    )
-  except:
-    error=True
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
 
-  finally:
-    if error:
-      if results is None: abort(404)
-      else: abort(500)
-    return render_template('forms/edit_venue.html', form=form, venue=venue)
+def import_flag(value):
+  if isinstance(value, str):
+    return value.strip().lower() in ('1', 'true', 't', 'yes', 'y')
+  return bool(value)
+
+def import_genres(value):
+  # a JSON list, or a comma separated CSV field
+  if isinstance(value, str):
+    value = value.split(',')
+  genres = [genre.strip() for genre in value or () if genre.strip()]
+  if not genres:
+    raise ValueError('no genres')
+  return genres
+
+def import_required(record, field):
+  value = record.get(field)
+  if value is None or str(value).strip() == '':
+    raise ValueError(f"missing {field}")
+  return str(value).strip()
+
+def import_listing(record):
+  return {
+    "name": import_required(record, 'name'),
+    "phone": import_required(record, 'phone'),
+    "genres": import_genres(record.get('genres')),
+    "seeking_description": record.get('seeking_description'),
+    "image_link": record.get('image_link'),
+    "website": record.get('website'),
+    "facebook_link": record.get('facebook_link'),
+    "location": (import_required(record, 'city'), import_required(record, 'state')),
+  }
 
-  # TODO: populate form with values from venue with ID <venue_id>
+def import_venue(record):
+  row = import_listing(record)
+  row.update(address=import_required(record, 'address'), seeking_talent=import_flag(record.get('seeking_talent')))
+  return row
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
-def edit_venue_submission(venue_id):
-  # TODO: take values from the form submitted, and update existing
-  # venue record with ID <venue_id> using the new attributes
-  error=False
+def import_artist(record):
+  row = import_listing(record)
+  row.update(seeking_venue=import_flag(record.get('seeking_venue')))
+  return row
 
+def import_show(record):
+  value = import_required(record, 'start_time')
   try:
-    venue_data = dict(name=request.form['name'], 
-                  address=request.form['address'],
-                  phone=request.form['phone'],
-                  genres=request.form.getlist('genres'),
-                  website=request.form['website'],
-                  facebook_link=request.form['facebook_link'],
-                  seeking_talent=bool(request.form.get('seeking_talent')),
-                  seeking_description=request.form.get('seeking_description')
-    )
+    # ISO timestamps, the usual case, parse much faster this way
+    start_time = datetime.fromisoformat(value)
+  except ValueError:
+    start_time = parse_datetime(value)
+  if start_time.tzinfo is not None:
+    # stored as local time, like the rest of the app
+    start_time = start_time.astimezone().replace(tzinfo=None)
+  row = {"start_time": start_time}
+  for field in ('artist', 'venue'):
+    if record.get(f"{field}_id") is not None:
+      row[f"{field}_id"] = int(record[f"{field}_id"])
+    else:
+      row[field] = import_required(record, f"{field}_name")
+  return row
+
+def insert_values(table, rows, returning):
+  # Inserts the rows, skipping any that conflict with a row already there,
+  # and returns the given columns of the rows it inserted.
+  connection = session.connection()
+  if connection.dialect.name == 'postgresql':
+    return insert_values_postgresql(connection, table, rows, returning)
+
+  # SQLite: one row at a time, so each tells whether it went in
+  insert = table.insert().prefix_with('OR IGNORE')
+  connection = connection.execution_options(compiled_cache={})
+  columns = [column.name for column in table.columns if column.name in rows[0]]
+  keys = [column.name for column in table.primary_key]
+  inserted = []
+  for row in rows:
+    row = {column: row[column] for column in columns}
+    result = connection.execute(insert, row)
+    if result.rowcount:
+      row.update((key, value) for key, value in zip(keys, result.inserted_primary_key) if key not in row)
+      inserted.append(tuple(row[column] for column in returning))
+  return inserted
+
+def insert_values_postgresql(connection, table, rows, returning):
+  # One multi-row INSERT .. ON CONFLICT DO NOTHING .. RETURNING. The VALUES
+  # list is quoted by psycopg2: compiling a thousand-row insert through
+  # SQLAlchemy costs more than running it. It runs on the session's
+  # connection, so metrics and the slow query log see it.
+  from psycopg2.extensions import encodings
+
+  columns = [column.name for column in table.columns if column.name in rows[0]]
+  placeholders = '(%s)' % ', '.join(['%s'] * len(columns))
+  dbapi_connection = connection.connection
+  cursor = dbapi_connection.cursor()
+  try:
+    values = b', '.join(cursor.mogrify(placeholders, tuple(row[column] for column in columns)) for row in rows)
+  finally:
+    cursor.close()
+  sql = 'INSERT INTO "%s" (%s) VALUES %s ON CONFLICT DO NOTHING RETURNING %s' % (
+    table.name, ', '.join(columns), values.decode(encodings[dbapi_connection.encoding]), ', '.join(returning))
+  # no parameters: a % in the values is not a placeholder
+  return connection.execution_options(no_parameters=True).execute(sql).fetchall()
+
+def import_listings(model):
+  table = model.__table__
+
+  def insert(rows):
+    try:
+      locations = resolve_locations({row['location'] for row in rows})
+      values = [dict(row, location_id=locations[row['location'][0]][0]) for row in rows]
+
+      ids = dict(insert_values(table, values, returning=['name', 'id']))
+
+      # a later row with an inserted name is a duplicate within the file
+      skipped, links = {}, []
+      genre_ids = resolve_genres({genre for row in rows for genre in row['genres']})
+      genre_table, owner = genre_links(model)
+      for n, row in enumerate(rows):
+        id = ids.pop(row['name'], None)
+        if id is None:
+          skipped[n] = f"{model.__name__} {row['name']} already exists"
+        else:
+          links += [{owner.name: id, "genre_id": genre_ids[genre]} for genre in row['genres']]
+      if links:
+        insert_values(genre_table, links, returning=['genre_id'])
+      session.commit()
+    except:
+      session.rollback()
+      raise
+    return skipped
+
+  return insert
+
+def import_shows(touched):
+  table = Shows.__table__
+
+  def insert(rows):
+    try:
+      artists = {row['artist'] for row in rows if 'artist' in row}
+      venues = {row['venue'] for row in rows if 'venue' in row}
+      artist_ids = dict(session.query(Artist.name, Artist.id).filter(Artist.name.in_(artists))) if artists else {}
+      venue_ids = dict(session.query(Venue.name, Venue.id).filter(Venue.name.in_(venues))) if venues else {}
+
+      skipped, values = {}, []
+      for n, row in enumerate(rows):
+        artist_id = row['artist_id'] if 'artist_id' in row else artist_ids.get(row['artist'])
+        venue_id = row['venue_id'] if 'venue_id' in row else venue_ids.get(row['venue'])
+        if artist_id is None or venue_id is None:
+          skipped[n] = f"unknown {'artist' if artist_id is None else 'venue'}"
+        else:
+          values.append((n, {"artist_id": artist_id, "venue_id": venue_id, "start_time": row['start_time']}))
+
+      inserted = set()
+      if values:
+        # rows given by id still need checking: a dangling id would fail the batch
+        known_artists = {id for id, in session.query(Artist.id).filter(Artist.id.in_({value['artist_id'] for n, value in values}))}
+        known_venues = {id for id, in session.query(Venue.id).filter(Venue.id.in_({value['venue_id'] for n, value in values}))}
+        for n, value in values:
+          if value['artist_id'] not in known_artists or value['venue_id'] not in known_venues:
+            skipped[n] = f"unknown {'artist' if value['artist_id'] not in known_artists else 'venue'}"
+        values = [(n, value) for n, value in values if n not in skipped]
+
+      if values:
+        inserted = set(insert_values(table, [value for n, value in values], returning=['artist_id', 'venue_id', 'start_time']))
+        count_upcoming([(venue_id, artist_id, start_time) for artist_id, venue_id, start_time in inserted])
+      session.commit()
+    except:
+      session.rollback()
+      raise
+    for n, value in values:
+      key = (value['artist_id'], value['venue_id'], value['start_time'])
+      if key in inserted:
+        inserted.discard(key)
+        touched['venue'].add(value['venue_id'])
+        touched['artist'].add(value['artist_id'])
+      else:
+        skipped[n] = 'show already listed'
+    return skipped
+
+  return insert
+
+@main.cli.command('import')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('--format', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--batch-size', type=click.IntRange(1), show_default='IMPORT_BATCH_SIZE')
+@click.option('--rejects', type=click.File('w', encoding='utf-8'), help='Write rejected records to this file as JSON lines.')
+def import_command(kind, file, format, batch_size, rejects):
+  """Bulk load venues, artists or shows from a CSV or JSONL file.
+
+  Venues and artists take the listing fields plus city and state; genres
+  are a list, or comma separated in CSV. Shows take start_time and either
+  artist_id/venue_id or artist_name/venue_name. Names that already exist
+  and shows already listed are rejected, not updated.
+  """
+  touched = {'venue': set(), 'artist': set()}
+  batch_size = batch_size or current_app.config['IMPORT_BATCH_SIZE']
+  if kind == 'shows':
+    convert, insert = import_show, import_shows(touched)
+  elif kind == 'venues':
+    convert, insert = import_venue, import_listings(Venue)
+  else:
+    convert, insert = import_artist, import_listings(Artist)
+
+  def progress(importer):
+    if importer.elapsed - progress.reported >= 5:
+      progress.reported = importer.elapsed
+      click.echo(importer.report(), err=True)
+  progress.reported = 0
+
+  importer = Importer(convert, insert, errors=(IntegrityError, DataError), batch_size=batch_size, rejects=rejects, progress=progress)
+  try:
+    importer.run(read_records(file, format))
+  finally:
+    session.close()
+    # pages of venues and artists that gained shows
+    invalidate_entities(venue_ids=touched['venue'], artist_ids=touched['artist'])
+    click.echo(importer.report())
 
-    location = Locations.query.filter_by(city=request.form['city']).first()
+#----------------------------------------------------------------------------#
+# Metrics.
+#----------------------------------------------------------------------------#
 
-    if location is None:
-      location = Locations(city=request.form['city'], state=request.form['state'])
+metrics = app_service('metrics')
 
-    Venue.query.get(venue_id).location = location
+@main.before_app_request
+def start_metrics():
+  metrics.start()
 
-    venue_updated_rows = Venue.query.filter_by(id = venue_id).update(venue_data)
-    session.commit() 
+# Engine events reach every engine in the process, so these check there is
+# an app whose metrics to count them in
 
-  except:
-    error=True
-    session.rollback()
-  finally:
-    session.close()
-    if error:
-      flash('Nothing changed.')
-    else:
-      flash('Venue updated!')
-    return redirect(url_for('show_venue', venue_id=venue_id))
+@db.event.listens_for(Engine, 'before_cursor_execute')
+def start_statement_metrics(conn, cursor, statement, parameters, context, executemany):
+  if has_app_context():
+    metrics.statement_started()
 
-#  Create Artist
-#  ----------------------------------------------------------------
+@db.event.listens_for(Engine, 'after_cursor_execute')
+def finish_statement_metrics(conn, cursor, statement, parameters, context, executemany):
+  if has_app_context():
+    metrics.statement_finished()
 
-@app.route('/artists/create', methods=['GET'])
-def create_artist_form():
-  form = ArtistForm()
-  return render_template('forms/new_artist.html', form=form)
+@main.after_app_request
+def add_server_timing(response):
+  sample = metrics.sample
+  if sample is not None and current_app.config['METRICS_SERVER_TIMING']:
+    # streamed pages report the time until their first byte
+    elapsed = (metrics.timer() - sample.started) * 1000
+    response.headers.add('Server-Timing', f'db;dur={sample.db_time * 1000:.2f};desc="{sample.statements} queries"')
+    response.headers.add('Server-Timing', f'app;dur={elapsed:.2f}')
+  return response
 
-@app.route('/artists/create', methods=['POST'])
-def create_artist_submission():
-  # called upon submitting the new artist listing form
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
+@main.teardown_app_request
+def finish_metrics(exception):
+  # runs once a streamed response has been sent, so its SQL is counted
+  metrics.finish(request.endpoint or 'unmatched')
 
-  error=False
-  try:
-    artist = Artist(name=request.form['name'], 
-                  phone=request.form['phone'],
-                  genres=request.form.getlist('genres'),
-                  website=request.form['website'],
-                  facebook_link=request.form['facebook_link'],
-                  seeking_venue=bool(request.form.get('seeking_venue')),
-                  seeking_description=request.form.get('seeking_description')
-    )
-    
-    location = Locations(city=request.form['city'], state=request.form['state'])
+#----------------------------------------------------------------------------#
+# Slow queries.
+#----------------------------------------------------------------------------#
 
-    city_exists = Locations.query.filter_by(city=location.city).scalar() is not None
-    if city_exists:
-      location = Locations.query.filter_by(city=location.city).first()
+# None when SLOW_QUERY_THRESHOLD_MS is; false outside an app context
+slow_queries = app_service('slow_queries')
+
+@db.event.listens_for(Engine, 'before_cursor_execute')
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+  if slow_queries:
+    conn.info.setdefault('statement_started', []).append(time.perf_counter())
+
+@db.event.listens_for(Engine, 'after_cursor_execute')
+def log_slow_statement(conn, cursor, statement, parameters, context, executemany):
+  if not slow_queries:
+    return
+  duration = time.perf_counter() - conn.info['statement_started'].pop()
+  if duration >= slow_queries.threshold:
+    route = {}
+    if has_request_context():
+      route = dict(endpoint=request.endpoint, method=request.method, path=request.path)
+    slow_queries.record(conn.engine, statement, parameters, duration, executemany=executemany,
+                        time=datetime.now().isoformat(), **route)
 
-    artist.location = location      
+#----------------------------------------------------------------------------#
+# API.
+#----------------------------------------------------------------------------#
 
-    session.add(artist)
+# the fields of a show in /api/v1/shows; the first three key the cursor
+SHOW_FIELDS = {
+  "start_time": Shows.start_time,
+  "artist_id": Shows.artist_id,
+  "venue_id": Shows.venue_id,
+  "artist_name": Artist.name,
+  "venue_name": Venue.name,
+  "updated_at": Shows.updated_at,
+}
+
+def json_default(value):
+  # orjson writes datetimes itself, in this same form
+  if isinstance(value, datetime):
+    return value.isoformat()
+  raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def dump_json(payload):
+  if orjson is not None:
+    return orjson.dumps(payload, default=json_default)
+  return json.dumps(payload, separators=(',', ':'), default=json_default).encode()
+
+def api_response(payload, status=200):
+  return Response(dump_json(payload), status=status, mimetype='application/json')
+
+def api_error(status, message):
+  abort(api_response({"error": message}, status))
+
+def requested_fields(available, default):
+  # ?fields=name,city picks the fields of each record, in that order
+  fields = request.args.get('fields')
+  if fields is None:
+    return default
+  names = list(dict.fromkeys(name.strip() for name in fields.split(',') if name.strip()))
+  unknown = [name for name in names if name not in available]
+  if unknown or not names:
+    api_error(400, 'unknown fields: ' + ', '.join(unknown) if unknown else 'no fields requested')
+  return names
+
+def api_limit():
+  size = min(request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int), current_app.config['API_MAX_PAGE_SIZE'])
+  if size < 1:
+    api_error(400, 'limit must be at least 1')
+  return size
+
+def listing_columns(model, now):
+  # what selects each field a venue or artist has in /api/v1, and what the
+  # fields that need a join are joined to
+  shows_of = Shows.venue_id if model is Venue else Shows.artist_id
+  started = started_shows(model, now)
+  columns = {
+    "id": model.id,
+    "name": model.name,
+    # genres come from a query of their own, see listing_records
+    "genres": None,
+    "city": Locations.city,
+    "state": Locations.state,
+    "phone": model.phone,
+    "website": model.website,
+    "facebook_link": model.facebook_link,
+    "seeking_description": model.seeking_description,
+    "past_shows_count": session.query(db.func.count()).filter(shows_of == model.id, Shows.start_time < now).\
+                                correlate(model).as_scalar(),
+    "upcoming_shows_count": upcoming_shows_count(model, started),
+    "updated_at": model.updated_at,
+  }
+  if model is Venue:
+    columns.update(address=Venue.address, seeking_talent=Venue.seeking_talent)
+  else:
+    columns.update(seeking_venue=Artist.seeking_venue)
+
+  location = (Locations, model.location_id == Locations.id)
+  joins = {"city": location, "state": location, "upcoming_shows_count": (started, started.c.id == model.id)}
+  return columns, joins
+
+def selected_fields(columns, names):
+  return [name for name in names if name != 'id' and columns[name] is not None]
+
+def listing_query(model, columns, joins, names):
+  # selects (id, *the other requested columns), making only the joins they
+  # need; outer joins, as every venue and artist has a location
+  query = session.query(model.id, *[columns[name] for name in selected_fields(columns, names)])
+  joined = []
+  for name in names:
+    join = joins.get(name)
+    if join is not None and not any(join is other for other in joined):
+      joined.append(join)
+      query = query.outerjoin(*join)
+  return query
+
+def listing_records(model, columns, names, rows):
+  # the genres of every row, when asked for, take one more query
+  selected = selected_fields(columns, names)
+  genres = listing_genres(model, [row[0] for row in rows]) if 'genres' in names else None
+  records = []
+  for row in rows:
+    values = dict(zip(selected, row[1:]), id=row[0])
+    if genres is not None:
+      values['genres'] = genres[row[0]]
+    records.append({name: values[name] for name in names})
+  return records
+
+def api_listing(model):
+  columns, joins = listing_columns(model, datetime.now())
+  names = requested_fields(columns, default=['id', 'name'])
+  size = api_limit()
+
+  query = listing_query(model, columns, joins, names).order_by(model.id)
+  genre = request.args.get('genre')
+  if genre:
+    query = query.filter(genre_filter(model, genre))
+  after = request.args.get('after')
+  if after is not None:
+    if not after.isdigit():
+      api_error(400, 'malformed cursor')
+    query = query.filter(model.id > int(after))
+
+  rows = query.limit(size + 1).all()
+  return api_response({
+    "data": listing_records(model, columns, names, rows[:size]),
+    "next_cursor": str(rows[size - 1][0]) if len(rows) > size else None,
+  })
+
+def api_entity(model, entity_id):
+  # The page view model, cached and shared with the HTML pages, or, when
+  # only columns are asked for and the model is not cached, a select of
+  # just those columns.
+  kind, view = ('venue', venue_view) if model is Venue else ('artist', artist_view)
+  columns, joins = listing_columns(model, datetime.now())
+  names = requested_fields(set(columns) | {'image_link', 'past_shows', 'past_shows_cursor',
+                                           'upcoming_shows', 'upcoming_shows_cursor'}, default=None)
+
+  if names is not None and set(names) <= set(columns):
+    details = entity_cache.get((kind, entity_id))
+    if details is None:
+      row = listing_query(model, columns, joins, names).filter(model.id == entity_id).first()
+      if row is None:
+        api_error(404, f'{kind} {entity_id} not found')
+      return api_response(listing_records(model, columns, names, [row])[0])
+  else:
+    details = view(entity_id)
+    if details is None:
+      api_error(404, f'{kind} {entity_id} not found')
+
+  if names is None:
+    names = [name for name in details if name != 'etag']
+  etag, last_modified = content_tag(details["etag"], names), details["updated_at"]
+  response = not_modified(etag, last_modified)
+  if response is None:
+    response = with_validators(api_response({name: details[name] for name in names}), etag, last_modified)
+  return response
+
+def api_show_listing():
+  names = requested_fields(SHOW_FIELDS, default=list(SHOW_FIELDS))
+  size = api_limit()
+
+  key = [Shows.start_time, Shows.artist_id, Shows.venue_id]
+  others = [name for name in names if name not in ('start_time', 'artist_id', 'venue_id')]
+  query = session.query(*key, *[SHOW_FIELDS[name] for name in others])
+  if 'artist_name' in names:
+    query = query.join(Artist, Artist.id == Shows.artist_id)
+  if 'venue_name' in names:
+    query = query.join(Venue, Venue.id == Shows.venue_id)
+  query = query.order_by(*key)
+
+  after = request.args.get('after')
+  if after:
+    try:
+      query = query.filter(db.tuple_(*key) > decode_cursor(after, ids=2))
+    except BadRequest:
+      api_error(400, 'malformed cursor')
+
+  page = KeysetPage(query, size, key=lambda row: row[:3])
+  data = []
+  for start_time, artist_id, venue_id, *rest in page:
+    values = dict(zip(others, rest), start_time=start_time, artist_id=artist_id, venue_id=venue_id)
+    data.append({name: values[name] for name in names})
+  return api_response({"data": data, "next_cursor": page.next_cursor})
+
+def api_ids(body, name):
+  ids = body.get(name, [])
+  if not isinstance(ids, list) or not all(type(id) is int for id in ids):
+    api_error(400, f'{name} must be a list of ids')
+  return ids
+
+def api_delete():
+  # {"venue_ids": [...], "artist_ids": [...], "shows_before": "<ISO 8601>"},
+  # any of them, deleted in one transaction
+  body = request.get_json(silent=True)
+  if not isinstance(body, dict):
+    api_error(400, 'expected a JSON object')
+  venue_ids, artist_ids = api_ids(body, 'venue_ids'), api_ids(body, 'artist_ids')
+
+  shows_before = body.get('shows_before')
+  if shows_before is not None:
+    try:
+      shows_before = datetime.fromisoformat(shows_before)
+    except (TypeError, ValueError):
+      api_error(400, 'shows_before must be an ISO 8601 time')
+    if shows_before.tzinfo is not None:
+      # start times are stored as naive local time
+      shows_before = shows_before.astimezone().replace(tzinfo=None)
+    if shows_before > datetime.now():
+      api_error(400, 'shows_before only reaches past shows')
+
+  try:
+    counts, touched_venues, touched_artists = delete_records(venue_ids, artist_ids, shows_before)
+    after_commit('invalidate_entities', venue_ids=sorted(touched_venues), artist_ids=sorted(touched_artists))
+    after_commit('remove_suggestions', [('venue', id) for id in venue_ids] + [('artist', id) for id in artist_ids])
     session.commit()
   except:
-    error=True
     session.rollback()
-    print(sys.exc_info())
+    raise
   finally:
     session.close()
-    if error == True:
-      flash('An error occurred. Artist ' + artist.name + ' could not be listed.')
-    else: 
-      flash('Artist ' + request.form['name'] + ' was successfully listed!')
-
-  # on successful db insert, flash success
-  # flash('Artist ' + request.form['name'] + ' was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Artist ' + data.name + ' could not be listed.')
+  return api_response({"deleted": counts})
+
+#----------------------------------------------------------------------------#
+# Controllers.
+#----------------------------------------------------------------------------#
+
+@main.route('/')
+def index():
   return render_template('pages/home.html')
 
 
-#  Shows
+#  Suggestions
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
-def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-
-  joined_data = session.query(Artist, Shows.start_time, Venue).join(Shows, Artist.id == Shows.artist_id).join(Venue, Venue.id == Shows.venue_id).all() 
-  
-  data = [{
-      "venue_id": venue.id,
-      "venue_name": venue.name,
-      "artist_id": artist.id,
-      "artist_name": artist.name,
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": start_time.strftime("%Y-%m-%d %H:%M:%S")
-    }
-    for artist, start_time, venue in joined_data
-    ]
+@main.route('/api/search/suggest')
+def search_suggestions():
+  # type-ahead over venue and artist names, cities and genres, served from
+  # the in-process index without touching the database
+  query = request.args.get('q', '')
+  limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+  return jsonify({"query": query, "results": suggester.search(query, limit)})
 
-  return render_template('pages/shows.html', shows=data)
+#  API
+#  ----------------------------------------------------------------
 
-@app.route('/shows/create')
-def create_shows():
-  # renders form. do not touch.
-  form = ShowForm()
-  return render_template('forms/new_show.html', form=form)
+@main.route('/api/v1/venues')
+def api_venues():
+  return api_listing(Venue)
 
-@app.route('/shows/create', methods=['POST'])
-def create_show_submission():
-  # called to create new shows in the db, upon submitting new show listing form
-  # TODO: insert form data as a new Show record in the db, instead
+@main.route('/api/v1/venues/<int:venue_id>')
+def api_venue(venue_id):
+  return api_entity(Venue, venue_id)
 
-  error=False
-  try:
-    start_time = (request.form['start_time'])
+@main.route('/api/v1/artists')
+def api_artists():
+  return api_listing(Artist)
 
-    artist = Artist.query.filter_by(id = request.form['artist_id']).one()
-    venue = Venue.query.filter_by(id = request.form['venue_id']).one()
-    
-    show = Shows(start_time=start_time)
+@main.route('/api/v1/artists/<int:artist_id>')
+def api_artist(artist_id):
+  return api_entity(Artist, artist_id)
 
-    show.venue = venue
-    show.artist = artist
+@main.route('/api/v1/shows')
+def api_shows():
+  return api_show_listing()
 
-    session.add(show)
-    session.commit()
-  except:
-    error=True
-    session.rollback()
-  finally:
-    session.close()
-    if error:
-      flash('An error occurred. Show could not be listed.')
-    else:
-      flash('Show was successfully listed!')
+@main.route('/api/v1/delete', methods=['POST'])
+def api_batch_delete():
+  return api_delete()
 
+#  Cache
+#  ----------------------------------------------------------------
 
-  # on successful db insert, flash success
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Show could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
-  return render_template('pages/home.html')
+@main.route('/cache/stats')
+def cache_stats():
+  return jsonify(entity_cache.stats())
+
+#  Assets
+#  ----------------------------------------------------------------
+
+@main.route('/static/dist/<path:filename>')
+def dist_asset(filename):
+  return assets.send(filename)
 
-@app.errorhandler(404)
+#  Images
+#  ----------------------------------------------------------------
+
+@main.route('/images/<int:width>/<token>')
+def thumbnail(width, token):
+  if width not in thumbnails.widths:
+    abort(404)
+  try:
+    image_link = thumbnail_signer.loads(token)
+  except BadSignature:
+    abort(404)
+
+  path = thumbnails.find(image_link, width)
+  if path is None and thumbnails.available and thumbnails.claim(image_link):
+    tasks.submit('make_thumbnails', image_link)
+    # made already when tasks run in the request
+    path = thumbnails.path(image_link, width)
+    if not os.path.isfile(path):
+      path = None
+  elif path is not None and thumbnails.stale(path) and thumbnails.claim(image_link):
+    # served as it is while a new one is made
+    tasks.submit('make_thumbnails', image_link)
+  if path is not None:
+    return thumbnails.send(path)
+
+  # the original until the thumbnail is ready
+  response = redirect(image_link)
+  response.headers['Cache-Control'] = 'no-store'
+  return response
+
+#  Metrics
+#  ----------------------------------------------------------------
+
+@main.route('/metrics')
+def show_metrics():
+  return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@main.app_errorhandler(404)
 def not_found_error(error):
+    if request.path.startswith('/api/'):
+        return api_response({"error": "not found"}, 404)
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def server_error(error):
+    if request.path.startswith('/api/'):
+        return api_response({"error": "internal server error"}, 500)
     return render_template('errors/500.html'), 500
 
-if not app.debug:
+#----------------------------------------------------------------------------#
+# App factory.
+#----------------------------------------------------------------------------#
+
+def make_services(app):
+  # everything the module-level app_service() names stand for, from the
+  # app's config
+  config = app.config
+  executor = TaskExecutor(workers=config['TASK_WORKERS'], max_queue=config['TASK_QUEUE_SIZE'],
+                          max_attempts=config['TASK_MAX_ATTEMPTS'], retry_delay=config['TASK_RETRY_DELAY'],
+                          context=app.app_context)
+  for name, fn in TASKS.items():
+    executor.task(fn, name=name)
+  atexit.register(executor.shutdown, config['TASK_SHUTDOWN_TIMEOUT'])
+
+  services = {
+    "assets": Assets(app.static_folder, max_age=config['ASSETS_MAX_AGE'], auto_build=config['ASSETS_AUTO_BUILD']),
+    "tasks": executor,
+    "thumbnails": Thumbnails(config['THUMBNAIL_DIR'], config['THUMBNAIL_WIDTHS'],
+                             origin_root=config['IMAGE_ORIGIN_ROOT'], quality=config['THUMBNAIL_QUALITY'],
+                             max_age=config['THUMBNAIL_MAX_AGE'], refresh_after=config['THUMBNAIL_REFRESH_AFTER'],
+                             max_bytes=config['THUMBNAIL_MAX_SOURCE_BYTES'],
+                             timeout=config['THUMBNAIL_FETCH_TIMEOUT'], retry_after=config['THUMBNAIL_RETRY_AFTER']),
+    "thumbnail_signer": URLSafeSerializer(config['SECRET_KEY'], salt='thumbnail'),
+    "entity_cache": make_cache(config, 'entities'),
+    "location_cache": LRUCache(maxsize=config['LOCATION_CACHE_SIZE'], ttl=config['LOCATION_CACHE_TTL']),
+    "suggester": Suggester(functools.partial(suggest_entries, app), max_age=config['SUGGEST_REBUILD_INTERVAL']),
+    "metrics": Metrics(sample_rate=config['METRICS_SAMPLE_RATE']),
+    "slow_queries": None,
+  }
+  if config['SLOW_QUERY_THRESHOLD_MS'] is not None:
+    services["slow_queries"] = SlowQueryLog(config['SLOW_QUERY_LOG'], config['SLOW_QUERY_THRESHOLD_MS'] / 1000,
+                                            max_bytes=config['SLOW_QUERY_LOG_MAX_BYTES'],
+                                            backup_count=config['SLOW_QUERY_LOG_BACKUPS'])
+
+  metrics = services["metrics"]
+  metrics.add_cache('entities', services["entity_cache"])
+  metrics.add_cache('locations', services["location_cache"])
+  metrics.add_cache('thumbnails', services["thumbnails"])
+  metrics.add_task_queue('tasks', executor)
+  metrics.add_pool('default', lambda: db.get_engine(app).pool)
+  executor.on_finish = metrics.task_finished
+  return services
+
+def create_app(config='config', script_info=None):
+  '''Builds the app from a config object, or the import path of one.
+
+  The flask command passes script_info; an app it builds also gets
+  Flask-Migrate, for `flask db`. Server workers are spared alembic.
+  '''
+  app = Flask(__name__)
+  app.config.from_object(config)
+  db.init_app(app)
+  if script_info is not None:
+    from flask_migrate import Migrate
+    Migrate(app, db)
+
+  # the page views, imported once an app needs them
+  from views.artists import artist_views
+  from views.shows import show_views
+  from views.venues import venue_views
+
+  app.extensions['fyyur'] = make_services(app)
+  for blueprint in (main, venue_views, artist_views, show_views):
+    app.register_blueprint(blueprint)
+
+  if not app.debug:
     file_handler = FileHandler('error.log')
     file_handler.setFormatter(
         Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
@@ -672,6 +1799,7 @@ if not app.debug:
     file_handler.setLevel(logging.INFO)
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
+  return app
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -679,11 +1807,14 @@ if not app.debug:
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    # the views import this module as app, not as __main__
+    sys.modules['app'] = sys.modules[__name__]
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
+    sys.modules['app'] = sys.modules[__name__]
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
@@ -0,0 +1,179 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import tempfile
+
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+# bundle name -> source files under the static folder, in load order
+BUNDLES = {
+    'main.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    'form.css': [
+        'css/bootstrap.min.css',
+        'css/bootstrap-theme.min.css',
+        'css/layout.main.css',
+        'css/layout.forms.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    'head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js',
+    ],
+    'main.js': [
+        'js/script.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+    ],
+}
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)(?!data:|[a-z]+:|/|#)([^'")]+)\1\s*\)''', re.IGNORECASE)
+CSS_COMMENT = re.compile(r'/\*(?!!).*?\*/', re.DOTALL)
+CSS_SPACE = re.compile(r'\s*([{}:;,>])\s*|\s+')
+
+
+def minify_css(text):
+    if rcssmin is not None:
+        return rcssmin.cssmin(text)
+    # comments and whitespace only; good enough for the app's own sheets
+    text = CSS_COMMENT.sub('', text)
+    return CSS_SPACE.sub(lambda m: m.group(1) or ' ', text).strip()
+
+
+def minify_js(text):
+    # without rjsmin scripts are only concatenated; the libraries ship minified
+    if rjsmin is not None:
+        return rjsmin.jsmin(text)
+    return text
+
+
+class Assets(object):
+    """Builds fingerprinted, precompressed bundles and serves them.
+
+    ``build()`` concatenates and minifies each bundle in BUNDLES, writes it to
+    ``<static>/dist`` as ``name.<hash>.ext`` next to ``.gz`` and, when the
+    brotli package is installed, ``.br`` copies, and records the names in
+    ``manifest.json``. Earlier builds are left in place for pages still
+    referring to them. ``url()`` maps a bundle to its current file; ``send()``
+    serves a file in the best encoding the client accepts.
+
+    With ``auto_build`` the bundles are built on first use when there is no
+    manifest, and rebuilt whenever a source is newer than it.
+    """
+
+    def __init__(self, static_folder, bundles=BUNDLES, max_age=365 * 24 * 3600, auto_build=True):
+        self.static_folder = static_folder
+        self.output = os.path.join(static_folder, 'dist')
+        self.manifest_path = os.path.join(self.output, 'manifest.json')
+        self.bundles = bundles
+        self.max_age = max_age
+        self.auto_build = auto_build
+        self._manifest = None
+
+    def sources(self, name):
+        return [os.path.join(self.static_folder, source) for source in self.bundles[name]]
+
+    def bundle(self, name):
+        parts = []
+        for path in self.sources(name):
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+            if name.endswith('.css'):
+                # keep url()s relative to the bundle rather than to the source
+                directory = os.path.dirname(path)
+                text = CSS_URL.sub(lambda m: 'url("%s")' % os.path.relpath(
+                    os.path.normpath(os.path.join(directory, m.group(2))), self.output).replace(os.sep, '/'), text)
+                parts.append(minify_css(text))
+            else:
+                parts.append(minify_js(text).rstrip().rstrip(';') + ';')
+        return '\n'.join(parts).encode('utf-8')
+
+    def build(self):
+        os.makedirs(self.output, exist_ok=True)
+        manifest = {}
+        for name in self.bundles:
+            content = self.bundle(name)
+            stem, ext = os.path.splitext(name)
+            filename = '%s.%s%s' % (stem, hashlib.sha256(content).hexdigest()[:12], ext)
+            path = os.path.join(self.output, filename)
+            self._write(path, content)
+            # mtime=0 so the same bundle always compresses to the same bytes
+            self._write(path + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                self._write(path + '.br', brotli.compress(content, quality=11))
+            manifest[name] = filename
+
+        self._write(self.manifest_path, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'), replace=True)
+        self._manifest = manifest
+        return manifest
+
+    def _write(self, path, content, replace=False):
+        # bundle files are named after their content, so one that exists is
+        # already right; the manifest is replaced atomically
+        if os.path.exists(path) and not replace:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.output)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+
+    def stale(self):
+        try:
+            built = os.path.getmtime(self.manifest_path)
+        except OSError:
+            return True
+        return any(os.path.getmtime(path) > built for name in self.bundles for path in self.sources(name))
+
+    @property
+    def manifest(self):
+        if self._manifest is None:
+            if self.auto_build and self.stale():
+                return self.build()
+            with open(self.manifest_path) as f:
+                self._manifest = json.load(f)
+        return self._manifest
+
+    def url(self, name):
+        return 'dist/' + self.manifest[name]
+
+    def send(self, filename):
+        mimetype = mimetypes.guess_type(filename)[0]
+        accepted = request.accept_encodings
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if accepted[encoding] and os.path.isfile(os.path.join(self.output, filename + suffix)):
+                response = send_from_directory(self.output, filename + suffix, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(self.output, filename, mimetype=mimetype)
+
+        # the name changes with the content, so it can be cached for good
+        response.headers['Cache-Control'] = 'public, max-age=%d, immutable' % self.max_age
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
@@ -0,0 +1,54 @@
+"""Time the ``datetime`` template filter per call.
+
+  python -m bench.filters [CALLS]
+
+Compares the old round trip (strftime in the view, then dateutil parsing
+and babel.dates.format_datetime in the filter) with format_datetime given
+the datetime itself, outside a request and inside one where the same
+start times repeat. CALLS (default 20000) start times are drawn from 200
+distinct values, about what a long shows page lists. Needs no database.
+"""
+
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from app import create_app, format_datetime
+
+FULL = "EEEE MMMM, d, y 'at' h:mma"
+
+
+def old_filter(value):
+  return babel.dates.format_datetime(dateutil.parser.parse(value), FULL)
+
+
+def per_call(fn, values):
+  started = time.perf_counter()
+  for value in values:
+    fn(value)
+  return (time.perf_counter() - started) / len(values) * 1e6
+
+
+def main():
+  calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+  rng = random.Random(1)
+  distinct = [datetime(2030, 1, 1) + timedelta(minutes=rng.randint(0, 500000)) for _ in range(200)]
+  values = [rng.choice(distinct) for _ in range(calls)]
+
+  old = per_call(lambda value: old_filter(value.strftime("%Y-%m-%d %H:%M:%S")), values)
+  direct = per_call(lambda value: format_datetime(value, 'full'), values)
+  with create_app().test_request_context():
+    memoized = per_call(lambda value: format_datetime(value, 'full'), values)
+
+  print(f'{calls} calls over {len(distinct)} distinct start times')
+  print(f'{"strftime + parse + format":>28} {old:8.2f} us/call')
+  print(f'{"datetime, no request":>28} {direct:8.2f} us/call  {old / direct:6.1f}x')
+  print(f'{"datetime, memoized":>28} {memoized:8.2f} us/call  {old / memoized:6.1f}x')
+
+
+if __name__ == '__main__':
+  main()
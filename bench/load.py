@@ -0,0 +1,282 @@
+"""Drive every route of the app through the Flask test client and report
+latency percentiles, throughput and SQL statements per route.
+
+  BENCH_DATABASE_URI=postgresql://... python -m bench.load [--save | --compare] [BASELINE]
+
+The database is dropped and reseeded with bench.seed before every run, so
+only point BENCH_DATABASE_URI at a throwaway database. BENCH_REQUESTS
+(default 2000) requests are drawn from MIX with a random.Random seeded
+from BENCH_SEED, so a run is repeatable for a given seed and scale.
+Mostly page views and searches, with a few writes.
+
+``--save`` writes the results to BASELINE (default bench/baseline.json),
+along with the database dialect they were measured on. ``--compare``
+refuses a baseline saved on another dialect, whose SQL counts and timings
+do not carry over, and otherwise exits with status 1 if a route's
+median latency grew by more than BENCH_TOLERANCE (default 0.5, i.e. 50%),
+it runs more SQL statements per request or it fails more often than
+before. The tail percentiles of the rarer routes rest on a few dozen
+requests, too few to gate on. SQL counts are exact on any machine;
+latencies only compare well on the one that saved the baseline.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import make_url
+
+from app import create_app, db, Venue
+from bench.seed import seed, GENRES, STATES, SEED, SHOWS, WORDS
+
+REQUESTS = int(os.environ.get('BENCH_REQUESTS', 2000))
+WARMUP = int(os.environ.get('BENCH_WARMUP', 200))
+TOLERANCE = float(os.environ.get('BENCH_TOLERANCE', 0.5))
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def listing_form(rng, name):
+  return {
+    'name': name,
+    'city': f'City {rng.randint(1, 5)}',
+    'state': rng.choice(STATES),
+    'address': '1 Bench St',
+    'phone': '555-0100',
+    'genres': rng.sample(GENRES, 2),
+    'website': '',
+    'facebook_link': '',
+  }
+
+
+class Driver(object):
+  '''Builds the next request for each route from the seeded catalogue.'''
+
+  def __init__(self, rng, size):
+    self.rng = rng
+    self.size = size
+    self.created = 0
+    self.created_venues = []
+
+  def venue(self):
+    return self.rng.randint(1, self.size['venues'])
+
+  def artist(self):
+    return self.rng.randint(1, self.size['artists'])
+
+  def term(self):
+    return self.rng.choice(WORDS)
+
+  def create_venue(self):
+    self.created += 1
+    name = f'Bench Venue {self.created}'
+    self.created_venues.append(name)
+    return 'POST', '/venues/create', listing_form(self.rng, name)
+
+  def create_artist(self):
+    self.created += 1
+    return 'POST', '/artists/create', listing_form(self.rng, f'Bench Artist {self.created}')
+
+  def delete_venue(self):
+    # only venues this run created, found outside the timed request; with
+    # none left this times the handler's miss
+    venue = None
+    if self.created_venues:
+      venue = Venue.query.filter_by(name=self.created_venues.pop()).first()
+      db.session.remove()
+    return 'DELETE', f'/venues/{venue.id if venue else 0}', None
+
+  def edit_venue(self):
+    id = self.venue()
+    return 'POST', f'/venues/{id}/edit', listing_form(self.rng, f'Edited Venue {id}')
+
+  def edit_artist(self):
+    id = self.artist()
+    return 'POST', f'/artists/{id}/edit', listing_form(self.rng, f'Edited Artist {id}')
+
+  def create_show(self):
+    start_time = f'2030-01-01 {self.rng.randint(0, 23):02d}:{self.rng.randint(0, 59):02d}:00'
+    return 'POST', '/shows/create', {'artist_id': self.artist(), 'venue_id': self.venue(), 'start_time': start_time}
+
+  def create_residency(self):
+    start_time = f'2031-01-{self.rng.randint(1, 7):02d} {self.rng.randint(18, 23):02d}:00:00'
+    return 'POST', '/shows/residency', {'artist_id': self.artist(), 'venue_id': self.venue(),
+                                        'start_time': start_time, 'every': '1', 'until': '2031-06-30'}
+
+
+# (weight, route, request) where request(driver) gives (method, url, form)
+MIX = [
+  (3, 'index', lambda d: ('GET', '/', None)),
+  (5, 'venues', lambda d: ('GET', '/venues', None)),
+  (6, 'search_venues', lambda d: ('POST', '/venues/search', {'search_term': d.term()})),
+  (15, 'show_venue', lambda d: ('GET', f'/venues/{d.venue()}', None)),
+  (3, 'venue_shows', lambda d: ('GET', f'/venues/{d.venue()}/shows/upcoming', None)),
+  (5, 'artists', lambda d: ('GET', '/artists', None)),
+  (6, 'search_artists', lambda d: ('POST', '/artists/search', {'search_term': d.term()})),
+  (15, 'show_artist', lambda d: ('GET', f'/artists/{d.artist()}', None)),
+  (3, 'artist_shows', lambda d: ('GET', f'/artists/{d.artist()}/shows/past', None)),
+  (8, 'shows', lambda d: ('GET', '/shows', None)),
+  (10, 'search_suggestions', lambda d: ('GET', f'/api/search/suggest?q={d.term()[:3]}', None)),
+  (1, 'create_venue_form', lambda d: ('GET', '/venues/create', None)),
+  (1, 'create_venue_submission', Driver.create_venue),
+  (0.5, 'delete_venue', Driver.delete_venue),
+  (1, 'create_artist_form', lambda d: ('GET', '/artists/create', None)),
+  (1, 'create_artist_submission', Driver.create_artist),
+  (1, 'edit_venue', lambda d: ('GET', f'/venues/{d.venue()}/edit', None)),
+  (1, 'edit_venue_submission', Driver.edit_venue),
+  (1, 'edit_artist', lambda d: ('GET', f'/artists/{d.artist()}/edit', None)),
+  (1, 'edit_artist_submission', Driver.edit_artist),
+  (1, 'create_shows', lambda d: ('GET', '/shows/create', None)),
+  (1, 'create_show_submission', Driver.create_show),
+  (0.5, 'create_residency_submission', Driver.create_residency),
+  (2, 'api_venues', lambda d: ('GET', f'/api/v1/venues?after={d.venue()}&fields=id,name,city,upcoming_shows_count', None)),
+  (2, 'api_venue', lambda d: ('GET', f'/api/v1/venues/{d.venue()}', None)),
+  (2, 'api_artist', lambda d: ('GET', f'/api/v1/artists/{d.artist()}?fields=name,genres', None)),
+  (2, 'api_shows', lambda d: ('GET', '/api/v1/shows?fields=start_time,artist_id,venue_name', None)),
+  (0.5, 'cache_stats', lambda d: ('GET', '/cache/stats', None)),
+  (0.5, 'show_metrics', lambda d: ('GET', '/metrics', None)),
+]
+
+
+def percentile(timings, p):
+  # nearest rank
+  return timings[max(0, int(round(p / 100 * len(timings))) - 1)]
+
+
+def run(app, requests=REQUESTS, warmup=WARMUP, shows=SHOWS, seed_value=SEED):
+  with app.app_context():
+    dialect = db.engine.dialect.name
+    size = seed(shows, seed_value, reset=True)
+    db.session.remove()
+
+    # count the statements of the driving thread only; the suggest index
+    # rebuilds in a thread of its own
+    driving, statements = threading.get_ident(), [0]
+    def count(conn, cursor, statement, parameters, context, executemany):
+      if threading.get_ident() == driving:
+        statements[0] += 1
+    db.event.listen(Engine, 'before_cursor_execute', count)
+
+    rng = random.Random(seed_value)
+    driver = Driver(rng, size)
+    client = app.test_client()
+    weights = [weight for weight, _, _ in MIX]
+    results = {route: {'timings': [], 'statements': 0, 'errors': 0} for _, route, _ in MIX}
+
+    started = None
+    try:
+      for n in range(warmup + requests):
+        if n == warmup:
+          started = time.perf_counter()
+        _, route, make = rng.choices(MIX, weights)[0]
+        method, url, form = make(driver)
+
+        statements[0] = 0
+        request_started = time.perf_counter()
+        response = client.open(url, method=method, data=form)
+        response.get_data()
+        elapsed = time.perf_counter() - request_started
+
+        if n >= warmup:
+          result = results[route]
+          result['timings'].append(elapsed * 1000)
+          result['statements'] += statements[0]
+          result['errors'] += response.status_code >= 400
+      total = time.perf_counter() - started
+    finally:
+      db.event.remove(Engine, 'before_cursor_execute', count)
+
+  routes = {}
+  for route, result in results.items():
+    timings = sorted(result['timings'])
+    if not timings:
+      continue
+    routes[route] = {
+      'requests': len(timings),
+      'errors': result['errors'],
+      'p50_ms': round(percentile(timings, 50), 3),
+      'p95_ms': round(percentile(timings, 95), 3),
+      'p99_ms': round(percentile(timings, 99), 3),
+      'mean_ms': round(statistics.mean(timings), 3),
+      'sql_per_request': round(result['statements'] / len(timings), 3),
+    }
+  return {
+    'dialect': dialect,
+    'scale': size,
+    'seed': seed_value,
+    'requests': requests,
+    'throughput_rps': round(requests / total, 1),
+    'routes': routes,
+  }
+
+
+def report(results):
+  print(f"{results['requests']} requests over {results['scale']}, {results['throughput_rps']} req/s")
+  print(f'{"route":>28} {"n":>5} {"err":>4} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"sql/req":>8}')
+  for route, stats in sorted(results['routes'].items()):
+    print(f"{route:>28} {stats['requests']:5d} {stats['errors']:4d} {stats['p50_ms']:8.2f} "
+          f"{stats['p95_ms']:8.2f} {stats['p99_ms']:8.2f} {stats['sql_per_request']:8.2f}")
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+  regressions = []
+  for setting in ('dialect', 'scale', 'seed', 'requests'):
+    if results[setting] != baseline.get(setting):
+      regressions.append(f"{setting} {results[setting]} differs from the baseline's {baseline.get(setting)}")
+  if results['dialect'] != baseline.get('dialect'):
+    return regressions
+  for route, old in sorted(baseline['routes'].items()):
+    new = results['routes'].get(route)
+    if new is None:
+      continue
+    if new['p50_ms'] > old['p50_ms'] * (1 + tolerance):
+      regressions.append(f"{route}: p50 {old['p50_ms']:.2f} -> {new['p50_ms']:.2f} ms")
+    if new['sql_per_request'] > old['sql_per_request'] * 1.01:
+      regressions.append(f"{route}: sql/request {old['sql_per_request']:.2f} -> {new['sql_per_request']:.2f}")
+    if new['errors'] > old['errors']:
+      regressions.append(f"{route}: errors {old['errors']} -> {new['errors']}")
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(prog='python -m bench.load')
+  action = parser.add_mutually_exclusive_group()
+  action.add_argument('--save', action='store_true', help='write the results to BASELINE')
+  action.add_argument('--compare', action='store_true', help='fail on regressions against BASELINE')
+  parser.add_argument('baseline', nargs='?', default=BASELINE)
+  args = parser.parse_args()
+
+  if 'BENCH_DATABASE_URI' not in os.environ:
+    parser.error('set BENCH_DATABASE_URI to a throwaway database; it is dropped and reseeded')
+  if args.compare:
+    # before the run, which takes minutes
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    dialect = make_url(os.environ['BENCH_DATABASE_URI']).get_dialect().name
+    if baseline.get('dialect') != dialect:
+      parser.error(f"{args.baseline} was saved on {baseline.get('dialect', 'an unrecorded dialect')}, not {dialect}; "
+                   f"compare on the database it was saved on, or --save a baseline to another file")
+  app = create_app()
+  app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['BENCH_DATABASE_URI']
+  results = run(app)
+  report(results)
+
+  if args.save:
+    with open(args.baseline, 'w') as f:
+      json.dump(results, f, indent=2, sort_keys=True)
+      f.write('\n')
+  elif args.compare:
+    regressions = compare(results, baseline)
+    for regression in regressions:
+      print('REGRESSION', regression)
+    if regressions:
+      sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
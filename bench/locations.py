@@ -0,0 +1,80 @@
+"""Compare Locations lookups with and without eager-loading the city's
+artists and venues.
+
+  BENCH_DATABASE_URI=postgresql://... python -m bench.locations
+
+The database is seeded on first run (it must be empty or already seeded by
+this script). The ``eager`` case reproduces the old ``lazy=False``
+relationships with ``joinedload``; the ``lazy`` case is what the models do
+now.
+"""
+
+import os
+import time
+import tracemalloc
+
+from sqlalchemy.orm import joinedload
+
+from app import create_app, db, Locations, Venue, Artist
+
+CITIES = int(os.environ.get('BENCH_CITIES', 20))
+PER_CITY = int(os.environ.get('BENCH_PER_CITY', 100))
+ROUNDS = int(os.environ.get('BENCH_ROUNDS', 20))
+
+
+def seed():
+  if Locations.query.first() is not None:
+    return
+
+  for c in range(CITIES):
+    location = Locations(city=f'City {c}', state='CA')
+    db.session.add(location)
+    db.session.flush()
+    db.session.bulk_insert_mappings(Venue, [dict(
+      name=f'Venue {c}-{i}', address=f'{i} Main St', phone='555-0100',
+      location_id=location.id,
+      image_link='https://example.com/venue.jpg') for i in range(PER_CITY)])
+    db.session.bulk_insert_mappings(Artist, [dict(
+      name=f'Artist {c}-{i}', phone='555-0100',
+      location_id=location.id, image_link='https://example.com/artist.jpg')
+      for i in range(PER_CITY)])
+  db.session.commit()
+
+
+def measure(query):
+  cities = [f'City {c % CITIES}' for c in range(ROUNDS)]
+
+  tracemalloc.start()
+  started = time.perf_counter()
+  for city in cities:
+    location = query.filter_by(city=city).first()
+    location.city, location.state
+    db.session.expunge_all()
+  elapsed = time.perf_counter() - started
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+
+  return elapsed / ROUNDS * 1000, peak / 1024
+
+
+def main():
+  app = create_app()
+  if 'BENCH_DATABASE_URI' in os.environ:
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['BENCH_DATABASE_URI']
+
+  with app.app_context():
+    db.create_all()
+    seed()
+
+    cases = [
+      ('eager', Locations.query.options(joinedload(Locations.artist), joinedload(Locations.venue))),
+      ('lazy', Locations.query),
+    ]
+    print(f'{CITIES} cities x {PER_CITY} venues and artists, {ROUNDS} lookups')
+    for name, query in cases:
+      latency, peak = measure(query)
+      print(f'{name:>6}: {latency:8.2f} ms/lookup  {peak:10.1f} KiB peak')
+
+
+if __name__ == '__main__':
+  main()
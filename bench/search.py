@@ -0,0 +1,88 @@
+"""Compare the old unranked ILIKE venue search with the ranked, paginated
+search served from the pg_trgm index.
+
+  BENCH_DATABASE_URI=postgresql://... python -m bench.search
+
+Needs Postgres with the pg_trgm extension available. The Venue table is
+filled to BENCH_ROWS rows on first run. The ``ilike`` case runs with bitmap
+scans disabled, which is how the query ran before the trigram index
+existed.
+"""
+
+import os
+import statistics
+import time
+
+from app import create_app, db, session, search_by_name, Locations, Venue
+
+ROWS = int(os.environ.get('BENCH_ROWS', 1000000))
+ROUNDS = int(os.environ.get('BENCH_ROUNDS', 5))
+TERMS = ['musical hop', 'velvet', 'lounge 4242', '999999']
+
+SEED = '''
+INSERT INTO "Venue" (name, address, phone, seeking_talent, location_id)
+SELECT (ARRAY['The', 'Park', 'Blue', 'Old', 'Red', 'Grand', 'Little', 'Royal'])[1 + i % 8] || ' ' ||
+       (ARRAY['Musical', 'Jazz', 'Square', 'Velvet', 'Electric', 'Golden', 'Silver', 'Acoustic', 'Rusty', 'Neon'])[1 + (i / 8) % 10] || ' ' ||
+       (ARRAY['Hop', 'Hall', 'Lounge', 'Club', 'Room', 'Tavern', 'Garden', 'Cellar', 'Theatre', 'Bar'])[1 + (i / 80) % 10] || ' ' || i,
+       i || ' Main St', '555-0100', false, :location_id
+FROM generate_series(:start, :stop) AS i
+'''
+
+
+def seed():
+  count = session.query(db.func.count(Venue.id)).scalar()
+  if count >= ROWS:
+    return
+
+  location = Locations.query.first()
+  if location is None:
+    location = Locations(city='San Francisco', state='CA')
+    session.add(location)
+    session.flush()
+  session.execute(SEED, dict(location_id=location.id, start=count + 1, stop=ROWS))
+  session.commit()
+  session.execute('ANALYZE "Venue"')
+  session.commit()
+
+
+def old_search(term):
+  session.execute('SET LOCAL enable_bitmapscan = off')
+  results = session.query(Venue.id, Venue.name).filter(Venue.name.ilike(f"%{term}%")).all()
+  session.rollback()
+  return len(results)
+
+
+def new_search(term):
+  return search_by_name(Venue, term, 1)['count']
+
+
+def measure(search, term):
+  timings = []
+  for _ in range(ROUNDS):
+    started = time.perf_counter()
+    count = search(term)
+    timings.append((time.perf_counter() - started) * 1000)
+  return statistics.median(timings), count
+
+
+def main():
+  app = create_app()
+  if 'BENCH_DATABASE_URI' in os.environ:
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['BENCH_DATABASE_URI']
+
+  with app.app_context():
+    session.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    session.commit()
+    db.create_all()
+    seed()
+
+    print(f'{ROWS} venues, median of {ROUNDS} runs')
+    print(f'{"term":>14} {"matches":>8} {"ilike ms":>10} {"trigram ms":>11} {"speedup":>8}')
+    for term in TERMS:
+      old, count = measure(old_search, term)
+      new, _ = measure(new_search, term)
+      print(f'{term:>14} {count:8d} {old:10.1f} {new:11.1f} {old / new:7.1f}x')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,137 @@
+"""Fill an empty database with a reproducible, synthetic Fyyur catalogue.
+
+  BENCH_DATABASE_URI=postgresql://... BENCH_SHOWS=100000 python -m bench.seed
+
+The catalogue is derived from BENCH_SHOWS (default 10000) and BENCH_SEED:
+one venue and one artist per 20 shows and one city per 50 venues. Shows
+are spread evenly over the year either side of today's midnight, so the
+same settings give the same rows, and the same past/upcoming split, on
+any day. Ids are assigned in order from 1.
+
+Only run this against a throwaway database: ``seed(reset=True)`` drops
+every table first.
+"""
+
+import os
+import random
+from datetime import date, datetime, time, timedelta
+
+from app import create_app, db, session, insert_values, rebuild_upcoming, Locations, Venue, Artist, Shows, Genre, VenueGenres, ArtistGenres
+from forms import VenueForm
+
+SHOWS = int(os.environ.get('BENCH_SHOWS', 10000))
+SEED = int(os.environ.get('BENCH_SEED', 1))
+CHUNK = 5000
+
+GENRES = [genre for genre, _ in VenueForm.genres.kwargs['choices']]
+STATES = [state for state, _ in VenueForm.state.kwargs['choices']]
+WORDS = ['The', 'Blue', 'Velvet', 'Electric', 'Golden', 'Rusty', 'Neon', 'Royal', 'Silver', 'Wild',
+         'Hop', 'Hall', 'Lounge', 'Club', 'Room', 'Tavern', 'Garden', 'Cellar', 'Theatre', 'Band']
+
+
+def scale(shows=SHOWS):
+  venues = max(10, shows // 20)
+  return {
+    'shows': shows,
+    'venues': venues,
+    'artists': max(10, shows // 20),
+    'cities': max(5, venues // 50),
+  }
+
+
+def insert(table, rows):
+  for start in range(0, len(rows), CHUNK):
+    chunk = rows[start:start + CHUNK]
+    if db.engine.dialect.name == 'postgresql':
+      insert_values(table, chunk, returning=[table.primary_key.columns.values()[0].name])
+    else:
+      session.execute(table.insert(), chunk)
+
+
+def name(rng, n):
+  return f'{rng.choice(WORDS)} {rng.choice(WORDS)} {rng.choice(WORDS)} {n}'
+
+
+def listing(rng, n, cities):
+  return {
+    'id': n,
+    'name': name(rng, n),
+    'phone': f'555-{rng.randint(0, 9999):04d}',
+    'genres': rng.sample(GENRES, rng.randint(1, 3)),
+    'image_link': f'https://example.com/{n}.jpg',
+    'website': f'https://example.com/{n}',
+    'facebook_link': f'https://www.facebook.com/{n}',
+    'seeking_description': None,
+    'location_id': rng.randint(1, cities),
+  }
+
+
+def seed(shows=SHOWS, seed=SEED, reset=False):
+  if reset:
+    db.drop_all()
+  if db.engine.dialect.name == 'postgresql':
+    session.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    session.commit()
+  db.create_all()
+  if Locations.query.first() is not None:
+    raise RuntimeError('bench.seed needs an empty database')
+
+  rng = random.Random(seed)
+  size = scale(shows)
+
+  insert(Locations.__table__, [
+    {'id': n, 'city': f'City {n}', 'state': rng.choice(STATES)} for n in range(1, size['cities'] + 1)])
+
+  insert(Genre.__table__, [{'id': n, 'name': genre} for n, genre in enumerate(GENRES, 1)])
+  genre_ids = {genre: n for n, genre in enumerate(GENRES, 1)}
+
+  venues, venue_genres = [], []
+  for n in range(1, size['venues'] + 1):
+    venue = listing(rng, n, size['cities'])
+    venue.update(address=f'{rng.randint(1, 9999)} Main St', seeking_talent=rng.random() < 0.3)
+    venue_genres += [{'venue_id': n, 'genre_id': genre_ids[genre]} for genre in venue.pop('genres')]
+    venues.append(venue)
+  insert(Venue.__table__, venues)
+  insert(VenueGenres, venue_genres)
+
+  artists, artist_genres = [], []
+  for n in range(1, size['artists'] + 1):
+    artist = listing(rng, n, size['cities'])
+    artist.update(seeking_venue=rng.random() < 0.3)
+    artist_genres += [{'artist_id': n, 'genre_id': genre_ids[genre]} for genre in artist.pop('genres')]
+    artists.append(artist)
+  insert(Artist.__table__, artists)
+  insert(ArtistGenres, artist_genres)
+
+  # one show every (two years / shows), so start times never collide
+  today = datetime.combine(date.today(), time())
+  step = timedelta(days=730) / shows
+  for start in range(0, shows, CHUNK):
+    insert(Shows.__table__, [{
+      'artist_id': rng.randint(1, size['artists']),
+      'venue_id': rng.randint(1, size['venues']),
+      'start_time': today - timedelta(days=365) + step * n,
+    } for n in range(start, min(start + CHUNK, shows))])
+
+  for model in (Venue, Artist):
+    rebuild_upcoming(model)
+
+  if db.engine.dialect.name == 'postgresql':
+    for table in ('Locations', 'Genre', 'Venue', 'Artist'):
+      session.execute(f'''SELECT setval(pg_get_serial_sequence('"{table}"', 'id'), (SELECT max(id) FROM "{table}"))''')
+    session.execute('ANALYZE')
+  session.commit()
+  return size
+
+
+def main():
+  app = create_app()
+  app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['BENCH_DATABASE_URI']
+
+  with app.app_context():
+    size = seed()
+  print(', '.join(f'{count} {table}' for table, count in size.items()))
+
+
+if __name__ == '__main__':
+  main()
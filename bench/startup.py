@@ -0,0 +1,124 @@
+"""Time how long a fresh process takes to serve its first request.
+
+  python -m bench.startup [--save | --compare] [BASELINE]
+
+Each of BENCH_STARTS (default 15) runs is a new interpreter that imports
+app, calls create_app() and gets / through the test client; the report
+gives the median of each step and of the three together, the cold start,
+and the modules the process had loaded by then. BENCH_DATABASE_URI is
+passed on when set, though / itself makes no query.
+
+Target: a cold start of at most TARGET_MS (default 600 ms), about half
+the 1120 ms the app took before create_app() and lazy imports (1060 ms
+of it in ``import app``, 45 ms in the first request, on the machine that
+saved bench/startup.json). Most of what is left is importing Flask and
+SQLAlchemy.
+
+``--save`` writes the results to BASELINE (default bench/startup.json).
+``--compare`` exits with status 1 if the cold start grew by more than
+BENCH_TOLERANCE (default 0.5, i.e. 50%) or more modules are loaded than
+before. Module counts are exact for a given set of installed packages;
+times only compare well on the one machine, so the target is reported
+rather than gated on.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+STARTS = int(os.environ.get('BENCH_STARTS', 15))
+TOLERANCE = float(os.environ.get('BENCH_TOLERANCE', 0.5))
+TARGET_MS = float(os.environ.get('BENCH_STARTUP_TARGET_MS', 600))
+BASELINE = os.path.join(os.path.dirname(__file__), 'startup.json')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STEPS = ('import_ms', 'create_app_ms', 'first_request_ms')
+
+# run in the child, so that nothing is imported before it starts timing
+CHILD = '''
+import json, os, sys, time
+started = time.perf_counter()
+import app as module
+imported = time.perf_counter()
+app = module.create_app()
+if 'BENCH_DATABASE_URI' in os.environ:
+  app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['BENCH_DATABASE_URI']
+created = time.perf_counter()
+response = app.test_client().get('/')
+response.get_data()
+served = time.perf_counter()
+print(json.dumps({
+  'import_ms': (imported - started) * 1000,
+  'create_app_ms': (created - imported) * 1000,
+  'first_request_ms': (served - created) * 1000,
+  'status': response.status_code,
+  'modules': len(sys.modules),
+}))
+'''
+
+
+def start():
+  output = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, check=True,
+                          stdout=subprocess.PIPE, universal_newlines=True).stdout
+  return json.loads(output.splitlines()[-1])
+
+
+def run(starts=STARTS):
+  samples = [start() for _ in range(starts)]
+  failed = [sample['status'] for sample in samples if sample['status'] != 200]
+  if failed:
+    raise RuntimeError(f'GET / answered {failed[0]} in {len(failed)} of {starts} starts')
+
+  results = {'starts': starts, 'modules': max(sample['modules'] for sample in samples)}
+  for step in STEPS:
+    results[step] = round(statistics.median(sample[step] for sample in samples), 1)
+  results['cold_start_ms'] = round(statistics.median(sum(sample[step] for step in STEPS) for sample in samples), 1)
+  return results
+
+
+def report(results):
+  print(f"median of {results['starts']} starts, {results['modules']} modules loaded")
+  for step in STEPS + ('cold_start_ms',):
+    print(f'{step:>18} {results[step]:8.1f}')
+  met = 'met' if results['cold_start_ms'] <= TARGET_MS else 'missed'
+  print(f'{"target":>18} {TARGET_MS:8.1f} {met}')
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+  regressions = []
+  if results['cold_start_ms'] > baseline['cold_start_ms'] * (1 + tolerance):
+    regressions.append(f"cold start {baseline['cold_start_ms']:.1f} -> {results['cold_start_ms']:.1f} ms")
+  if results['modules'] > baseline['modules']:
+    regressions.append(f"modules {baseline['modules']} -> {results['modules']}")
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(prog='python -m bench.startup')
+  action = parser.add_mutually_exclusive_group()
+  action.add_argument('--save', action='store_true', help='write the results to BASELINE')
+  action.add_argument('--compare', action='store_true', help='fail on regressions against BASELINE')
+  parser.add_argument('baseline', nargs='?', default=BASELINE)
+  args = parser.parse_args()
+
+  results = run()
+  report(results)
+
+  if args.save:
+    with open(args.baseline, 'w') as f:
+      json.dump(results, f, indent=2, sort_keys=True)
+      f.write('\n')
+  elif args.compare:
+    with open(args.baseline) as f:
+      regressions = compare(results, json.load(f))
+    for regression in regressions:
+      print('REGRESSION', regression)
+    if regressions:
+      sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,352 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_cache(config, namespace):
+    """Builds the cache backend selected by ``CACHE_BACKEND``.
+
+    ``'lru'`` keeps entries in each worker process; when ``CACHE_DIR`` is set,
+    invalidations are broadcast to the other workers through a log file in
+    it. ``'filesystem'`` keeps the entries themselves in ``CACHE_DIR``, so all
+    workers on the host share them.
+    """
+    backend = config['CACHE_BACKEND']
+    maxsize = config['ENTITY_CACHE_SIZE']
+    ttl = config['ENTITY_CACHE_TTL']
+    directory = config.get('CACHE_DIR')
+
+    if backend == 'lru':
+        log = None
+        if directory:
+            log = InvalidationLog(os.path.join(directory, namespace + '.invalidations'))
+        return LRUCache(maxsize=maxsize, ttl=ttl, invalidation_log=log)
+    if backend == 'filesystem':
+        return FileSystemCache(os.path.join(directory, namespace), maxsize=maxsize, ttl=ttl)
+    raise ValueError('Unknown CACHE_BACKEND %r' % backend)
+
+
+class InvalidationLog(object):
+    """An append-only file of invalidated keys shared by worker processes.
+
+    Each ``publish()`` appends one JSON line with a single ``O_APPEND`` write,
+    which does not interleave with other writers. Readers keep their own
+    offset and ``poll()`` returns the keys published since the last call.
+
+    The file starts with a random generation line. When it outgrows
+    ``max_bytes`` it is swapped for a new generation. A reader whose offset
+    is no longer in the file it last read - it was replaced or truncated - is
+    told to drop everything, since it can no longer tell what it missed.
+    """
+
+    RESET = object()
+
+    def __init__(self, path, max_bytes=1 << 20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            self._start_generation()
+        with open(path, 'rb') as f:
+            self._generation = f.readline()
+            self._seen = _signature(os.fstat(f.fileno()))
+            self._offset = f.seek(0, os.SEEK_END)
+
+    def _start_generation(self):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(('{"generation": "%s"}\n' % os.urandom(8).hex()).encode('utf-8'))
+        os.chmod(tmp, 0o600)
+        os.replace(tmp, self.path)
+
+    def publish(self, keys):
+        line = (json.dumps([list(key) for key in keys]) + '\n').encode('utf-8')
+        while True:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+            try:
+                os.write(fd, line)
+                stat = os.fstat(fd)
+                # another process may have swapped the file between our open
+                # and write; readers already on the new one would never see
+                # the line
+                if _signature(os.stat(self.path))[:2] == _signature(stat)[:2]:
+                    break
+            except FileNotFoundError:
+                pass
+            finally:
+                os.close(fd)
+        if stat.st_size > self.max_bytes:
+            self._start_generation()
+
+    def poll(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return [self.RESET]
+        # a new file can have grown to the size of the old one
+        if _signature(stat) == self._seen:
+            return []
+
+        with self._lock:
+            with open(self.path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                generation = f.readline()
+                if (_signature(stat)[:2] != self._seen[:2] or generation != self._generation
+                        or stat.st_size < self._offset):
+                    self._generation = generation
+                    self._seen = _signature(stat)
+                    self._offset = f.seek(0, os.SEEK_END)
+                    return [self.RESET]
+                f.seek(self._offset)
+                data = f.read(stat.st_size - self._offset)
+            # a line still being written is left for the next poll
+            data = data[:data.rfind(b'\n') + 1]
+            self._offset += len(data)
+            self._seen = _signature(stat)
+
+        return [tuple(key) for line in data.splitlines() for key in json.loads(line.decode('utf-8'))]
+
+
+def _signature(stat):
+    # which file, and whether it changed since
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class LRUCache(object):
+    """A thread-safe, in-process cache bounded by entry count and age.
+
+    The least recently used entry is evicted once ``maxsize`` is exceeded and
+    entries older than ``ttl`` seconds are dropped on access. Counters are kept
+    for sizing the cache; see ``stats()``.
+
+    With an ``invalidation_log``, ``delete()`` is published to the other
+    processes sharing the log and their deletes are applied before each read.
+
+    A value built from the database can be out of date by the time it is
+    stored. ``version()`` taken before the build and passed to ``set()`` as
+    ``since`` skips the set when the key was deleted in between. The last
+    ``maxsize`` deleted keys are remembered; older ones count as deleted at
+    the newest version forgotten.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, timer=time.monotonic, invalidation_log=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.invalidation_log = invalidation_log
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # key -> version it was last deleted at, oldest first
+        self._deleted = OrderedDict()
+        self._version = 0
+        self._forgotten = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        if self.invalidation_log is not None:
+            self._apply(self.invalidation_log.poll())
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires, value = item
+                if expires > self.timer():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+    def version(self):
+        return self._version
+
+    def set(self, key, value, since=None):
+        if since is not None and self.invalidation_log is not None:
+            self._apply(self.invalidation_log.poll())
+        with self._lock:
+            if since is not None and max(self._deleted.get(key, 0), self._forgotten) > since:
+                return
+            self._data[key] = (self.timer() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        self._apply(keys)
+        if keys and self.invalidation_log is not None:
+            self.invalidation_log.publish(keys)
+
+    def _apply(self, keys):
+        if InvalidationLog.RESET in keys:
+            self.clear()
+            return
+        with self._lock:
+            for key in keys:
+                if self._data.pop(key, None) is not None:
+                    self.invalidations += 1
+                self._version += 1
+                self._deleted.pop(key, None)
+                self._deleted[key] = self._version
+            while len(self._deleted) > self.maxsize:
+                self._forgotten = self._deleted.popitem(last=False)[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._version += 1
+            self._deleted.clear()
+            self._forgotten = self._version
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+        }
+
+
+class FileSystemCache(object):
+    """A cache kept in a directory, shared by every process on the host.
+
+    Each entry is a pickle named after a hash of its key, written to a
+    temporary file and renamed into place so readers never see partial
+    writes. Entries expire after ``ttl`` seconds; once more than ``maxsize``
+    are stored the least recently written ones are removed. Counters are
+    per process.
+
+    ``delete()`` leaves a tombstone file behind for ``ttl`` seconds, and
+    ``set()`` with ``since``, a ``version()`` taken before the value was
+    built, skips a key whose tombstone is newer, in any process.
+    """
+
+    def __init__(self, directory, maxsize=1024, ttl=300):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, suffix='.cache'):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + suffix)
+
+    def _entries(self):
+        return [name for name in os.listdir(self.directory) if name.endswith('.cache')]
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return default
+        if expires <= time.time():
+            _remove(path)
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def version(self):
+        # a second early: file times lag the clock by up to a tick
+        return time.time_ns() - 10 ** 9
+
+    def _deleted_since(self, key, since):
+        return since is not None and _mtime_ns(self._path(key, '.deleted')) >= since
+
+    def set(self, key, value, since=None):
+        if self._deleted_since(key, since):
+            return
+        path = self._path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((time.time() + self.ttl, value), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        # a delete() between the check and the rename left its tombstone
+        if self._deleted_since(key, since):
+            _remove(path)
+
+        names = os.listdir(self.directory)
+        entries = [name for name in names if name.endswith('.cache')]
+        if len(entries) > self.maxsize:
+            paths = [os.path.join(self.directory, name) for name in entries]
+            paths.sort(key=_mtime)
+            for path in paths[:len(paths) - self.maxsize]:
+                if _remove(path):
+                    self.evictions += 1
+        expired = time.time() - self.ttl
+        for name in names:
+            if name.endswith('.deleted') and _mtime(os.path.join(self.directory, name)) < expired:
+                _remove(os.path.join(self.directory, name))
+
+    def delete(self, *keys):
+        for key in keys:
+            tombstone = self._path(key, '.deleted')
+            with open(tombstone, 'ab'):
+                os.utime(tombstone)
+            if _remove(self._path(key)):
+                self.invalidations += 1
+
+    def clear(self):
+        for name in self._entries():
+            _remove(os.path.join(self.directory, name))
+
+    def __len__(self):
+        return len(self._entries())
+
+    def stats(self):
+        return {
+            'size': len(self),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+        }
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
+
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
@@ -1,6 +1,6 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
+from wtforms import StringField, SelectField, SelectMultipleField, DateField, DateTimeField, BooleanField
 from wtforms.validators import DataRequired, AnyOf, URL
 
 class ShowForm(Form):
@@ -16,6 +16,31 @@ class ShowForm(Form):
         default= datetime.today()
     )
 
+class ResidencyForm(Form):
+    artist_id = StringField(
+        'artist_id'
+    )
+    venue_id = StringField(
+        'venue_id'
+    )
+    start_time = DateTimeField(
+        'start_time',
+        validators=[DataRequired()],
+        default= datetime.today()
+    )
+    every = SelectField(
+        'every', validators=[DataRequired()],
+        choices=[
+            ('1', 'Every week'),
+            ('2', 'Every two weeks'),
+            ('4', 'Every four weeks'),
+        ]
+    )
+    until = DateField(
+        'until',
+        validators=[DataRequired()]
+    )
+
 class VenueForm(Form):
     name = StringField(
         'name', validators=[DataRequired()]
@@ -0,0 +1,25 @@
+# gunicorn settings, read from the working directory by `gunicorn wsgi:app`.
+# The worker and thread counts come from production.py, which sizes each
+# worker's connection pool by them.
+import os
+
+import production
+
+bind = '0.0.0.0:%s' % os.environ.get('PORT', '8000')
+workers = production.WEB_CONCURRENCY
+threads = production.WEB_THREADS
+worker_class = 'gthread'
+
+# Import and build the app once, in the master: workers fork with it ready
+# and share the memory it was built in until they write to it.
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # a connection opened in the master would be shared by every worker
+    # forked after it; close any before forking, so each worker starts on a
+    # pool of its own
+    from app import db
+    from wsgi import app
+
+    db.get_engine(app).dispose()
@@ -0,0 +1,125 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+
+def read_records(file, format=None):
+    """Yield ``(line, record)`` for each record of a CSV or JSONL file.
+
+    The format defaults to the file's extension. Empty CSV fields become
+    None. A JSONL line that does not parse is yielded as a ValueError so it
+    can be rejected like any other bad record.
+    """
+    if format is None:
+        format = 'jsonl' if os.path.splitext(file.name)[1] in ('.jsonl', '.json') else 'csv'
+
+    if format == 'csv':
+        reader = csv.DictReader(file)
+        for record in reader:
+            yield reader.line_num, {key: value or None for key, value in record.items()}
+    else:
+        for line, text in enumerate(file, 1):
+            if not text.strip():
+                continue
+            try:
+                yield line, json.loads(text)
+            except ValueError as e:
+                yield line, e
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Importer(object):
+    """Loads records in batches, one transaction per batch.
+
+    ``convert(record)`` turns a record into a row or raises ValueError,
+    KeyError or TypeError to reject it. ``insert(rows)`` writes and commits
+    a batch of rows and returns ``{index: reason}`` for the rows it skipped.
+    When a batch fails with one of ``errors`` it is retried row by row, so
+    one bad row only costs its own insert. Rejected records are written to
+    ``rejects`` as JSON lines.
+
+    Only one batch is held at a time, so memory does not grow with the
+    size of the input.
+    """
+
+    def __init__(self, convert, insert, errors=(), batch_size=1000, rejects=None, progress=None, timer=time.monotonic):
+        self.convert = convert
+        self.insert = insert
+        self.errors = errors
+        self.batch_size = batch_size
+        self.rejects = rejects
+        self.progress = progress
+        self.timer = timer
+        self.read = 0
+        self.inserted = 0
+        self.rejected = 0
+        self.started = None
+
+    def run(self, records):
+        self.started = self.timer()
+        for batch in chunked(records, self.batch_size):
+            lines, rows = [], []
+            for line, record in batch:
+                self.read += 1
+                try:
+                    if isinstance(record, Exception):
+                        raise record
+                    rows.append(self.convert(record))
+                    lines.append((line, record))
+                except (ValueError, KeyError, TypeError) as e:
+                    self.reject(line, record, e)
+
+            if rows:
+                self.load(lines, rows)
+            if self.progress:
+                self.progress(self)
+        return self
+
+    def load(self, lines, rows):
+        try:
+            skipped = self.insert(rows)
+        except self.errors as e:
+            if len(rows) == 1:
+                skipped = {0: e}
+            else:
+                skipped = {}
+                for n, row in enumerate(rows):
+                    try:
+                        skipped.update((n, reason) for reason in self.insert([row]).values())
+                    except self.errors as e:
+                        skipped[n] = e
+
+        for n, reason in skipped.items():
+            self.reject(*lines[n], reason)
+        self.inserted += len(rows) - len(skipped)
+
+    def reject(self, line, record, reason):
+        self.rejected += 1
+        if self.rejects is not None:
+            if isinstance(record, Exception):
+                record = None
+            # database errors span several lines; the first one says why
+            reason = (str(reason).strip() or type(reason).__name__).splitlines()[0]
+            self.rejects.write(json.dumps({'line': line, 'reason': reason, 'record': record}, default=str) + '\n')
+
+    @property
+    def elapsed(self):
+        return self.timer() - self.started if self.started is not None else 0.0
+
+    @property
+    def rate(self):
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+    def report(self):
+        return '%d read, %d inserted, %d rejected in %.1fs (%.0f rows/s)' % (
+            self.read, self.inserted, self.rejected, self.elapsed, self.rate)
@@ -0,0 +1,231 @@
+import random
+import threading
+import time
+from collections import defaultdict
+
+# seconds; the last bucket is +Inf
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+CACHE_GAUGES = ('size', 'maxsize')
+
+POOL_GAUGES = ('size', 'max_overflow', 'open', 'checked_out')
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for n, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            n = len(self.buckets)
+        self.counts[n] += 1
+        self.sum += value
+        self.count += 1
+
+
+class EndpointStats(object):
+    def __init__(self, buckets):
+        self.latency = Histogram(buckets)
+        self.statements = 0
+        self.db_time = 0.0
+
+
+class TaskStats(object):
+    def __init__(self, buckets):
+        self.waited = Histogram(buckets)
+        self.ran = Histogram(buckets)
+        self.outcomes = defaultdict(int)
+
+
+class Sample(object):
+    __slots__ = ('started', 'statements', 'db_time', 'statement_started')
+
+    def __init__(self, started):
+        self.started = started
+        self.statements = 0
+        self.db_time = 0.0
+        self.statement_started = None
+
+
+class Metrics(object):
+    """Per-endpoint request latency, SQL statement counts and DB time.
+
+    A request is sampled with probability ``sample_rate``. ``start()`` opens
+    a sample for the current thread, ``statement_started()`` and
+    ``statement_finished()`` add the SQL it runs, and ``finish()`` files it
+    under the endpoint. Unsampled requests cost one random() call and a few
+    thread-local lookups.
+
+    ``task_finished()`` records a background task attempt: its time queued
+    and running, by task name, and how it ended.
+
+    ``render()`` writes everything in the Prometheus text format, along with
+    the ``stats()`` of every cache added with ``add_cache()``, the depth
+    of every task queue added with ``add_task_queue()`` and the checkouts
+    of every connection pool added with ``add_pool()``. Numbers are per
+    process.
+    """
+
+    def __init__(self, sample_rate=1.0, buckets=DEFAULT_BUCKETS, prefix='fyyur', timer=time.perf_counter):
+        self.sample_rate = sample_rate
+        self.buckets = buckets
+        self.prefix = prefix
+        self.timer = timer
+        self.endpoints = defaultdict(lambda: EndpointStats(self.buckets))
+        self.tasks = defaultdict(lambda: TaskStats(self.buckets))
+        self.caches = {}
+        self.task_queues = {}
+        self.pools = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def start(self):
+        sampled = self.sample_rate > 0 and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+        self._local.sample = Sample(self.timer()) if sampled else None
+        return sampled
+
+    @property
+    def sample(self):
+        return getattr(self._local, 'sample', None)
+
+    def statement_started(self):
+        sample = getattr(self._local, 'sample', None)
+        if sample is not None:
+            sample.statement_started = self.timer()
+
+    def statement_finished(self):
+        sample = getattr(self._local, 'sample', None)
+        if sample is not None and sample.statement_started is not None:
+            sample.statements += 1
+            sample.db_time += self.timer() - sample.statement_started
+            sample.statement_started = None
+
+    def finish(self, endpoint):
+        sample = getattr(self._local, 'sample', None)
+        if sample is None:
+            return None
+        self._local.sample = None
+        elapsed = self.timer() - sample.started
+        with self._lock:
+            stats = self.endpoints[endpoint]
+            stats.latency.observe(elapsed)
+            stats.statements += sample.statements
+            stats.db_time += sample.db_time
+        return sample
+
+    def task_finished(self, name, waited, ran, outcome):
+        with self._lock:
+            stats = self.tasks[name]
+            stats.waited.observe(waited)
+            stats.ran.observe(ran)
+            stats.outcomes[outcome] += 1
+
+    def add_cache(self, name, cache):
+        self.caches[name] = cache
+
+    def add_task_queue(self, name, executor):
+        self.task_queues[name] = executor
+
+    def add_pool(self, name, get_pool):
+        # a function, since an engine swaps its pool for a new one when
+        # disposed; pools without stats(), as in development, are left out
+        self.pools[name] = get_pool
+
+    def _histogram(self, metric, label, histogram):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+            cumulative += count
+            lines.append('%s_bucket{%s,le="%s"} %d' % (metric, label, bound, cumulative))
+        lines.append('%s_sum{%s} %r' % (metric, label, histogram.sum))
+        lines.append('%s_count{%s} %d' % (metric, label, histogram.count))
+        return lines
+
+    def render(self):
+        prefix = self.prefix
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            lines = [
+                '# HELP %s_request_duration_seconds Request latency by endpoint.' % prefix,
+                '# TYPE %s_request_duration_seconds histogram' % prefix,
+            ]
+            for endpoint, stats in endpoints:
+                lines += self._histogram('%s_request_duration_seconds' % prefix, 'endpoint="%s"' % _label(endpoint),
+                                         stats.latency)
+
+            lines += [
+                '# HELP %s_sql_statements_total SQL statements run by sampled requests.' % prefix,
+                '# TYPE %s_sql_statements_total counter' % prefix,
+            ]
+            lines += ['%s_sql_statements_total{endpoint="%s"} %d' % (prefix, _label(endpoint), stats.statements)
+                      for endpoint, stats in endpoints]
+            lines += [
+                '# HELP %s_db_seconds_total Time sampled requests spent in SQL.' % prefix,
+                '# TYPE %s_db_seconds_total counter' % prefix,
+            ]
+            lines += ['%s_db_seconds_total{endpoint="%s"} %r' % (prefix, _label(endpoint), stats.db_time)
+                      for endpoint, stats in endpoints]
+
+            tasks = sorted(self.tasks.items())
+            for attribute, name, help in (('waited', 'task_queue_seconds', 'Time background tasks spent queued.'),
+                                          ('ran', 'task_duration_seconds', 'Time background task attempts ran.')):
+                metric = '%s_%s' % (prefix, name)
+                lines += ['# HELP %s %s' % (metric, help), '# TYPE %s histogram' % metric]
+                for task, stats in tasks:
+                    lines += self._histogram(metric, 'task="%s"' % _label(task), getattr(stats, attribute))
+            lines += [
+                '# HELP %s_task_attempts_total Background task attempts by outcome.' % prefix,
+                '# TYPE %s_task_attempts_total counter' % prefix,
+            ]
+            lines += ['%s_task_attempts_total{task="%s",outcome="%s"} %d' % (prefix, _label(task), outcome, count)
+                      for task, stats in tasks for outcome, count in sorted(stats.outcomes.items())]
+
+        caches = [(name, cache.stats()) for name, cache in sorted(self.caches.items())]
+        for key in sorted({key for name, stats in caches for key in stats}):
+            if key in CACHE_GAUGES:
+                metric, kind = '%s_cache_%s' % (prefix, key), 'gauge'
+            else:
+                metric, kind = '%s_cache_%s_total' % (prefix, key), 'counter'
+            lines += ['# HELP %s Cache %s.' % (metric, key), '# TYPE %s %s' % (metric, kind)]
+            lines += ['%s{cache="%s"} %s' % (metric, _label(name), stats[key])
+                      for name, stats in caches if key in stats]
+
+        queues = [(name, executor.stats()) for name, executor in sorted(self.task_queues.items())]
+        if queues:
+            lines += [
+                '# HELP %s_task_queue_depth Background tasks waiting, queued or for a retry.' % prefix,
+                '# TYPE %s_task_queue_depth gauge' % prefix,
+            ]
+            for name, stats in queues:
+                lines += ['%s_task_queue_depth{queue="%s",state="%s"} %d' % (prefix, _label(name), state, stats[state])
+                          for state in ('queued', 'retrying')]
+
+        pools = [(name, get_pool()) for name, get_pool in sorted(self.pools.items())]
+        pools = [(name, pool) for name, pool in pools if hasattr(pool, 'stats')]
+        if pools:
+            stats = [(name, pool.stats()) for name, pool in pools]
+            for key in stats[0][1]:
+                if key in POOL_GAUGES:
+                    metric, kind = '%s_db_pool_%s' % (prefix, key), 'gauge'
+                else:
+                    metric, kind = '%s_db_pool_%s_total' % (prefix, key), 'counter'
+                lines += ['# HELP %s Database connection pool %s.' % (metric, key.replace('_', ' ')),
+                          '# TYPE %s %s' % (metric, kind)]
+                lines += ['%s{pool="%s"} %s' % (metric, _label(name), pool_stats[key]) for name, pool_stats in stats]
+            metric = '%s_db_pool_checkout_seconds' % prefix
+            lines += ['# HELP %s Time taken to check out a database connection.' % metric,
+                      '# TYPE %s histogram' % metric]
+            for name, pool in pools:
+                lines += self._histogram(metric, 'pool="%s"' % _label(name), pool.checkout_time)
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,28 @@
+"""deletion watermark
+
+Revision ID: 3f9a2c71d8e4
+Revises: b4042a8ddad3
+Create Date: 2026-10-18 06:52:14.318205
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a2c71d8e4'
+down_revision = 'b4042a8ddad3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # UTC, like the updated_at columns it is compared with
+    op.bulk_insert(sa.table('Watermarks', sa.column('name', sa.String), sa.column('value', sa.DateTime)),
+                   [{'name': 'deleted', 'value': datetime.utcnow()}])
+
+
+def downgrade():
+    op.execute("DELETE FROM \"Watermarks\" WHERE name = 'deleted'")
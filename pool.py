@@ -0,0 +1,60 @@
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+from metrics import DEFAULT_BUCKETS, Histogram
+
+
+class MeteredQueuePool(QueuePool):
+    """A QueuePool that counts and times its checkouts.
+
+    Pass it to ``create_engine()`` as ``poolclass``. Every ``connect()`` is
+    timed, so the histogram shows how long threads waited for a free
+    connection, opened a new one or pinged an idle one. ``waits`` counts the
+    checkouts that found every connection in use and none left to open, and
+    ``timeouts`` those that then gave up after ``timeout`` seconds.
+    ``stats()`` adds the connections open and in use right now.
+
+    The numbers are per process, and start again with the fresh pool a
+    forked worker gets from ``engine.dispose()``.
+    """
+
+    def __init__(self, creator, pool_size=5, max_overflow=10, timer=time.perf_counter, **kw):
+        super(MeteredQueuePool, self).__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kw)
+        self.max_overflow = max_overflow
+        self.timer = timer
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.checkout_time = Histogram(DEFAULT_BUCKETS)
+        self._stats_lock = threading.Lock()
+
+    def connect(self):
+        waiting = not self.checkedin() and 0 <= self.max_overflow <= self.overflow()
+        started = self.timer()
+        try:
+            connection = super(MeteredQueuePool, self).connect()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.waits += 1
+                self.timeouts += 1
+            raise
+        elapsed = self.timer() - started
+        with self._stats_lock:
+            self.checkouts += 1
+            self.waits += waiting
+            self.checkout_time.observe(elapsed)
+        return connection
+
+    def stats(self):
+        return {
+            'size': self.size(),
+            'max_overflow': self.max_overflow,
+            'open': self.size() + self.overflow(),
+            'checked_out': self.checkedout(),
+            'checkouts': self.checkouts,
+            'waits': self.waits,
+            'timeouts': self.timeouts,
+        }
@@ -0,0 +1,39 @@
+# Settings for serving the app with gunicorn: wsgi.py builds the app from
+# this module, gunicorn.conf.py starts the workers it describes. Everything
+# not set here is as in config.py.
+from config import *
+from pool import MeteredQueuePool
+
+DEBUG = False
+# Run `flask assets` on deploy instead
+ASSETS_AUTO_BUILD = os.environ.get('ASSETS_AUTO_BUILD', '0') == '1'
+
+# Worker processes, forked from one that has built the app, and request
+# threads in each
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 2 * (os.cpu_count() or 1) + 1))
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 4))
+
+# Connections Postgres can spare for the workers on this host, over and
+# above those kept for migrations, psql and the like. Every worker has a
+# pool of its own and gets an even share.
+DATABASE_MAX_CONNECTIONS = int(os.environ.get('DATABASE_MAX_CONNECTIONS', 80))
+DATABASE_WORKER_CONNECTIONS = max(1, DATABASE_MAX_CONNECTIONS // WEB_CONCURRENCY)
+# Each request thread keeps a connection open. Background threads (tasks,
+# the type-ahead rebuild, slow query plans) open more while they run, up to
+# the worker's share; past it they wait, at most DATABASE_POOL_TIMEOUT
+# seconds, rather than be refused by Postgres.
+DATABASE_POOL_SIZE = min(WEB_THREADS, DATABASE_WORKER_CONNECTIONS)
+DATABASE_POOL_OVERFLOW = min(WEB_THREADS + TASK_WORKERS + 1, DATABASE_WORKER_CONNECTIONS) - DATABASE_POOL_SIZE
+DATABASE_POOL_TIMEOUT = 5
+# Connections are checked before use, and replaced after this many seconds
+# rather than be cut off idle by a proxy or firewall on the way
+DATABASE_POOL_RECYCLE = 1800
+
+SQLALCHEMY_ENGINE_OPTIONS = {
+  'poolclass': MeteredQueuePool,
+  'pool_size': DATABASE_POOL_SIZE,
+  'max_overflow': DATABASE_POOL_OVERFLOW,
+  'pool_timeout': DATABASE_POOL_TIMEOUT,
+  'pool_pre_ping': True,
+  'pool_recycle': DATABASE_POOL_RECYCLE,
+}
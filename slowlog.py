@@ -0,0 +1,132 @@
+import datetime
+import decimal
+import json
+import logging
+import queue
+import re
+import threading
+from logging.handlers import RotatingFileHandler
+
+# statements EXPLAIN accepts; anything else is logged without a plan
+EXPLAINABLE = ('select', 'insert', 'update', 'delete', 'with')
+
+# string literals in SQL: E'..' with backslash escapes, or standard '..'
+STRING_LITERAL = re.compile(r"[Ee]'(?:[^'\\]|''|\\.)*'|'(?:[^']|'')*'")
+
+# longest statement text written; the rest is counted, not kept
+MAX_STATEMENT = 4096
+
+
+def redact(value):
+    """Keeps the shape of bind parameters but not their text.
+
+    Strings and bytes become ``'<str:LENGTH>'``, which is enough to spot an
+    oversized search term without logging what anyone typed. Numbers,
+    booleans, dates and None are kept, as they are what decides a plan.
+    """
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if value is None or isinstance(value, (bool, int, float, decimal.Decimal)):
+        return value
+    if isinstance(value, (datetime.date, datetime.time, datetime.timedelta)):
+        return str(value)
+    if isinstance(value, (str, bytes)):
+        return '<%s:%d>' % (type(value).__name__, len(value))
+    return '<%s>' % type(value).__name__
+
+
+def redact_statement(statement):
+    """Redacts the string literals of a statement sent without parameters.
+
+    Such a statement carries its values in its text, like the multi-row
+    ``INSERT`` of an import, so each string literal becomes ``'<str:LENGTH>'``
+    as a bind parameter would, LENGTH being as quoted. Numbers are kept. What is left is cut to
+    ``MAX_STATEMENT`` characters.
+    """
+    statement = STRING_LITERAL.sub(lambda match: "'<str:%d>'" % (len(match.group()) - 2), statement)
+    if len(statement) > MAX_STATEMENT:
+        statement = '%s... (%d more characters)' % (statement[:MAX_STATEMENT], len(statement) - MAX_STATEMENT)
+    return statement
+
+
+class SlowQueryLog(object):
+    """Writes statements slower than ``threshold`` seconds to a JSONL file.
+
+    ``record()`` only queues the statement. A background thread takes the
+    plan with ``EXPLAIN`` on a connection of its own, outside the request
+    and its transaction, and then writes the entry. When the queue is full
+    the entry is written without a plan rather than holding up the request.
+    The file rotates at ``max_bytes``, keeping ``backup_count`` old files.
+    """
+
+    def __init__(self, path, threshold, max_bytes=10 * 1024 * 1024, backup_count=5, queue_size=100):
+        self.threshold = threshold
+        self.queue = queue.Queue(queue_size)
+        self.handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                           encoding='utf-8', delay=True)
+        self.handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger = logging.getLogger('%s.%d' % (__name__, id(self)))
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def record(self, engine, statement, parameters, duration, executemany=False, **context):
+        entry = dict(context, duration_ms=round(duration * 1000, 3), statement=statement)
+        if not parameters:
+            # the values, if any, are in the text
+            entry['statement'] = redact_statement(statement)
+        if executemany:
+            entry.update(executemany=len(parameters), parameters=redact(parameters[0]) if parameters else None)
+        else:
+            entry['parameters'] = redact(parameters)
+
+        if executemany or not statement.lstrip().lower().startswith(EXPLAINABLE):
+            self.write(entry, plan=None)
+            return
+        try:
+            self.queue.put_nowait((engine, statement, parameters, entry))
+        except queue.Full:
+            self.write(entry, plan=None)
+            return
+        self._start()
+
+    def write(self, entry, plan):
+        entry['plan'] = plan
+        self.logger.info(json.dumps(entry, default=str))
+
+    def explain(self, engine, statement, parameters):
+        # a raw DBAPI connection, so the EXPLAIN itself is not timed or logged
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            if engine.dialect.name == 'postgresql':
+                # a statement run without parameters may hold a literal %
+                cursor.execute('EXPLAIN (ANALYZE off, FORMAT JSON) ' + statement, parameters or None)
+                plan = cursor.fetchone()[0]
+            else:
+                cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+                plan = [row[-1] for row in cursor.fetchall()]
+            connection.rollback()
+            return plan
+        finally:
+            connection.close()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='slow-query-explain', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            engine, statement, parameters, entry = self.queue.get()
+            try:
+                plan = self.explain(engine, statement, parameters)
+            except Exception as e:
+                plan = {'error': str(e).strip().splitlines()[0] if str(e).strip() else type(e).__name__}
+            self.write(entry, plan)
+            self.queue.task_done()
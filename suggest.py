@@ -0,0 +1,213 @@
+import logging
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+KINDS = ('venue', 'artist', 'city', 'genre')
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+class SuggestIndex(object):
+    """A compact prefix index over short labels.
+
+    Every token of a label is indexed under each of its prefixes up to
+    ``max_prefix`` characters. Documents are numbered in insertion order and
+    stored column-wise in arrays, labels and prefixes are interned, and each
+    posting list is an ``array('I')`` of document numbers. Removed documents
+    are only marked dead; ``compacted()`` builds a copy without them.
+
+    Entries are keyed by ``(kind, key)``; ``key`` is an id, or the label for
+    kinds without one (genres).
+    """
+
+    def __init__(self, max_prefix=12, max_scan=500):
+        self.max_prefix = max_prefix
+        self.max_scan = max_scan
+        self.kinds = array('B')
+        self.ids = array('q')
+        self.labels = []
+        self.alive = bytearray()
+        self.postings = {}
+        self.docs = {}
+        self.dead = 0
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, kind, key, label):
+        doc = self.docs.get((kind, key))
+        if doc is not None:
+            if self.labels[doc] == label:
+                return
+            self.remove(kind, key)
+
+        doc = len(self.labels)
+        self.kinds.append(KINDS.index(kind))
+        self.ids.append(key if isinstance(key, int) else -1)
+        self.labels.append(sys.intern(label))
+        self.alive.append(1)
+        self.docs[(kind, key)] = doc
+
+        prefixes = set()
+        for token in tokenize(label):
+            for n in range(1, min(len(token), self.max_prefix) + 1):
+                prefixes.add(token[:n])
+        for prefix in prefixes:
+            posting = self.postings.get(prefix)
+            if posting is None:
+                posting = self.postings[sys.intern(prefix)] = array('I')
+            posting.append(doc)
+
+    def remove(self, kind, key):
+        doc = self.docs.pop((kind, key), None)
+        if doc is not None:
+            self.alive[doc] = 0
+            self.dead += 1
+
+    def compacted(self):
+        index = SuggestIndex(self.max_prefix, self.max_scan)
+        for doc in sorted(self.docs.values(), key=lambda doc: len(self.labels[doc])):
+            kind = KINDS[self.kinds[doc]]
+            key = self.ids[doc] if self.ids[doc] >= 0 else self.labels[doc]
+            index.add(kind, key, self.labels[doc])
+        return index
+
+    def _scan(self, candidates, others, tokens, limit):
+        long_tokens = [token for token in tokens if len(token) > self.max_prefix]
+        bounds = [0] * len(others)
+        matches = []
+        for doc in candidates:
+            if not self.alive[doc]:
+                continue
+            for n, posting in enumerate(others):
+                i = bounds[n] = bisect_left(posting, doc, bounds[n])
+                if i == len(posting) or posting[i] != doc:
+                    break
+            else:
+                # tokens longer than max_prefix are checked on the label
+                if long_tokens:
+                    words = tokenize(self.labels[doc])
+                    if not all(any(word.startswith(token) for word in words) for token in long_tokens):
+                        continue
+                matches.append(doc)
+                if len(matches) == limit:
+                    break
+        return matches
+
+    def search(self, query, limit=10):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        postings = []
+        for token in tokens:
+            posting = self.postings.get(token[:self.max_prefix])
+            if posting is None:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+
+        # Documents go in shortest label first when the index is built, so
+        # the first matches found are usually the best ones. Candidates come
+        # from the rarest token and, posting lists being in document order,
+        # are checked against the other tokens by bisection. When the first
+        # max_scan candidates do not yield enough matches, the rest of the
+        # lists are intersected as sets instead, which is faster for sparse
+        # matches in long lists.
+        query = query.lower().strip()
+        rarest, others = postings[0], postings[1:]
+        matches = self._scan(rarest[:self.max_scan], others, tokens, limit)
+        if len(matches) < limit and len(rarest) > self.max_scan:
+            rest = sorted(set(rarest[self.max_scan:]).intersection(*others))
+            matches += self._scan(rest, [], tokens, limit - len(matches))
+
+        matches.sort(key=lambda doc: not self.labels[doc].lower().startswith(query))
+        return [{
+            'type': KINDS[self.kinds[doc]],
+            'id': self.ids[doc] if self.ids[doc] >= 0 else None,
+            'label': self.labels[doc],
+        } for doc in matches]
+
+
+class Suggester(object):
+    """Holds the live SuggestIndex and rebuilds it without blocking readers.
+
+    ``rebuild()`` loads entries in a background thread into a fresh index.
+    Updates made meanwhile are applied to the live index and replayed onto
+    the new one before it is swapped in. Readers never take the lock.
+    """
+
+    def __init__(self, loader, max_prefix=12, max_scan=500, max_age=3600):
+        self.loader = loader
+        self.max_prefix = max_prefix
+        self.max_scan = max_scan
+        self.max_age = max_age
+        self.index = SuggestIndex(max_prefix, max_scan)
+        self.built_at = None
+        self._lock = threading.Lock()
+        self._pending = None
+
+    def search(self, query, limit=10):
+        if self.built_at is None or time.monotonic() - self.built_at > self.max_age:
+            self.rebuild()
+        return self.index.search(query, limit)
+
+    def add(self, kind, key, label):
+        with self._lock:
+            self.index.add(kind, key, label)
+            if self._pending is not None:
+                self._pending.append((True, kind, key, label))
+            self._maybe_compact()
+
+    def remove(self, kind, key):
+        with self._lock:
+            self.index.remove(kind, key)
+            if self._pending is not None:
+                self._pending.append((False, kind, key, None))
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self.index.dead > 1024 and self.index.dead > len(self.index) and self._pending is None:
+            self.index = self.index.compacted()
+
+    def rebuild(self, background=True):
+        with self._lock:
+            if self._pending is not None:
+                return
+            self._pending = []
+            self.built_at = time.monotonic()
+        if background:
+            threading.Thread(target=self._rebuild, name='suggest-rebuild', daemon=True).start()
+        else:
+            self._rebuild()
+
+    def _rebuild(self):
+        index = SuggestIndex(self.max_prefix, self.max_scan)
+        try:
+            for kind, key, label in sorted(self.loader(), key=lambda entry: len(entry[2])):
+                index.add(kind, key, label)
+        except Exception:
+            logger.exception('Rebuilding the suggest index failed')
+            with self._lock:
+                self._pending = None
+                # try again in a minute rather than after max_age
+                self.built_at = time.monotonic() - self.max_age + 60
+            return
+
+        with self._lock:
+            for added, kind, key, label in self._pending:
+                if added:
+                    index.add(kind, key, label)
+                else:
+                    index.remove(kind, key)
+            self.index = index
+            self._pending = None
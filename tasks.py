@@ -0,0 +1,189 @@
+import contextlib
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Task(object):
+    __slots__ = ('name', 'args', 'kwargs', 'attempts', 'queued_at')
+
+    def __init__(self, name, args, kwargs, queued_at):
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+        self.attempts = 0
+        self.queued_at = queued_at
+
+
+class TaskExecutor(object):
+    """Runs named tasks on a small pool of worker threads.
+
+    Functions are registered by name with ``task()`` and queued with
+    ``submit(name, *args, **kwargs)``. Keep the arguments JSON-serialisable:
+    a persistent queue offering the same two methods can then take this
+    one's place without touching the callers.
+
+    The queue holds at most ``max_queue`` tasks; when it is full the
+    submitting thread runs the task itself rather than losing it. A task that
+    raises is tried up to ``max_attempts`` times in all, ``retry_delay``
+    seconds apart and doubling, and then logged and dropped. With
+    ``workers=0`` tasks run in the submitting thread, retries included.
+
+    Workers start on first use, and again in a process forked after that.
+    Each task runs inside ``context()``, if given. ``shutdown()`` stops the
+    workers once the queued tasks have run, giving pending retries one last
+    attempt; tasks submitted later run in the caller. ``on_finish(name,
+    waited, ran, outcome)`` is called after every attempt with the seconds
+    spent queued and running, and 'ok', 'retry' or 'failed'.
+    """
+
+    def __init__(self, workers=2, max_queue=1000, max_attempts=3, retry_delay=0.5, context=None,
+                 on_finish=None, timer=time.monotonic):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.context = context or contextlib.nullcontext
+        self.on_finish = on_finish
+        self.timer = timer
+        self.tasks = {}
+        self._queue = queue.Queue(max_queue)
+        self._threads = []
+        self._retries = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._closed = False
+
+    def task(self, fn=None, name=None):
+        def register(fn):
+            self.tasks[name or fn.__name__] = fn
+            return fn
+        return register(fn) if fn is not None else register
+
+    def submit(self, name, *args, **kwargs):
+        if name not in self.tasks:
+            raise KeyError('no task named %r' % name)
+        self._put(Task(name, args, kwargs, self.timer()))
+
+    def _put(self, task):
+        if self.workers > 0 and not self._closed:
+            self._start()
+            try:
+                self._queue.put_nowait(task)
+                return
+            except queue.Full:
+                logger.warning('Task queue full; running %s in the caller', task.name)
+                if not self._run(task) and task.attempts < self.max_attempts:
+                    self._retry(task)
+                return
+
+        # no workers, or shut down: run it here, retries and all
+        while not self._run(task) and task.attempts < self.max_attempts:
+            time.sleep(self.retry_delay * 2 ** (task.attempts - 1))
+
+    def _start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # forked: the parent's workers did not come along
+                self._queue = queue.Queue(self.max_queue)
+                self._retries = {}
+            self._threads = [threading.Thread(target=self._work, name='tasks-%d' % n, daemon=True)
+                             for n in range(self.workers)]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                if not self._run(task) and task.attempts < self.max_attempts:
+                    self._retry(task)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, task):
+        # one attempt; True when the task is done with, succeeded or not
+        started = self.timer()
+        task.attempts += 1
+        try:
+            with self.context():
+                self.tasks[task.name](*task.args, **task.kwargs)
+            outcome = 'ok'
+        except Exception:
+            if task.attempts < self.max_attempts:
+                logger.warning('Task %s failed, attempt %d of %d', task.name, task.attempts, self.max_attempts,
+                               exc_info=True)
+                outcome = 'retry'
+            else:
+                logger.exception('Task %s failed, giving up after %d attempts', task.name, task.attempts)
+                outcome = 'failed'
+        if self.on_finish is not None:
+            self.on_finish(task.name, started - task.queued_at, self.timer() - started, outcome)
+        return outcome != 'retry'
+
+    def _retry(self, task):
+        if self._closed:
+            self._put(task)
+            return
+
+        def requeue():
+            with self._lock:
+                if self._retries.pop(id(task), None) is None:
+                    return
+            task.queued_at = self.timer()
+            self._put(task)
+
+        timer = threading.Timer(self.retry_delay * 2 ** (task.attempts - 1), requeue)
+        timer.daemon = True
+        with self._lock:
+            self._retries[id(task)] = (timer, task)
+        timer.start()
+
+    def stats(self):
+        return {'queued': self._queue.qsize(), 'retrying': len(self._retries), 'workers': self.workers}
+
+    def wait(self, timeout=None):
+        """Waits until nothing is queued, running or waiting to retry."""
+        deadline = None if timeout is None else self.timer() + timeout
+        while self._queue.unfinished_tasks or self._retries:
+            if deadline is not None and self.timer() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def shutdown(self, timeout=None):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            retries, self._retries = list(self._retries.values()), {}
+        if self._pid != os.getpid():
+            return
+
+        # pending retries get one more attempt now rather than none
+        for timer, task in retries:
+            timer.cancel()
+            task.attempts = max(task.attempts, self.max_attempts - 1)
+            task.queued_at = self.timer()
+            self._queue.put(task)
+        deadline = None if timeout is None else self.timer() + timeout
+        try:
+            for _ in self._threads:
+                self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0, deadline - self.timer()))
+        if any(thread.is_alive() for thread in self._threads):
+            logger.warning('Task workers still busy after %ss; %d tasks left queued', timeout, self._queue.qsize())
@@ -0,0 +1,101 @@
+import contextlib
+import threading
+import types
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+import app as fyyur
+import config
+
+
+def make_config(tmp_path, **overrides):
+  settings = {name: getattr(config, name) for name in dir(config) if name.isupper()}
+  settings.update(
+    SQLALCHEMY_DATABASE_URI='sqlite:///' + str(tmp_path / 'fyyur.db'),
+    TESTING=True,
+    # no error.log in the working tree
+    DEBUG=True,
+    WTF_CSRF_ENABLED=False,
+    CACHE_DIR=str(tmp_path / 'cache'),
+    THUMBNAIL_DIR=str(tmp_path / 'thumbnails'),
+    SLOW_QUERY_THRESHOLD_MS=None,
+    METRICS_SAMPLE_RATE=0,
+  )
+  settings.update(overrides)
+  return types.SimpleNamespace(**settings)
+
+
+@pytest.fixture
+def settings():
+  # overridden by test modules that need other settings
+  return {}
+
+
+@pytest.fixture
+def app(tmp_path, settings):
+  app = fyyur.create_app(make_config(tmp_path, **settings))
+  with app.app_context():
+    fyyur.db.create_all()
+    yield app
+    fyyur.tasks.wait(5)
+    fyyur.db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+  return app.test_client()
+
+
+@pytest.fixture
+def catalogue(app):
+  # two cities with two venues and two artists each; every artist plays
+  # each venue of their city three times before now and three times after
+  now = datetime.now().replace(microsecond=0)
+  ids = {'venues': [], 'artists': []}
+  for n in range(2):
+    location = fyyur.Locations(city=f'City {n}', state='CA')
+    fyyur.session.add(location)
+    fyyur.session.flush()
+    venues = [fyyur.Venue(name=f'Venue {n}{m}', address='1 Main St', phone='555-0100', location_id=location.id,
+                          image_link=f'https://example.com/venue{n}{m}.jpg') for m in range(2)]
+    artists = [fyyur.Artist(name=f'Artist {n}{m}', phone='555-0100', location_id=location.id,
+                            image_link=f'https://example.com/artist{n}{m}.jpg') for m in range(2)]
+    fyyur.session.add_all(venues + artists)
+    fyyur.session.flush()
+    for venue in venues:
+      fyyur.set_genres(fyyur.Venue, venue.id, ['Jazz', 'Folk'], replace=False)
+      ids['venues'].append(venue.id)
+    for artist in artists:
+      fyyur.set_genres(fyyur.Artist, artist.id, ['Jazz'], replace=False)
+      ids['artists'].append(artist.id)
+      for venue in venues:
+        for days in (-30, -20, -10, 10, 20, 30):
+          fyyur.session.add(fyyur.Shows(artist_id=artist.id, venue_id=venue.id,
+                                        start_time=now + timedelta(days=days, hours=artist.id)))
+  fyyur.session.flush()
+  fyyur.rebuild_upcoming(fyyur.Venue)
+  fyyur.rebuild_upcoming(fyyur.Artist)
+  fyyur.session.commit()
+  return ids
+
+
+@pytest.fixture
+def statements(app):
+  # statements(): a context that collects the SQL this thread runs inside
+  # it; the suggest index is rebuilt in a thread of its own
+  @contextlib.contextmanager
+  def collect():
+    collected, thread = [], threading.get_ident()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+      if threading.get_ident() == thread:
+        collected.append(statement)
+    engine = fyyur.db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+      yield collected
+    finally:
+      event.remove(engine, 'before_cursor_execute', record)
+  return collect
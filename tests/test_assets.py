@@ -0,0 +1,66 @@
+import gzip
+import hashlib
+import json
+
+import flask
+import pytest
+
+import assets
+
+brotli = pytest.importorskip('brotli')
+pytest.importorskip('rcssmin')
+pytest.importorskip('rjsmin')
+
+BUNDLES = {'site.css': ['css/a.css', 'css/b.css'], 'site.js': ['js/a.js', 'js/b.js']}
+
+SOURCES = {
+  'css/a.css': '/* layout */\nbody {\n  margin : 0 ;\n  background: url("../img/bg.png");\n}\n',
+  'css/b.css': 'h1   {\n  color: red;\n}\n',
+  'js/a.js': '// says hello\nfunction hello ( name ) {\n  return "hello " + name;\n}\n',
+  'js/b.js': '/* the answer */\nvar answer = 42\n',
+}
+
+
+@pytest.fixture
+def static(tmp_path):
+  for name, text in SOURCES.items():
+    path = tmp_path / name
+    path.parent.mkdir(exist_ok=True)
+    path.write_text(text, encoding='utf-8')
+  return tmp_path
+
+
+def test_build_writes_hashed_minified_compressed_bundles(static):
+  manifest = assets.Assets(str(static), bundles=BUNDLES).build()
+  assert json.loads((static / 'dist' / 'manifest.json').read_text()) == manifest
+  assert sorted(manifest) == ['site.css', 'site.js']
+
+  for name, filename in manifest.items():
+    content = (static / 'dist' / filename).read_bytes()
+    stem, ext = name.split('.')
+    assert filename == f'{stem}.{hashlib.sha256(content).hexdigest()[:12]}.{ext}'
+    assert gzip.decompress((static / 'dist' / (filename + '.gz')).read_bytes()) == content
+    assert brotli.decompress((static / 'dist' / (filename + '.br')).read_bytes()) == content
+
+  # comments and spacing gone, the url() still relative to the bundle
+  css = (static / 'dist' / manifest['site.css']).read_text()
+  assert 'body{margin:0;background:url("../img/bg.png")}' in css
+  assert 'h1{color:red}' in css
+  assert '/*' not in css and '  ' not in css
+  js = (static / 'dist' / manifest['site.js']).read_text()
+  assert 'function hello(name){return"hello "+name' in js
+  assert 'var answer=42' in js
+  assert '//' not in js and '/*' not in js
+
+
+def test_send_picks_the_best_encoding(static):
+  bundles = assets.Assets(str(static), bundles=BUNDLES)
+  filename = bundles.build()['site.js']
+  app = flask.Flask(__name__)
+  for accept, encoding in (('gzip, deflate, br', 'br'), ('gzip', 'gzip'), ('identity', None)):
+    with app.test_request_context(headers={'Accept-Encoding': accept}):
+      response = bundles.send(filename)
+      assert response.headers.get('Content-Encoding') == encoding
+      assert response.headers['Vary'] == 'Accept-Encoding'
+      assert 'immutable' in response.headers['Cache-Control']
+      response.close()
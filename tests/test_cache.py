@@ -0,0 +1,109 @@
+import os
+
+import pytest
+
+import app as fyyur
+from cache import FileSystemCache, InvalidationLog, LRUCache
+
+
+def test_invalidations_reach_other_readers(tmp_path):
+  path = str(tmp_path / 'entities.invalidations')
+  writer, reader = InvalidationLog(path), InvalidationLog(path)
+  writer.publish([('venue', 1), ('artist', 2)])
+  assert reader.poll() == [('venue', 1), ('artist', 2)]
+  assert reader.poll() == []
+
+
+def test_reader_behind_a_rotation_drops_everything(tmp_path):
+  path = str(tmp_path / 'entities.invalidations')
+  writer, reader = InvalidationLog(path), InvalidationLog(path)
+  writer.publish([('venue', 1)])
+  assert reader.poll() == [('venue', 1)]
+  size = os.path.getsize(path)
+
+  # the log rotates past the reader and grows back to the size it last saw:
+  # the line it missed must not pass for no change
+  InvalidationLog(path, max_bytes=size).publish([('venue', 3)])
+  writer.publish([('venue', 2)])
+  assert os.path.getsize(path) == size
+  assert reader.poll() == [InvalidationLog.RESET]
+  writer.publish([('venue', 4)])
+  assert reader.poll() == [('venue', 4)]
+
+
+def test_reader_behind_a_truncation_drops_everything(tmp_path):
+  path = str(tmp_path / 'entities.invalidations')
+  writer, reader = InvalidationLog(path), InvalidationLog(path)
+  writer.publish([('venue', 1)])
+  reader.poll()
+  with open(path, 'rb+') as f:
+    f.truncate(len(f.readline()))
+  assert reader.poll() == [InvalidationLog.RESET]
+
+
+def test_cache_behind_a_rotation_is_cleared(tmp_path):
+  path = str(tmp_path / 'entities.invalidations')
+  cache = LRUCache(invalidation_log=InvalidationLog(path))
+  cache.set(('venue', 1), 'Venue 1')
+  cache.set(('venue', 2), 'Venue 2')
+  InvalidationLog(path, max_bytes=0).publish([('venue', 1)])
+  assert cache.get(('venue', 2)) is None
+  assert len(cache) == 0
+
+
+@pytest.mark.parametrize('make', [
+  lambda tmp_path: LRUCache(),
+  lambda tmp_path: LRUCache(invalidation_log=InvalidationLog(str(tmp_path / 'entities.invalidations'))),
+  lambda tmp_path: FileSystemCache(str(tmp_path / 'entities')),
+])
+def test_value_built_across_a_delete_is_not_stored(tmp_path, make):
+  cache = make(tmp_path)
+  version = cache.version()
+  cache.delete(('venue', 1))
+  cache.set(('venue', 1), 'stale', since=version)
+  cache.set(('venue', 2), 'Venue 2', since=version)
+  assert cache.get(('venue', 1)) is None
+  assert cache.get(('venue', 2)) == 'Venue 2'
+
+  # built after the delete
+  if isinstance(cache, FileSystemCache):
+    os.utime(cache._path(('venue', 1), '.deleted'), ns=(0, 0))
+  cache.set(('venue', 1), 'Venue 1', since=cache.version())
+  assert cache.get(('venue', 1)) == 'Venue 1'
+
+
+def test_delete_in_another_worker_is_seen_by_set(tmp_path):
+  path = str(tmp_path / 'entities.invalidations')
+  cache = LRUCache(invalidation_log=InvalidationLog(path))
+  version = cache.version()
+  InvalidationLog(path).publish([('venue', 1)])
+  cache.set(('venue', 1), 'stale', since=version)
+  assert len(cache) == 0
+
+
+def test_forgotten_deletes_still_count():
+  cache = LRUCache(maxsize=2)
+  version = cache.version()
+  cache.delete(('venue', 1), ('venue', 2), ('venue', 3))
+  cache.set(('venue', 1), 'stale', since=version)
+  assert len(cache) == 0
+  cache.clear()
+  cache.set(('venue', 4), 'stale', since=version)
+  assert len(cache) == 0
+
+
+def test_views_invalidated_while_built_are_not_cached(app, catalogue, monkeypatch):
+  venue = catalogue['venues'][0]
+  build = fyyur.build_venue_view
+
+  def build_then_invalidate(venue_id):
+    details = build(venue_id)
+    fyyur.invalidate_entities(venue_ids=[venue_id])
+    return details
+  monkeypatch.setattr(fyyur, 'build_venue_view', build_then_invalidate)
+  assert fyyur.venue_view(venue)['id'] == venue
+  assert fyyur.entity_cache.get(('venue', venue)) is None
+
+  monkeypatch.setattr(fyyur, 'build_venue_view', build)
+  fyyur.venue_view(venue)
+  assert fyyur.entity_cache.get(('venue', venue))['id'] == venue
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta, timezone
+
+import app as fyyur
+
+
+def drift():
+  return fyyur.upcoming_drift(fyyur.Venue) + fyyur.upcoming_drift(fyyur.Artist)
+
+
+def upcoming(model, id):
+  return fyyur.session.query(model.upcoming_shows_count).filter(model.id == id).scalar()
+
+
+def test_counters_match_shows(catalogue):
+  assert drift() == []
+  assert upcoming(fyyur.Venue, catalogue['venues'][0]) == 6
+
+
+def test_no_drift_after_deleting_a_venue(client, catalogue):
+  venue = catalogue['venues'][0]
+  assert client.delete(f'/venues/{venue}').get_json() == {'success': True}
+  assert fyyur.session.query(fyyur.Venue).get(venue) is None
+  assert drift() == []
+  assert upcoming(fyyur.Artist, catalogue['artists'][0]) == 3
+
+
+def test_no_drift_after_batch_deletes(client, catalogue):
+  response = client.post('/api/v1/delete', json={'artist_ids': [catalogue['artists'][1]]})
+  assert response.get_json()['deleted'] == {'shows': 12, 'venues': 0, 'artists': 1}
+  assert drift() == []
+  assert upcoming(fyyur.Venue, catalogue['venues'][0]) == 3
+
+  shows_before = (datetime.now() - timedelta(days=15)).isoformat()
+  response = client.post('/api/v1/delete', json={'shows_before': shows_before})
+  assert response.status_code == 200
+  assert drift() == []
+
+
+def test_no_drift_after_a_roll(catalogue):
+  fyyur.roll_upcoming(datetime.now() + timedelta(days=15))
+  fyyur.session.commit()
+  assert drift() == []
+  assert upcoming(fyyur.Venue, catalogue['venues'][0]) == 4
+
+
+def test_counters_check_command(app, catalogue):
+  runner = app.test_cli_runner()
+  assert runner.invoke(args=['counters', 'check']).exit_code == 0
+
+  fyyur.session.query(fyyur.Venue).filter(fyyur.Venue.id == catalogue['venues'][0]).\
+                update({fyyur.Venue.upcoming_shows_count: 99}, synchronize_session=False)
+  fyyur.session.commit()
+  result = runner.invoke(args=['counters', 'check'])
+  assert result.exit_code == 1
+  assert f"Venue {catalogue['venues'][0]}: 99 counted, 6 in Shows" in result.output
+  assert runner.invoke(args=['counters', 'check', '--fix']).exit_code == 0
+  assert drift() == []
+
+
+def test_batch_delete_takes_a_time_with_an_offset(client, catalogue):
+  # 15 days ago, written as UTC: the shows 20 and 30 days ago go
+  shows_before = (datetime.now(timezone.utc) - timedelta(days=15)).isoformat()
+  response = client.post('/api/v1/delete', json={'shows_before': shows_before})
+  assert response.status_code == 200
+  assert response.get_json()['deleted']['shows'] == 16
+
+  shows_after = (datetime.now(timezone.utc) + timedelta(days=1)).isoformat()
+  assert client.post('/api/v1/delete', json={'shows_before': shows_after}).status_code == 400
@@ -0,0 +1,23 @@
+from datetime import datetime
+
+import babel.dates
+import pytest
+
+import app as fyyur
+
+START_TIME = datetime(2030, 5, 17, 21, 30)
+
+
+@pytest.mark.parametrize('format', ['short', 'long'])
+def test_named_formats_are_the_locales(format):
+  expected = babel.dates.format_datetime(START_TIME, format, locale=fyyur.datetime_locale())
+  assert fyyur.format_datetime(START_TIME, format) == expected
+  # not the name read as a pattern: 'short' used to come out as '09ort'
+  assert format[2:] not in fyyur.format_datetime(START_TIME, format)
+
+
+def test_app_formats_and_patterns():
+  assert fyyur.format_datetime(START_TIME, 'full') == 'Friday May, 17, 2030 at 9:30PM'
+  assert fyyur.format_datetime(START_TIME) == 'Fri 05, 17, 2030 9:30PM'
+  assert fyyur.format_datetime(START_TIME, 'yyyy-MM-dd') == '2030-05-17'
+  assert fyyur.format_datetime('2030-05-17 21:30', 'HH:mm') == '21:30'
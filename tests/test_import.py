@@ -0,0 +1,38 @@
+import json
+
+import app as fyyur
+
+
+def write_jsonl(path, records):
+  path.write_text(''.join(json.dumps(record) + '\n' for record in records), encoding='utf-8')
+  return str(path)
+
+
+def test_import_skips_what_is_already_there(app, catalogue, tmp_path, statements):
+  runner = app.test_cli_runner()
+  venues = write_jsonl(tmp_path / 'venues.jsonl', [
+    {'name': '100% Jazz', 'phone': '555-0100', 'address': '1 Main St', 'city': 'City 0', 'state': 'CA',
+     'genres': ['Jazz', 'Blues']},
+    {'name': 'Venue 00', 'phone': '555-0100', 'address': '1 Main St', 'city': 'City 0', 'state': 'CA',
+     'genres': ['Jazz']},
+    {'name': '100% Jazz', 'phone': '555-0100', 'address': '1 Main St', 'city': 'City 0', 'state': 'CA'},
+  ])
+  with statements() as run:
+    result = runner.invoke(args=['import', 'venues', venues])
+  assert result.exit_code == 0, result.output
+  assert any(statement.lstrip().upper().startswith('INSERT') for statement in run)
+
+  venue, = fyyur.session.query(fyyur.Venue.id).filter(fyyur.Venue.name == '100% Jazz').one()
+  genres = fyyur.session.query(fyyur.Genre.name).join(fyyur.VenueGenres).\
+                filter(fyyur.VenueGenres.c.venue_id == venue)
+  assert sorted(name for name, in genres) == ['Blues', 'Jazz']
+  assert fyyur.session.query(fyyur.Venue).count() == 5
+
+  shows = write_jsonl(tmp_path / 'shows.jsonl', [
+    {'artist_name': 'Artist 00', 'venue_name': '100% Jazz', 'start_time': '2030-05-17T20:30:00'},
+    {'artist_id': catalogue['artists'][0], 'venue_id': venue, 'start_time': '2030-05-17T20:30:00'},
+  ])
+  result = runner.invoke(args=['import', 'shows', shows])
+  assert result.exit_code == 0, result.output
+  assert fyyur.session.query(fyyur.Shows).filter(fyyur.Shows.venue_id == venue).count() == 1
+  assert fyyur.session.query(fyyur.Venue.upcoming_shows_count).filter(fyyur.Venue.id == venue).scalar() == 1
@@ -0,0 +1,75 @@
+import pytest
+
+import app as fyyur
+from metrics import Metrics
+
+
+@pytest.fixture
+def settings():
+  # every request sampled
+  return {'METRICS_SAMPLE_RATE': 1}
+
+
+class Clock(object):
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+
+def test_render_writes_histograms_and_counters():
+  clock = Clock()
+  metrics = Metrics(buckets=(0.01, 0.1), timer=clock)
+  for elapsed, statements in ((0.005, 2), (0.05, 1)):
+    metrics.start()
+    for n in range(statements):
+      metrics.statement_started()
+      clock.now += 0.001
+      metrics.statement_finished()
+    clock.now += elapsed - statements * 0.001
+    metrics.finish('venues.venues')
+  metrics.task_finished('make_thumbnails', 0.002, 0.5, 'ok')
+
+  lines = metrics.render().splitlines()
+  assert '# TYPE fyyur_request_duration_seconds histogram' in lines
+  assert 'fyyur_request_duration_seconds_bucket{endpoint="venues.venues",le="0.01"} 1' in lines
+  assert 'fyyur_request_duration_seconds_bucket{endpoint="venues.venues",le="0.1"} 2' in lines
+  assert 'fyyur_request_duration_seconds_bucket{endpoint="venues.venues",le="+Inf"} 2' in lines
+  assert 'fyyur_request_duration_seconds_count{endpoint="venues.venues"} 2' in lines
+  assert 'fyyur_sql_statements_total{endpoint="venues.venues"} 3' in lines
+  db_time, = [line.split()[1] for line in lines if line.startswith('fyyur_db_seconds_total{endpoint="venues.venues"}')]
+  assert float(db_time) == pytest.approx(0.003)
+  assert 'fyyur_task_duration_seconds_bucket{task="make_thumbnails",le="+Inf"} 1' in lines
+  assert 'fyyur_task_attempts_total{task="make_thumbnails",outcome="ok"} 1' in lines
+
+
+def test_unsampled_requests_are_not_counted():
+  metrics = Metrics(sample_rate=0)
+  assert metrics.start() is False
+  metrics.statement_started()
+  metrics.statement_finished()
+  assert metrics.finish('venues.venues') is None
+  assert 'endpoint=' not in metrics.render()
+
+
+def test_labels_are_escaped():
+  metrics = Metrics()
+  metrics.start()
+  metrics.finish('say "hi"\\\n')
+  assert 'fyyur_sql_statements_total{endpoint="say \\"hi\\"\\\\\\n"} 0' in metrics.render()
+
+
+def test_metrics_count_statements_per_endpoint(client, catalogue, statements):
+  with statements() as run:
+    client.get('/venues').get_data()
+  client.get('/venues').get_data()
+  client.get(f"/venues/{catalogue['venues'][0]}")
+
+  body = client.get('/metrics').get_data(as_text=True)
+  lines = body.splitlines()
+  assert f'fyyur_sql_statements_total{{endpoint="venues.venues"}} {2 * len(run)}' in lines
+  assert 'fyyur_request_duration_seconds_count{endpoint="venues.venues"} 2' in lines
+  assert 'fyyur_request_duration_seconds_count{endpoint="venues.show_venue"} 1' in lines
+  assert '# TYPE fyyur_cache_hits_total counter' in lines
+  assert '# TYPE fyyur_task_queue_depth gauge' in lines
@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as fyyur
+
+# statements per request, however many rows the pages list
+STATEMENTS = [
+  # the validators, then the page and its genre facets
+  ('/venues', 3),
+  ('/artists', 3),
+  ('/shows', 2),
+  # uncached; the view models then come from the entity cache
+  ('/venues/{venue}', 4),
+  ('/artists/{artist}', 4),
+]
+
+
+def add_city(n):
+  # another city's worth of venues, artists and shows
+  location = fyyur.Locations(city=f'More {n}', state='NY')
+  fyyur.session.add(location)
+  fyyur.session.flush()
+  venue = fyyur.Venue(name=f'More Venue {n}', address='2 Main St', phone='555-0101', location_id=location.id)
+  artist = fyyur.Artist(name=f'More Artist {n}', phone='555-0101', location_id=location.id)
+  fyyur.session.add_all([venue, artist])
+  fyyur.session.flush()
+  fyyur.set_genres(fyyur.Venue, venue.id, ['Jazz'], replace=False)
+  for days in range(-5, 5):
+    start_time = datetime.now() + timedelta(days=days)
+    fyyur.session.add(fyyur.Shows(artist_id=artist.id, venue_id=venue.id, start_time=start_time))
+    fyyur.count_upcoming([(venue.id, artist.id, start_time)])
+  fyyur.session.commit()
+
+
+@pytest.mark.parametrize('url, expected', STATEMENTS)
+def test_statement_count(client, catalogue, statements, url, expected):
+  url = url.format(venue=catalogue['venues'][0], artist=catalogue['artists'][0])
+  # streamed pages run their SQL as the body is read
+  with statements() as run:
+    response = client.get(url)
+    response.get_data()
+  assert response.status_code == 200
+  assert len(run) == expected
+
+  for n in range(3):
+    add_city(n)
+  fyyur.invalidate_entities(venue_ids=catalogue['venues'], artist_ids=catalogue['artists'])
+  with statements() as run:
+    response = client.get(url)
+    response.get_data()
+  assert response.status_code == 200
+  assert len(run) == expected
+
+
+@pytest.mark.parametrize('kind', ['venues', 'artists'])
+def test_cached_detail_page_runs_no_sql(client, catalogue, statements, kind):
+  url = f'/{kind}/{catalogue[kind][0]}'
+  client.get(url)
+  with statements() as run:
+    assert client.get(url).status_code == 200
+  assert run == []
+
+
+@pytest.mark.parametrize('url', ['/venues', '/artists', '/shows', '/venues/{venue}', '/artists/{artist}',
+                                 '/api/v1/venues/{venue}'])
+def test_conditional_get(client, catalogue, url):
+  url = url.format(venue=catalogue['venues'][0], artist=catalogue['artists'][0])
+  response = client.get(url)
+  etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+  assert response.headers['Cache-Control'] == 'no-cache'
+
+  response = client.get(url, headers={'If-None-Match': etag})
+  assert response.status_code == 304
+  assert response.data == b''
+  assert client.get(url, headers={'If-Modified-Since': last_modified}).status_code == 304
+  assert client.get(url, headers={'If-None-Match': '"other"'}).status_code == 200
+
+
+@pytest.mark.parametrize('url', ['/venues', '/shows', '/venues/{venue}', '/artists/{artist}'])
+def test_edit_changes_etag(client, catalogue, url):
+  venue, artist = catalogue['venues'][0], catalogue['artists'][0]
+  url = url.format(venue=venue, artist=artist)
+  etag = client.get(url).headers['ETag']
+
+  client.post(f'/venues/{venue}/edit', data={
+    'name': 'Renamed Venue', 'address': '1 Main St', 'phone': '555-0100', 'city': 'City 0', 'state': 'CA',
+    'genres': ['Jazz'], 'website': '', 'facebook_link': ''})
+  fyyur.tasks.wait(5)
+  response = client.get(url, headers={'If-None-Match': etag})
+  assert response.status_code == 200
+  assert response.headers['ETag'] != etag
+
+
+@pytest.mark.parametrize('url', ['/venues', '/artists', '/shows'])
+def test_not_modified_listing_runs_one_statement(client, catalogue, statements, url):
+  etag = client.get(url).headers['ETag']
+  with statements() as run:
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+  assert len(run) == 1
+
+
+def test_shows_page_streams(client, catalogue):
+  response = client.get('/shows?limit=5')
+  assert response.is_streamed
+  # the link to the next page is set once the page has streamed
+  assert b'&amp;limit=5"><button' in response.data
+
+
+def backdate():
+  # everything last changed an hour ago, so a change now is a later second
+  an_hour_ago = datetime.utcnow() - timedelta(hours=1)
+  for model in (fyyur.Venue, fyyur.Artist, fyyur.Shows, fyyur.Watermark):
+    column = model.value if model is fyyur.Watermark else model.updated_at
+    query = fyyur.session.query(model)
+    if model is fyyur.Watermark:
+      query = query.filter(model.name == fyyur.DELETED)
+    query.update({column: an_hour_ago}, synchronize_session=False)
+  fyyur.session.commit()
+
+
+@pytest.mark.parametrize('url', ['/venues', '/artists', '/shows'])
+def test_deleting_a_listing_advances_last_modified(client, catalogue, url):
+  backdate()
+  response = client.get(url)
+  etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+
+  assert client.delete(f"/venues/{catalogue['venues'][1]}").get_json() == {'success': True}
+  assert client.get(url, headers={'If-None-Match': etag}).status_code == 200
+  assert client.get(url, headers={'If-Modified-Since': last_modified}).status_code == 200
+
+
+@pytest.mark.parametrize('url', ['/venues/{venue}', '/artists/{artist}'])
+def test_deleting_past_shows_advances_last_modified(client, catalogue, url):
+  backdate()
+  url = url.format(venue=catalogue['venues'][0], artist=catalogue['artists'][0])
+  last_modified = client.get(url).headers['Last-Modified']
+
+  shows_before = (datetime.now() - timedelta(days=15)).isoformat()
+  assert client.post('/api/v1/delete', json={'shows_before': shows_before}).status_code == 200
+  fyyur.tasks.wait(5)
+  assert client.get(url, headers={'If-Modified-Since': last_modified}).status_code == 200
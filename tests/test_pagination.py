@@ -0,0 +1,72 @@
+from datetime import datetime
+
+import pytest
+
+import app as fyyur
+
+
+def test_cursor_round_trip():
+  start_time = datetime(2030, 5, 17, 20, 30, 0, 123456)
+  assert fyyur.decode_cursor(fyyur.encode_cursor(start_time, 7)) == (start_time, 7)
+  assert fyyur.decode_cursor(fyyur.encode_cursor(start_time, 7, 12), ids=2) == (start_time, 7, 12)
+
+
+def test_api_shows_pages_through_every_show_once(client, catalogue):
+  expected = fyyur.session.query(fyyur.Shows).count()
+  seen, url = [], '/api/v1/shows?limit=7&fields=start_time,artist_id,venue_id'
+  while url:
+    body = client.get(url).get_json()
+    seen += [(show['start_time'], show['artist_id'], show['venue_id']) for show in body['data']]
+    url = body['next_cursor'] and f"/api/v1/shows?limit=7&fields=start_time,artist_id,venue_id&after={body['next_cursor']}"
+  assert len(seen) == expected
+  assert seen == sorted(set(seen))
+
+
+def test_venue_shows_pages_follow_on(client, catalogue, app):
+  # a venue page lists the first SHOWS_PER_SECTION shows; the tiles that
+  # follow pick up where it stopped
+  app.config['SHOWS_PER_SECTION'] = 2
+  venue = catalogue['venues'][0]
+  details = fyyur.venue_view(venue)
+  assert len(details['past_shows']) == 2
+
+  fyyur.session.remove()
+  with app.test_request_context():
+    shows, cursor, _ = fyyur.venue_show_section(venue, datetime.now(), upcoming=False,
+                                                after=details['past_shows_cursor'])
+  listed = [(show['start_time'], show['artist_id']) for show in details['past_shows'] + shows]
+  assert len(set(listed)) == 4
+  assert listed == sorted(listed, reverse=True)
+  assert client.get(f'/venues/{venue}/shows/past?after={details["past_shows_cursor"]}').status_code == 200
+
+
+BAD_CURSORS = [
+  'yesterday',
+  # the start time alone, or with too many ids
+  '2030-05-17T20:30:00.000000',
+  '2030-05-17T20:30:00.000000_1_2_3',
+  '2030-05-17T20:30:00.000000_x_1',
+  '2030-05-17T20:30:00.000000_-1_1',
+  '2030-05-17T20:30:00.000000_99999999999999999999_1',
+  '2030-13-17T20:30:00.000000_1_1',
+]
+
+
+@pytest.mark.parametrize('cursor', BAD_CURSORS)
+@pytest.mark.parametrize('url', ['/shows?after={cursor}', '/venues/{venue}/shows/past?after={cursor}',
+                                 '/artists/{artist}/shows/upcoming?after={cursor}', '/api/v1/shows?after={cursor}'])
+def test_malformed_cursor_is_a_bad_request(client, catalogue, url, cursor):
+  url = url.format(cursor=cursor, venue=catalogue['venues'][0], artist=catalogue['artists'][0])
+  assert client.get(url).status_code == 400
+
+
+@pytest.mark.parametrize('url', ['/venues/999999/shows/past', '/artists/999999/shows/upcoming'])
+def test_show_tiles_of_a_missing_listing_are_not_found(client, catalogue, url):
+  assert client.get(url).status_code == 404
+
+
+def test_show_tiles_of_a_listing_without_shows(client, catalogue):
+  fyyur.session.query(fyyur.Shows).filter(fyyur.Shows.venue_id == catalogue['venues'][0]).delete()
+  fyyur.session.commit()
+  response = client.get(f"/venues/{catalogue['venues'][0]}/shows/upcoming")
+  assert response.status_code == 200
@@ -0,0 +1,64 @@
+import sqlite3
+import threading
+
+import pytest
+from sqlalchemy import exc
+
+from metrics import Metrics
+from pool import MeteredQueuePool
+
+
+def make_pool(**kwargs):
+  return MeteredQueuePool(lambda: sqlite3.connect(':memory:', check_same_thread=False), **kwargs)
+
+
+def test_checkouts_are_counted_and_timed():
+  pool = make_pool(pool_size=2, max_overflow=0)
+  first, second = pool.connect(), pool.connect()
+  assert pool.stats() == {'size': 2, 'max_overflow': 0, 'open': 2, 'checked_out': 2,
+                          'checkouts': 2, 'waits': 0, 'timeouts': 0}
+  first.close()
+  second.close()
+  pool.connect().close()
+  assert pool.stats()['checkouts'] == 3
+  assert pool.stats()['open'] == 2 and pool.stats()['checked_out'] == 0
+  assert pool.checkout_time.count == 3
+
+
+def test_a_checkout_that_times_out():
+  pool = make_pool(pool_size=1, max_overflow=0, timeout=0.05)
+  held = pool.connect()
+  with pytest.raises(exc.TimeoutError):
+    pool.connect()
+  assert (pool.checkouts, pool.waits, pool.timeouts) == (1, 1, 1)
+  held.close()
+
+
+def test_a_checkout_that_waits_for_a_connection():
+  pool = make_pool(pool_size=1, max_overflow=0, timeout=5)
+  held = pool.connect()
+  threading.Timer(0.05, held.close).start()
+  pool.connect().close()
+  assert (pool.checkouts, pool.waits, pool.timeouts) == (2, 1, 0)
+  # the time spent waiting is in the histogram
+  assert pool.checkout_time.sum >= 0.05
+
+
+def test_overflow_connections_do_not_wait():
+  pool = make_pool(pool_size=1, max_overflow=1)
+  connections = [pool.connect(), pool.connect()]
+  assert pool.stats()['open'] == 2 and pool.waits == 0
+  for connection in connections:
+    connection.close()
+
+
+def test_pool_metrics():
+  pool = make_pool(pool_size=1, max_overflow=0)
+  pool.connect().close()
+  metrics = Metrics()
+  metrics.add_pool('default', lambda: pool)
+  lines = metrics.render().splitlines()
+  assert 'fyyur_db_pool_checkouts_total{pool="default"} 1' in lines
+  assert 'fyyur_db_pool_size{pool="default"} 1' in lines
+  assert 'fyyur_db_pool_checked_out{pool="default"} 0' in lines
+  assert 'fyyur_db_pool_checkout_seconds_count{pool="default"} 1' in lines
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as fyyur
+
+
+def book(client, catalogue, **form):
+  form = dict({'artist_id': catalogue['artists'][0], 'venue_id': catalogue['venues'][0],
+               'start_time': '2031-01-07 20:00:00', 'until': '2031-02-04', 'every': '1'}, **form)
+  return client.post('/shows/residency', data=form)
+
+
+def test_residency_books_every_week(client, catalogue):
+  response = book(client, catalogue)
+  assert response.status_code == 200
+  assert b'5 Shows Booked' in response.data
+
+
+def test_residency_times_stop_at_the_limit():
+  first = datetime(2031, 1, 7, 20)
+  assert len(fyyur.residency_times(first, datetime.max.date(), 4, limit=3)) == 3
+  # the last date there is ends the run instead of overflowing
+  last = datetime.max - timedelta(days=3)
+  assert fyyur.residency_times(last, datetime.max.date(), 1, limit=10) == [last]
+
+
+def test_residency_over_the_cap_is_refused(app, client, catalogue):
+  app.config['RESIDENCY_MAX_SHOWS'] = 4
+  response = book(client, catalogue)
+  assert response.status_code == 400
+  assert b'from 1 to 4 shows' in response.data
+  assert fyyur.session.query(fyyur.Shows).filter(fyyur.Shows.start_time >= datetime(2031, 1, 1)).count() == 0
+
+
+def test_residency_far_until_is_refused(client, catalogue):
+  response = book(client, catalogue, until='9999-12-31')
+  assert response.status_code == 400
+  assert b'from 1 to 104 shows' in response.data
+
+
+@pytest.mark.parametrize('every', ['3', '0', '-1', '1000000000', 'weekly'])
+def test_residency_other_weeks_are_refused(client, catalogue, every):
+  response = book(client, catalogue, every=every)
+  assert response.status_code == 400
+  assert b'weeks between shows' in response.data
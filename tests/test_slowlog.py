@@ -0,0 +1,115 @@
+import datetime
+import decimal
+import json
+import os
+
+import pytest
+
+import app as fyyur
+from slowlog import SlowQueryLog, redact
+
+VENUES = [
+  {'name': "Mo's Jazz Cellar", 'phone': '555-0199', 'address': '9 Hidden Lane', 'city': 'City 0', 'state': 'CA',
+   'genres': ['Jazz']},
+]
+
+
+@pytest.fixture
+def threshold():
+  # every statement is slow
+  return 0
+
+
+@pytest.fixture
+def settings(tmp_path, threshold):
+  return {'SLOW_QUERY_THRESHOLD_MS': threshold, 'SLOW_QUERY_LOG': str(tmp_path / 'slow_queries.jsonl')}
+
+
+def read_log(app):
+  fyyur.slow_queries.queue.join()
+  with open(app.config['SLOW_QUERY_LOG'], encoding='utf-8') as f:
+    return [json.loads(line) for line in f]
+
+
+def test_imported_rows_are_not_logged(app, catalogue, tmp_path):
+  path = tmp_path / 'venues.jsonl'
+  path.write_text(''.join(json.dumps(venue) + '\n' for venue in VENUES), encoding='utf-8')
+  result = app.test_cli_runner().invoke(args=['import', 'venues', str(path)])
+  assert result.exit_code == 0, result.output
+
+  entries = read_log(app)
+  assert any(entry['statement'].lstrip().startswith('INSERT') for entry in entries)
+  text = json.dumps(entries)
+  for value in ("Jazz Cellar", '555-0199', 'Hidden Lane'):
+    assert value not in text
+
+
+def test_literal_statements_are_redacted(tmp_path):
+  # how a Postgres import sends its batch: the values quoted into the text
+  path = tmp_path / 'slow.jsonl'
+  log = SlowQueryLog(str(path), 0)
+  statement = ('INSERT INTO "Venue" (name, phone, location_id) VALUES '
+               "('Mo''s Jazz Cellar', '555-0199', 7), (E'Back\\\\slash', '555-0198', 8) RETURNING name, id")
+  log.record(None, statement, {}, 0.5)
+  log.queue.join()
+
+  entry, = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+  assert entry['statement'] == ('INSERT INTO "Venue" (name, phone, location_id) VALUES '
+                                "('<str:17>', '<str:8>', 7), ('<str:12>', '<str:8>', 8) RETURNING name, id")
+  assert entry['parameters'] == {}
+
+
+def test_redact_keeps_shape_not_text():
+  when = datetime.datetime(2030, 5, 17, 20, 30)
+  assert redact({'name': 'Blue Note', 'id': 7, 'when': when, 'rate': decimal.Decimal('1.5'), 'ok': True,
+                 'gone': None, 'photo': b'\x89PNG', 'ids': (1, 'two')}) == {
+    'name': '<str:9>', 'id': 7, 'when': '2030-05-17 20:30:00', 'rate': decimal.Decimal('1.5'), 'ok': True,
+    'gone': None, 'photo': '<bytes:4>', 'ids': [1, '<str:3>']}
+  assert redact(object()) == '<object>'
+
+
+def test_slow_statements_are_logged_with_a_plan(app, client, catalogue):
+  client.get('/venues?genre=Jazz').get_data()
+  entries = [entry for entry in read_log(app) if entry.get('endpoint') == 'venues.venues']
+  assert entries
+  for entry in entries:
+    assert entry['method'] == 'GET' and entry['path'] == '/venues'
+    assert entry['duration_ms'] >= 0
+    assert 'error' not in (entry['plan'] or {})
+  assert '<str:4>' in json.dumps([entry['parameters'] for entry in entries])
+  assert 'Jazz' not in json.dumps([entry['parameters'] for entry in entries])
+
+
+def test_executemany_logs_the_count_and_the_first_row(tmp_path):
+  path = tmp_path / 'slow.jsonl'
+  log = SlowQueryLog(str(path), 0)
+  log.record(None, 'INSERT INTO "Genre" (name) VALUES (?)', [('Jazz',), ('Folk',)], 0.5, executemany=True)
+  entry = json.loads(path.read_text(encoding='utf-8'))
+  assert entry['executemany'] == 2
+  assert entry['parameters'] == ['<str:4>']
+  assert entry['plan'] is None
+
+
+def test_a_full_queue_writes_without_a_plan(tmp_path):
+  path = tmp_path / 'slow.jsonl'
+  log = SlowQueryLog(str(path), 0, queue_size=1)
+  log._start = lambda: None
+  for n in range(2):
+    log.record(None, 'SELECT ?', (n,), 0.5)
+  entry = json.loads(path.read_text(encoding='utf-8'))
+  assert entry['parameters'] == [1]
+  assert entry['plan'] is None
+
+
+@pytest.mark.parametrize('threshold', [60000])
+def test_fast_statements_are_not_logged(app, client, catalogue):
+  client.get('/venues').get_data()
+  assert fyyur.slow_queries.queue.empty()
+  assert not os.path.exists(app.config['SLOW_QUERY_LOG'])
+
+
+@pytest.mark.parametrize('threshold', [None])
+def test_no_threshold_turns_the_log_off(app, client, catalogue):
+  assert not fyyur.slow_queries
+  client.get('/venues').get_data()
+  assert not os.path.exists(app.config['SLOW_QUERY_LOG'])
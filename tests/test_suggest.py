@@ -0,0 +1,100 @@
+import threading
+import time
+
+from suggest import SuggestIndex, Suggester
+
+LABELS = [
+  ('venue', 1, 'Blue Note Jazz Club'),
+  ('venue', 2, 'The Blue Moon'),
+  ('artist', 3, 'Jazz Standard Orchestra'),
+  ('genre', 'Jazz', 'Jazz'),
+  ('city', 4, 'San Francisco'),
+]
+
+
+def labels(results):
+  return [result['label'] for result in results]
+
+
+def make_index(**kwargs):
+  index = SuggestIndex(**kwargs)
+  for kind, key, label in sorted(LABELS, key=lambda entry: len(entry[2])):
+    index.add(kind, key, label)
+  return index
+
+
+def test_every_token_must_match_a_prefix():
+  index = make_index()
+  assert labels(index.search('blue ja')) == ['Blue Note Jazz Club']
+  assert labels(index.search('JAZZ blu')) == ['Blue Note Jazz Club']
+  assert sorted(labels(index.search('blue'))) == ['Blue Note Jazz Club', 'The Blue Moon']
+  assert index.search('blue rock') == []
+  assert index.search('  ') == []
+
+
+def test_labels_starting_with_the_query_come_first():
+  index = make_index()
+  assert labels(index.search('jazz')) == ['Jazz', 'Jazz Standard Orchestra', 'Blue Note Jazz Club']
+  assert index.search('jazz', limit=1) == [{'type': 'genre', 'id': None, 'label': 'Jazz'}]
+
+
+def test_intersection_past_max_scan_and_long_tokens():
+  # few candidates scanned, so the rest are intersected as sets
+  index = SuggestIndex(max_prefix=4, max_scan=2)
+  for n in range(20):
+    index.add('artist', n, f'Band {n}')
+  index.add('artist', 100, 'Band Francisco')
+  index.add('artist', 101, 'Band Franciscan')
+  assert labels(index.search('band franciscan')) == ['Band Franciscan']
+  assert labels(index.search('fran band', limit=5)) == ['Band Francisco', 'Band Franciscan']
+
+
+def test_removed_and_renamed_entries():
+  index = make_index()
+  index.remove('venue', 1)
+  index.add('venue', 2, 'The Red Moon')
+  assert labels(index.search('blue')) == []
+  assert labels(index.search('moon')) == ['The Red Moon']
+  assert index.dead == 2
+
+  compacted = index.compacted()
+  assert compacted.dead == 0 and len(compacted) == len(index) == 4
+  assert labels(compacted.search('moon')) == ['The Red Moon']
+
+
+def test_updates_during_a_rebuild_are_replayed():
+  loading, release = threading.Event(), threading.Event()
+
+  def loader():
+    loading.set()
+    release.wait(5)
+    return LABELS
+
+  suggester = Suggester(loader)
+  suggester.rebuild()
+  assert loading.wait(5)
+  suggester.add('artist', 9, 'Blue Train Quartet')
+  suggester.remove('venue', 2)
+  release.set()
+  deadline = time.monotonic() + 5
+  while suggester._pending is not None and time.monotonic() < deadline:
+    time.sleep(0.01)
+
+  assert sorted(labels(suggester.search('blue'))) == ['Blue Note Jazz Club', 'Blue Train Quartet']
+
+
+def test_a_failed_rebuild_keeps_the_index():
+  entries = [LABELS]
+
+  def loader():
+    if entries[0] is None:
+      raise RuntimeError('database is down')
+    return entries[0]
+
+  suggester = Suggester(loader)
+  suggester.rebuild(background=False)
+  entries[0] = None
+  suggester.rebuild(background=False)
+  assert labels(suggester.search('moon')) == ['The Blue Moon']
+  # tried again in a minute, not after max_age
+  assert suggester.built_at < time.monotonic() - suggester.max_age + 61
@@ -0,0 +1,33 @@
+import pytest
+
+import app as fyyur
+
+VENUE = {'name': 'New Venue', 'address': '3 Main St', 'phone': '555-0102', 'city': 'City 0', 'state': 'CA',
+         'genres': ['Jazz'], 'website': '', 'facebook_link': ''}
+
+
+@pytest.fixture
+def settings():
+  # every task runs inline, in the thread whose commit queued it
+  return {'TASK_WORKERS': 0}
+
+
+def test_inline_tasks_after_a_create(client, catalogue):
+  response = client.post('/venues/create', data=VENUE, follow_redirects=True)
+  assert b'Venue New Venue was successfully listed!' in response.data
+  assert fyyur.session.query(fyyur.Venue).filter(fyyur.Venue.name == 'New Venue').count() == 1
+  assert [entry for entry in fyyur.suggester.search('New Ven') if entry['label'] == 'New Venue']
+
+
+def test_inline_tasks_after_an_edit_and_a_delete(client, catalogue):
+  venue = catalogue['venues'][0]
+  client.get(f'/artists/{catalogue["artists"][0]}')
+  response = client.post(f'/venues/{venue}/edit', data=dict(VENUE, name='Renamed Venue'), follow_redirects=True)
+  assert b'Venue updated!' in response.data
+  # invalidate_related dropped the cached pages of the venue's artists
+  assert b'Renamed Venue' in client.get(f'/artists/{catalogue["artists"][0]}').data
+
+  response = client.post('/api/v1/delete', json={'venue_ids': [venue]})
+  assert response.status_code == 200
+  assert response.get_json()['deleted']['venues'] == 1
+  assert client.get(f'/venues/{venue}').status_code == 404
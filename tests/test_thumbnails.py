@@ -0,0 +1,122 @@
+import io
+import os
+import threading
+import time
+
+import pytest
+
+import app as fyyur
+
+Image = pytest.importorskip('PIL.Image')
+
+LINK = 'https://images.example.com/venues/hall.png'
+
+
+@pytest.fixture
+def settings(tmp_path):
+  # images come from a directory; a failed one is not retried by the executor
+  return {'IMAGE_ORIGIN_ROOT': str(tmp_path / 'origin'), 'TASK_MAX_ATTEMPTS': 1}
+
+
+@pytest.fixture
+def origin(app, tmp_path):
+  # origin(width, colour): writes the image behind LINK
+  def write(width, colour='red'):
+    path = tmp_path / 'origin' / 'images.example.com' / 'venues' / 'hall.png'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new('RGB', (width, width // 2), colour).save(path)
+    return path
+  return write
+
+
+@pytest.fixture
+def held(app, monkeypatch):
+  # holds make() until released, so a request can find no thumbnail yet
+  release, thumbnails = threading.Event(), fyyur.thumbnails._get_current_object()
+  make = thumbnails.make
+  monkeypatch.setattr(thumbnails, 'make', lambda url: release.wait(5) and make(url))
+  yield release
+  release.set()
+
+
+def url(width, link=LINK):
+  # as thumbnail_url() writes it, without a request
+  return f'/images/{width}/{fyyur.thumbnail_signer.dumps(link)}'
+
+
+def image(response):
+  with Image.open(io.BytesIO(response.data)) as thumbnail:
+    return thumbnail.format, thumbnail.size
+
+
+def test_cold_thumbnail_redirects_then_is_served(client, origin, held):
+  origin(800)
+  response = client.get(url(320))
+  assert response.status_code == 302
+  assert response.headers['Location'] == LINK
+  assert response.headers['Cache-Control'] == 'no-store'
+
+  held.set()
+  fyyur.tasks.wait(5)
+  response = client.get(url(320))
+  assert response.status_code == 200
+  assert image(response) == ('JPEG', (320, 160))
+  assert response.headers['Cache-Control'] == f"public, max-age={fyyur.thumbnails.max_age}"
+  assert client.get(url(320), headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+  assert fyyur.thumbnails.stats()['hits'] >= 1
+
+
+def test_thumbnails_are_not_upscaled(client, origin, held):
+  origin(400)
+  client.get(url(320))
+  held.set()
+  fyyur.tasks.wait(5)
+  assert image(client.get(url(320))) == ('JPEG', (320, 160))
+  assert image(client.get(url(640))) == ('JPEG', (400, 200))
+  assert image(client.get(url(1280))) == ('JPEG', (400, 200))
+
+
+def test_tampered_or_unknown_links_are_404(client):
+  payload, signature = url(320).rsplit('/', 1)[1].split('.')
+  other, _ = url(320, 'https://elsewhere.example.com/a.png').rsplit('/', 1)[1].split('.')
+  assert client.get(f'/images/320/{other}.{signature}').status_code == 404
+  assert client.get(f'/images/320/{payload}').status_code == 404
+  assert client.get(f'/images/321/{payload}.{signature}').status_code == 404
+
+
+def test_failed_image_is_retried_after_a_while(client, origin, monkeypatch):
+  thumbnails = fyyur.thumbnails._get_current_object()
+  now = [1000.0]
+  monkeypatch.setattr(thumbnails, 'timer', lambda: now[0])
+
+  # no image at the origin yet
+  assert client.get(url(320)).status_code == 302
+  fyyur.tasks.wait(5)
+  assert thumbnails.stats()['failures'] == 1
+
+  origin(800)
+  assert client.get(url(320)).status_code == 302
+  fyyur.tasks.wait(5)
+  assert thumbnails.stats()['failures'] == 1
+  assert thumbnails.find(LINK, 320) is None
+
+  now[0] += thumbnails.retry_after + 1
+  client.get(url(320))
+  fyyur.tasks.wait(5)
+  assert image(client.get(url(320))) == ('JPEG', (320, 160))
+
+
+def test_stale_thumbnail_is_made_again(client, origin):
+  origin(800, 'red')
+  client.get(url(320))
+  fyyur.tasks.wait(5)
+  red = client.get(url(320)).data
+
+  origin(800, 'blue')
+  path = fyyur.thumbnails.path(LINK, 320)
+  old = time.time() - fyyur.thumbnails.refresh_after - 60
+  os.utime(path, (old, old))
+  # the old one is served while the new one is made
+  assert client.get(url(320)).data == red
+  fyyur.tasks.wait(5)
+  assert client.get(url(320)).data != red
@@ -0,0 +1,160 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+from flask import send_file
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+
+class Thumbnails(object):
+    """Resized JPEG copies of listing images, cached on disk.
+
+    ``make(url)`` fetches an image and writes a copy at each of ``widths``
+    (never wider than the original) to ``directory``, named after a hash of
+    the URL and the width, so the link on a page is all it takes to find
+    one. The image behind a URL can change, so ``send()`` lets browsers
+    keep a thumbnail for ``max_age`` seconds and then revalidate it, and
+    ``stale()`` says when one is over ``refresh_after`` seconds old and
+    should be made again. ``find()`` says whether a thumbnail is there yet,
+    and ``claim()`` whether this process should now queue ``make()``: not
+    while one is under way, nor for ``retry_after`` seconds after a failure.
+
+    Images come from the network, ``max_bytes`` at most and ``timeout``
+    seconds per read, unless ``origin_root`` names a local directory to
+    stand in for every origin: ``https://host/a/b.jpg`` is then read from
+    ``<origin_root>/host/a/b.jpg``. Without Pillow nothing can be made and
+    ``available`` is False.
+    """
+
+    def __init__(self, directory, widths, origin_root=None, quality=82, max_age=3600, refresh_after=24 * 3600,
+                 max_bytes=10 * 1024 * 1024, timeout=5, retry_after=300, timer=time.monotonic):
+        self.directory = directory
+        self.widths = tuple(sorted(widths))
+        self.origin_root = origin_root
+        self.quality = quality
+        self.max_age = max_age
+        self.refresh_after = refresh_after
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self._pending = set()
+        self._failed = {}
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def path(self, url, width):
+        digest = hashlib.sha256(('%d %s' % (width, url)).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + '.jpg')
+
+    def find(self, url, width):
+        path = self.path(url, width)
+        if os.path.isfile(path):
+            self.hits += 1
+            return path
+        self.misses += 1
+        return None
+
+    def stale(self, path):
+        # by the file's age, which make() resets
+        try:
+            return time.time() - os.path.getmtime(path) > self.refresh_after
+        except OSError:
+            return False
+
+    def claim(self, url):
+        with self._lock:
+            if url in self._pending:
+                return False
+            failed = self._failed.get(url)
+            if failed is not None and self.timer() - failed < self.retry_after:
+                return False
+            self._pending.add(url)
+            return True
+
+    def fetch(self, url):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            raise ValueError('not an http(s) URL: %r' % url)
+
+        if self.origin_root is not None:
+            root = os.path.abspath(self.origin_root)
+            path = os.path.normpath(os.path.join(root, parts.netloc, urllib.parse.unquote(parts.path).lstrip('/')))
+            if not path.startswith(root + os.sep):
+                raise ValueError('%r is outside the origin directory' % url)
+            with open(path, 'rb') as f:
+                content = f.read(self.max_bytes + 1)
+        else:
+            with urllib.request.urlopen(url, timeout=self.timeout) as response:
+                content = response.read(self.max_bytes + 1)
+
+        if len(content) > self.max_bytes:
+            raise ValueError('%s is over %d bytes' % (url, self.max_bytes))
+        return content
+
+    def make(self, url):
+        try:
+            with Image.open(io.BytesIO(self.fetch(url))) as source:
+                # JPEGs decode at a fraction of their size when that is enough
+                source.draft('RGB', (self.widths[-1], self.widths[-1] * source.height // source.width))
+                image = ImageOps.exif_transpose(source)
+                if image.mode != 'RGB':
+                    background = Image.new('RGB', image.size, 'white')
+                    background.paste(image, mask=image.convert('RGBA'))
+                    image = background
+
+                # largest first, each resized from the one before
+                for width in reversed(self.widths):
+                    if image.width > width:
+                        image = image.resize((width, max(1, round(image.height * width / image.width))),
+                                             Image.LANCZOS)
+                    output = io.BytesIO()
+                    image.save(output, 'JPEG', quality=self.quality, optimize=True, progressive=True)
+                    self._write(self.path(url, width), output.getvalue())
+        except Exception:
+            with self._lock:
+                self.failures += 1
+                now = self.timer()
+                self._failed = {failed_url: failed for failed_url, failed in self._failed.items()
+                                if now - failed < self.retry_after}
+                self._failed[url] = now
+            raise
+        else:
+            with self._lock:
+                self._failed.pop(url, None)
+        finally:
+            with self._lock:
+                self._pending.discard(url)
+
+    def _write(self, path, content):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+
+    def send(self, path):
+        response = send_file(path, mimetype='image/jpeg', conditional=True)
+        # not immutable: the same link gets a new image when its source changes
+        response.headers['Cache-Control'] = 'public, max-age=%d' % self.max_age
+        return response
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'failures': self.failures}
@@ -0,0 +1,219 @@
+#----------------------------------------------------------------------------#
+# Artist pages; create_app() registers the blueprint.
+#----------------------------------------------------------------------------#
+
+import sys
+from datetime import datetime
+
+from flask import abort, Blueprint, flash, make_response, redirect, render_template, request, url_for
+
+from app import (Artist, Locations, after_commit, artist_show_section, artist_view, db, genre_facets,
+                 genre_filter, invalidate_entities, listing_genres, listing_suggestions, listing_validators,
+                 not_modified, resolve_location, search_by_name, session, set_genres, started_shows,
+                 upcoming_shows_count, with_validators)
+
+artist_views = Blueprint('artists', __name__)
+
+@artist_views.route('/artists')
+def artists():
+  # TODO: replace with real data returned from querying the database
+  error=False
+  genre = request.args.get('genre')
+  try:
+    now = datetime.now()
+    etag, last_modified = listing_validators(Artist, now, genre)
+    response = not_modified(etag, last_modified)
+    if response is not None:
+      return response
+
+    started = started_shows(Artist, now)
+    query = session.query(Artist.id, Artist.name, upcoming_shows_count(Artist, started)).\
+                    outerjoin(started, started.c.id == Artist.id)
+    if genre:
+      query = query.filter(genre_filter(Artist, genre))
+    artists = query.order_by(Artist.id).all()
+    data = [{"id":id, "name":name, "num_upcoming_shows": num_upcoming_shows} for id, name, num_upcoming_shows in artists]
+    facets = genre_facets(Artist)
+  except:
+    error=True
+  finally:
+    if error:
+      abort(500)
+  return with_validators(make_response(render_template('pages/artists.html', artists=data, facets=facets, genre=genre)),
+                         etag, last_modified)
+
+@artist_views.route('/artists/search', methods=['GET', 'POST'])
+def search_artists():
+  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
+  # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
+  # search for "band" should return "The Wild Sax Band".
+
+  search_term = request.values.get('search_term', '')
+  page = request.values.get('page', 1, type=int)
+  if page < 1:
+    abort(400)
+
+  response = search_by_name(Artist, search_term, page)
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
+
+@artist_views.route('/artists/<int:artist_id>')
+def show_artist(artist_id):
+  # shows the artist page with the given artist_id
+  error=False
+  artist_details=None
+
+  try:
+    artist_details = artist_view(artist_id)
+  except:
+    error=True
+  finally:
+    if error:
+      abort(500)
+  if artist_details is None:
+    abort(404)
+  etag, last_modified = artist_details["etag"], artist_details["updated_at"]
+  response = not_modified(etag, last_modified)
+  if response is None:
+    response = with_validators(make_response(render_template('pages/show_artist.html', artist=artist_details)), etag, last_modified)
+  return response
+
+@artist_views.route('/artists/<int:artist_id>/shows/<any(past, upcoming):when>')
+def artist_shows(artist_id, when):
+  # the next batch of show tiles for the "load more" button on an artist page
+  after = request.args.get('after')
+  shows, cursor, _ = artist_show_section(artist_id, datetime.now(), when == 'upcoming', after)
+  # no shows may mean no artist
+  if not shows and not session.query(db.exists().where(Artist.id == artist_id)).scalar():
+    abort(404)
+  more_url = cursor and url_for('artists.artist_shows', artist_id=artist_id, when=when, after=cursor)
+  return render_template('pages/show_tiles.html', shows=shows, more_url=more_url)
+
+#  Update
+#  ----------------------------------------------------------------
+@artist_views.route('/artists/<int:artist_id>/edit', methods=['GET'])
+def edit_artist(artist_id):
+  error=False
+  results=False
+
+  try:
+    results = session.query(Artist, Locations.city, Locations.state).filter(Artist.id == artist_id).join(Locations, Artist.location_id == Locations.id).first()
+
+    artist, city, state = results
+
+    from forms import ArtistForm
+    form = ArtistForm(
+      id=artist.id,
+      name=artist.name,
+      genres=listing_genres(Artist, [artist.id])[artist.id],
+      city=city,
+      state=state,
+      phone=artist.phone,
+      website=artist.website,
+      facebook_link=artist.facebook_link,
+      seeking_venue=artist.seeking_venue,
+      seeking_description=artist.seeking_description
+    )
+  except:
+    error=True
+
+  finally:
+    if error:
+      if results is None: abort(404)
+      else: abort(500)
+    return render_template('forms/edit_artist.html', form=form, artist=artist)
+
+  # TODO: populate form with fields from artist with ID <artist_id>
+  
+
+@artist_views.route('/artists/<int:artist_id>/edit', methods=['POST'])
+def edit_artist_submission(artist_id):
+  # TODO: take values from the form submitted, and update existing
+  # artist record with ID <artist_id> using the new attributes
+  error=False
+
+  try:
+    artist_data = dict(name=request.form['name'], 
+                  phone=request.form['phone'],
+                  website=request.form['website'],
+                  facebook_link=request.form['facebook_link'],
+                  seeking_venue=bool(request.form.get('seeking_venue')),
+                  seeking_description=request.form.get('seeking_description')
+    )
+    
+    city = request.form['city']
+    location = resolve_location(city, request.form['state'])
+    artist_data['location_id'] = location[0]
+
+    artist_updated_rows = Artist.query.filter_by(id = artist_id).update(artist_data)
+    if not artist_updated_rows:
+      raise LookupError(artist_id)
+    genres = request.form.getlist('genres')
+    set_genres(Artist, artist_id, genres)
+    after_commit('invalidate_related', 'artist', artist_id)
+    after_commit('add_suggestions', listing_suggestions('artist', artist_id, artist_data['name'], genres, city, location))
+    session.commit()
+    # the page redirected to has to show the edit
+    invalidate_entities(artist_ids=[artist_id])
+  except:
+    error=True
+    session.rollback()
+  finally:
+    session.close()
+    if error:
+      flash("Nothing changed.")
+    else:
+       flash('Profile updated!')
+    return redirect(url_for('artists.show_artist', artist_id=artist_id))
+
+
+#  Create Artist
+#  ----------------------------------------------------------------
+
+@artist_views.route('/artists/create', methods=['GET'])
+def create_artist_form():
+  from forms import ArtistForm
+  form = ArtistForm()
+  return render_template('forms/new_artist.html', form=form)
+
+@artist_views.route('/artists/create', methods=['POST'])
+def create_artist_submission():
+  # called upon submitting the new artist listing form
+  # TODO: insert form data as a new Venue record in the db, instead
+  # TODO: modify data to be the data object returned from db insertion
+
+  error=False
+  try:
+    artist = Artist(name=request.form['name'], 
+                  phone=request.form['phone'],
+                  website=request.form['website'],
+                  facebook_link=request.form['facebook_link'],
+                  seeking_venue=bool(request.form.get('seeking_venue')),
+                  seeking_description=request.form.get('seeking_description')
+    )
+    
+    city = request.form['city']
+    location = resolve_location(city, request.form['state'])
+    artist.location_id = location[0]
+
+    session.add(artist)
+    session.flush()
+    genres = request.form.getlist('genres')
+    set_genres(Artist, artist.id, genres, replace=False)
+    after_commit('add_suggestions', listing_suggestions('artist', artist.id, artist.name, genres, city, location))
+    session.commit()
+  except:
+    error=True
+    session.rollback()
+    print(sys.exc_info())
+  finally:
+    session.close()
+    if error == True:
+      flash('An error occurred. Artist ' + artist.name + ' could not be listed.')
+    else: 
+      flash('Artist ' + request.form['name'] + ' was successfully listed!')
+
+  # on successful db insert, flash success
+  # flash('Artist ' + request.form['name'] + ' was successfully listed!')
+  # TODO: on unsuccessful db insert, flash an error instead.
+  # e.g., flash('An error occurred. Artist ' + data.name + ' could not be listed.')
+  return render_template('pages/home.html')
@@ -0,0 +1,156 @@
+#----------------------------------------------------------------------------#
+# Show pages; create_app() registers the blueprint.
+#----------------------------------------------------------------------------#
+
+from flask import (abort, Blueprint, current_app, flash, render_template, request, Response,
+                   stream_with_context)
+
+from app import (Artist, KeysetPage, Shows, Venue, after_commit, book_shows, count_upcoming, db, decode_cursor,
+                 not_modified, parse_datetime, RESIDENCY_WEEKS, residency_times, session, shows_page_validators,
+                 stream_template, with_validators)
+
+show_views = Blueprint('shows', __name__)
+
+@show_views.route('/shows')
+def shows():
+  # displays list of shows at /shows, one keyset page at a time
+  size = min(request.args.get('limit', current_app.config['SHOWS_PAGE_SIZE'], type=int),
+             current_app.config['SHOWS_MAX_PAGE_SIZE'])
+  if size < 1:
+    abort(400)
+
+  query = session.query(Shows.start_time, Shows.artist_id, Shows.venue_id, Artist.name, Venue.name, Artist.image_link).\
+          join(Artist, Artist.id == Shows.artist_id).\
+          join(Venue, Venue.id == Shows.venue_id).\
+          order_by(Shows.start_time, Shows.artist_id, Shows.venue_id)
+
+  after = request.args.get('after')
+  cursor = after and decode_cursor(after, ids=2)
+  if cursor:
+    query = query.filter(db.tuple_(Shows.start_time, Shows.artist_id, Shows.venue_id) > cursor)
+
+  etag, last_modified = shows_page_validators(size, cursor)
+  response = not_modified(etag, last_modified)
+  if response is not None:
+    return response
+
+  page = KeysetPage(query, size, key=lambda row: row[:3])
+  data = ({
+      "venue_id": venue_id,
+      "venue_name": venue_name,
+      "artist_id": artist_id,
+      "artist_name": artist_name,
+      "artist_image_link": artist_image_link,
+      "start_time": start_time
+    }
+    for start_time, artist_id, venue_id, artist_name, venue_name, artist_image_link in page
+    )
+
+  response = Response(stream_with_context(stream_template('pages/shows.html', shows=data, page=page, limit=size)))
+  return with_validators(response, etag, last_modified)
+
+@show_views.route('/shows/create')
+def create_shows():
+  # renders form. do not touch.
+  from forms import ShowForm
+  form = ShowForm()
+  return render_template('forms/new_show.html', form=form)
+
+@show_views.route('/shows/create', methods=['POST'])
+def create_show_submission():
+  # called to create new shows in the db, upon submitting new show listing form
+  # TODO: insert form data as a new Show record in the db, instead
+
+  error=False
+  try:
+    start_time = parse_datetime(request.form['start_time'])
+
+    artist = Artist.query.filter_by(id = request.form['artist_id']).one()
+    venue = Venue.query.filter_by(id = request.form['venue_id']).one()
+    
+    show = Shows(start_time=start_time)
+
+    show.venue = venue
+    show.artist = artist
+
+    session.add(show)
+    count_upcoming([(venue.id, artist.id, start_time)])
+    after_commit('invalidate_entities', venue_ids=[venue.id], artist_ids=[artist.id])
+    session.commit()
+  except:
+    error=True
+    session.rollback()
+  finally:
+    session.close()
+    if error:
+      flash('An error occurred. Show could not be listed.')
+    else:
+      flash('Show was successfully listed!')
+
+
+  # on successful db insert, flash success
+  # TODO: on unsuccessful db insert, flash an error instead.
+  # e.g., flash('An error occurred. Show could not be listed.')
+  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
+  return render_template('pages/home.html')
+
+@show_views.route('/shows/residency')
+def create_residency_form():
+  from forms import ResidencyForm
+  form = ResidencyForm()
+  return render_template('forms/new_residency.html', form=form)
+
+@show_views.route('/shows/residency', methods=['POST'])
+def create_residency_submission():
+  # books a run of shows from one form post; dates already booked are
+  # listed on the result page instead of failing the whole run
+  from forms import ResidencyForm
+  max_shows = current_app.config['RESIDENCY_MAX_SHOWS']
+  try:
+    artist_id, venue_id = int(request.form['artist_id']), int(request.form['venue_id'])
+    first = parse_datetime(request.form['start_time'])
+    until = parse_datetime(request.form['until']).date()
+    weeks = int(request.form.get('every', 1))
+    if weeks not in RESIDENCY_WEEKS:
+      raise ValueError(weeks)
+    # one past the most allowed tells a residency that is too long
+    start_times = residency_times(first, until, weeks, limit=max_shows + 1)
+  except (KeyError, ValueError, OverflowError):
+    flash('An error occurred. Residency could not be booked: check the ids, dates and weeks between shows.')
+    return render_template('forms/new_residency.html', form=ResidencyForm()), 400
+
+  if not start_times or len(start_times) > max_shows:
+    flash(f"A residency runs from 1 to {max_shows} shows; this one has "
+          f"{len(start_times) if len(start_times) <= max_shows else 'more'}.")
+    return render_template('forms/new_residency.html', form=ResidencyForm()), 400
+
+  error=False
+  residency=None
+  try:
+    booking = book_shows(artist_id, venue_id, start_times)
+    if booking is not None:
+      artist_name, venue_name, booked, collisions = booking
+      if booked:
+        after_commit('invalidate_entities', venue_ids=[venue_id], artist_ids=[artist_id])
+      session.commit()
+      residency = {
+        "artist_id": artist_id,
+        "artist_name": artist_name,
+        "venue_id": venue_id,
+        "venue_name": venue_name,
+        "booked": booked,
+        "collisions": collisions,
+      }
+  except:
+    error=True
+    session.rollback()
+  finally:
+    session.close()
+
+  if error:
+    flash('An error occurred. Residency could not be booked.')
+    return render_template('pages/home.html')
+  if residency is None:
+    flash(f'There is no artist {artist_id} or no venue {venue_id}.')
+    return render_template('forms/new_residency.html', form=ResidencyForm()), 404
+  return render_template('pages/residency.html', residency=residency)
@@ -0,0 +1,257 @@
+#----------------------------------------------------------------------------#
+# Venue pages; create_app() registers the blueprint.
+#----------------------------------------------------------------------------#
+
+from datetime import datetime
+from itertools import groupby
+
+from flask import abort, Blueprint, flash, jsonify, make_response, redirect, render_template, request, url_for
+
+from app import (Locations, Venue, after_commit, db, delete_records, genre_facets, genre_filter,
+                 invalidate_entities, listing_genres, listing_suggestions, listing_validators, not_modified,
+                 resolve_location, search_by_name, session, set_genres, started_shows, upcoming_shows_count,
+                 venue_show_section, venue_view, with_validators)
+
+venue_views = Blueprint('venues', __name__)
+
+@venue_views.route('/venues')
+def venues():
+  error=False
+
+  genre = request.args.get('genre')
+  try:
+    now = datetime.now()
+    etag, last_modified = listing_validators(Venue, now, genre)
+    response = not_modified(etag, last_modified)
+    if response is not None:
+      return response
+
+    started = started_shows(Venue, now)
+    query = session.query(Locations.id, Locations.city, Locations.state,
+                          Venue.id, Venue.name, upcoming_shows_count(Venue, started)).\
+                    join(Venue, Venue.location_id == Locations.id).\
+                    outerjoin(started, started.c.id == Venue.id)
+    if genre:
+      query = query.filter(genre_filter(Venue, genre))
+    rows = query.order_by(Locations.id, Venue.id).all()
+    facets = genre_facets(Venue)
+
+    data = []
+    for (location_id, city, state), location_rows in groupby(rows, key=lambda row: row[:3]):
+      data.append({
+        "city": city,
+        "state": state,
+        "venues": [{
+          "id": venue_id,
+          "name": name,
+          "num_upcoming_shows": num_upcoming_shows
+          }
+        for _, _, _, venue_id, name, num_upcoming_shows in location_rows]
+      })
+  except:
+    error=True
+  finally:
+    if error:
+      abort(500)
+  return with_validators(make_response(render_template('pages/venues.html', areas=data, facets=facets, genre=genre)),
+                         etag, last_modified)
+
+@venue_views.route('/venues/search', methods=['GET', 'POST'])
+def search_venues():
+  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
+  # seach for Hop should return "The Musical Hop".
+  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
+
+  search_term = request.values.get('search_term', '')
+  page = request.values.get('page', 1, type=int)
+  if page < 1:
+    abort(400)
+
+  response = search_by_name(Venue, search_term, page)
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
+
+@venue_views.route('/venues/<int:venue_id>')
+def show_venue(venue_id):
+  # shows the venue page with the given venue_id
+  error=False
+  venue_details=None
+
+  try:
+    venue_details = venue_view(venue_id)
+  except:
+    error=True
+  finally:
+    if error:
+      abort(500)
+  if venue_details is None:
+    abort(404)
+  etag, last_modified = venue_details["etag"], venue_details["updated_at"]
+  response = not_modified(etag, last_modified)
+  if response is None:
+    response = with_validators(make_response(render_template('pages/show_venue.html', venue=venue_details)), etag, last_modified)
+  return response
+
+@venue_views.route('/venues/<int:venue_id>/shows/<any(past, upcoming):when>')
+def venue_shows(venue_id, when):
+  # the next batch of show tiles for the "load more" button on a venue page
+  after = request.args.get('after')
+  shows, cursor, _ = venue_show_section(venue_id, datetime.now(), when == 'upcoming', after)
+  # no shows may mean no venue
+  if not shows and not session.query(db.exists().where(Venue.id == venue_id)).scalar():
+    abort(404)
+  more_url = cursor and url_for('venues.venue_shows', venue_id=venue_id, when=when, after=cursor)
+  return render_template('pages/show_tiles.html', shows=shows, more_url=more_url)
+
+#  Create Venue
+#  ----------------------------------------------------------------
+
+@venue_views.route('/venues/create', methods=['GET'])
+def create_venue_form():
+  from forms import VenueForm
+  form = VenueForm()
+  return render_template('forms/new_venue.html', form=form)
+
+@venue_views.route('/venues/create', methods=['POST'])
+def create_venue_submission():
+  # TODO: insert form data as a new Venue record in the db, instead
+  # TODO: modify data to be the data object returned from db insertion
+
+  error=False
+  try:
+    venue = Venue(name=request.form['name'], 
+                address=request.form['address'],
+                phone=request.form['phone'],
+                website=request.form['website'],
+                facebook_link=request.form['facebook_link'],
+                seeking_talent=bool(request.form.get('seeking_talent')),
+                seeking_description=request.form.get('seeking_description')
+                )
+
+    city = request.form['city']
+    location = resolve_location(city, request.form['state'])
+    venue.location_id = location[0]
+
+    session.add(venue)
+    session.flush()
+    genres = request.form.getlist('genres')
+    set_genres(Venue, venue.id, genres, replace=False)
+    after_commit('add_suggestions', listing_suggestions('venue', venue.id, venue.name, genres, city, location))
+    session.commit()
+  except:
+    error=True
+    session.rollback()
+  finally:
+    session.close()
+    if error:
+      flash('An error occurred. Venue ' + venue.name + ' could not be listed.')
+    else:
+      flash('Venue ' + request.form['name'] + ' was successfully listed!')
+
+  # on successful db insert, flash success
+  # flash('Venue ' + request.form['name'] + ' was successfully listed!')
+  # TODO: on unsuccessful db insert, flash an error instead.
+  # e.g., flash('An error occurred. Venue ' + data.name + ' could not be listed.')
+  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
+  return render_template('pages/home.html')
+
+@venue_views.route('/venues/<venue_id>', methods=['DELETE'])
+def delete_venue(venue_id):
+  # TODO: Complete this endpoint for taking a venue_id, and using
+  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
+  try:
+    venue_id = int(venue_id)
+    _, venue_ids, artist_ids = delete_records(venue_ids=[venue_id])
+    after_commit('remove_suggestions', [('venue', venue_id)])
+    session.commit()
+    # as edits do: the next page shown must not list the venue
+    invalidate_entities(venue_ids=sorted(venue_ids), artist_ids=sorted(artist_ids))
+  except:
+    session.rollback()
+  finally:
+    session.close()
+    flash('Venue deleted!')
+    return jsonify({'success': True})
+
+  # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
+  # clicking that button delete it from the db then redirect the user to the homepage
+
+#  Update
+#  ----------------------------------------------------------------
+@venue_views.route('/venues/<int:venue_id>/edit', methods=['GET'])
+def edit_venue(venue_id):
+  error=False
+  results=False
+
+  try:
+    results = session.query(Venue, Locations.city, Locations.state).filter(Venue.id == venue_id).\
+              join(Locations, Venue.location_id == Locations.id).first()
+
+    venue, city, state = results
+
+    from forms import VenueForm
+    form = VenueForm(
+      id=venue.id,
+      name=venue.name,
+      genres=listing_genres(Venue, [venue.id])[venue.id],
+      address=venue.address,
+      city=city,
+      state=state,
+      phone=venue.phone,
+      website=venue.website,
+      facebook_link=venue.facebook_link,
+      seeking_talent=venue.seeking_talent,
+      seeking_description=venue.seeking_description,
+      image_link=venue.image_link
+    )
+  except:
+    error=True
+
+  finally:
+    if error:
+      if results is None: abort(404)
+      else: abort(500)
+    return render_template('forms/edit_venue.html', form=form, venue=venue)
+
+  # TODO: populate form with values from venue with ID <venue_id>
+
+@venue_views.route('/venues/<int:venue_id>/edit', methods=['POST'])
+def edit_venue_submission(venue_id):
+  # TODO: take values from the form submitted, and update existing
+  # venue record with ID <venue_id> using the new attributes
+  error=False
+
+  try:
+    venue_data = dict(name=request.form['name'], 
+                  address=request.form['address'],
+                  phone=request.form['phone'],
+                  website=request.form['website'],
+                  facebook_link=request.form['facebook_link'],
+                  seeking_talent=bool(request.form.get('seeking_talent')),
+                  seeking_description=request.form.get('seeking_description')
+    )
+
+    city = request.form['city']
+    location = resolve_location(city, request.form['state'])
+    venue_data['location_id'] = location[0]
+
+    venue_updated_rows = Venue.query.filter_by(id = venue_id).update(venue_data)
+    if not venue_updated_rows:
+      raise LookupError(venue_id)
+    genres = request.form.getlist('genres')
+    set_genres(Venue, venue_id, genres)
+    after_commit('invalidate_related', 'venue', venue_id)
+    after_commit('add_suggestions', listing_suggestions('venue', venue_id, venue_data['name'], genres, city, location))
+    session.commit()
+    # the page redirected to has to show the edit
+    invalidate_entities(venue_ids=[venue_id])
+
+  except:
+    error=True
+    session.rollback()
+  finally:
+    session.close()
+    if error:
+      flash('Nothing changed.')
+    else:
+      flash('Venue updated!')
+    return redirect(url_for('venues.show_venue', venue_id=venue_id))
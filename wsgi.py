@@ -0,0 +1,11 @@
+# Entry point for a production WSGI server:
+#
+#   gunicorn wsgi:app
+#
+# gunicorn.conf.py, read from the same directory, sets the workers up.
+# FYYUR_CONFIG names another settings module to build the app from.
+import os
+
+from app import create_app
+
+app = create_app(os.environ.get('FYYUR_CONFIG', 'production'))